@@ -1,6 +1,12 @@
 # app.py
+import os
 from dash import Dash, Output, Input
 import dash_bootstrap_components as dbc
+from core import config
+from core.refresher import start_price_refresher
+from data_handler.db_manager import get_held_stock_codes, get_stock_codes, init_db
+from data_handler.snapshot import load_current_snapshot, prime_split_cache
+from callbacks.dashboard_callbacks import seed_from_snapshot
 from layout.main_layout import get_main_layout
 from layout.dashboard import get_layout as dashboard_layout
 from layout.data_record import get_layout as data_record_layout
@@ -32,5 +38,16 @@ def display_page(pathname):
         return "404 Page Not Found"
 
 if __name__ == '__main__':
-    app.run(debug=True)
+    debug = True
+    # creates missing tables and applies pending schema migrations
+    init_db()
+    # cold start: reuse derived frames from a snapshot taken at the current data version
+    snapshot = load_current_snapshot()
+    if snapshot is not None:
+        prime_split_cache(snapshot)
+        seed_from_snapshot(snapshot)
+    # with the reloader on, only the child process (WERKZEUG_RUN_MAIN) serves requests
+    if config.PRICE_REFRESHER_ENABLED and (not debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true"):
+        start_price_refresher(get_held_stock_codes, warmup_codes_fn=get_stock_codes)
+    app.run(debug=debug)
     # app.run(host="0.0.0.0", port=8050)
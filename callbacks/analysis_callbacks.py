@@ -1,6 +1,6 @@
 from dash import Input, Output, State, callback, html
 from dash.dash_table import DataTable
-from data_handler.db_manager import get_all_transactions
+from data_handler.db_manager import get_transactions
 from core.dates import slice_df_by_date_range
 from core.analysis import analyze_stock_performance
 from core.splits import record_stock_split_adjustments
@@ -14,10 +14,10 @@ from viz.analysis_figures import make_analysis_figures
     Input("url", "pathname"),
 )
 def update_stock_dropdown_options(_):
-    df = get_all_transactions()
+    df = get_transactions(columns=[Columns.DATE, Columns.STOCK_CODE, Columns.STOCK_NAME])
     # Get latest name for each stock_code
     latest_names = df.sort_values(Columns.DATE).groupby(
-        Columns.STOCK_CODE)[Columns.STOCK_NAME].last()
+        Columns.STOCK_CODE, observed=True)[Columns.STOCK_NAME].last()
     options = [
         {"label": f"{name} ({code})", "value": code}
         for code, name in latest_names.items()
@@ -39,7 +39,8 @@ def update_analysis(stock_code, expected_price, start_date, end_date):
     if not stock_code:
         return UI.ANALYSIS_SELECT_STOCK_MSG, {}, {}, None
 
-    df = get_all_transactions()
+    # split adjustment is per row, so the window can be applied in SQL
+    df = get_transactions(codes=[stock_code], start=start_date, end=end_date)
     stock_df = record_stock_split_adjustments(df, stock_code)
     
     stock_df = slice_df_by_date_range(
@@ -4,21 +4,119 @@ from __future__ import annotations
 import pandas as pd
 from dash import Input, Output, State, callback
 
-from data_handler.db_manager import get_all_transactions, get_cash_flows
-from core.prices import get_price_map, get_price_map_asof
-from core.ledger import build_holdings_snapshot, compute_realized_window
+from data_handler.db_manager import (
+    get_accounts,
+    get_cash_flow_totals,
+    get_daily_cash_flows,
+    get_data_version,
+    get_transactions,
+)
+from data_handler.materialize import get_current_portfolio_metrics
+from data_handler.positions import get_positions_asof
+from core.cache import VersionedCache
+from core.schema import coerce_transactions
+from core.prices import fill_missing_prices, get_price_map, get_price_map_asof
+from core.ledger import (
+    build_position_ledgers,
+    holdings_from_ledgers,
+    holdings_from_positions,
+    realized_window_from_ledgers,
+)
 from core.portfolio import (
+    append_as_of_point,
     build_portfolio_value_timeseries,
     build_stock_perf_timeseries,
     compute_account_growth,
     compute_irr,
     compute_twr,
 )
-from core.benchmarks import get_benchmark_series
+from core.benchmarks import build_benchmark_returns
+from core.refresher import get_refresher_status
+from core.splits import stocks_split_adjustments
 from viz.dashboard_figures import fig_allocation_pie, fig_top_pnl_bar, fig_asset_growth, fig_stock_perf_area
 from viz.dashboard_figures import fig_asset_growth
 from core.formatting import yen as _yen, pct as _pct
-from core.constants import Columns, PnLKind, PositionMode, TradeType
+from core.constants import Columns, PnLKind, PositionMode, TradeType, UI
+
+
+# DB-derived frames (price independent), valid until the data version changes;
+# callers must treat cached frames as read-only. Full transaction frames are
+# keyed by accounts only, so moving the end date never pins another copy.
+_DERIVED = VersionedCache(maxsize=64)
+
+
+def _upto(df: pd.DataFrame, end_date) -> pd.DataFrame:
+    end = pd.to_datetime(end_date, errors="coerce") if end_date else None
+    if end is None or pd.isna(end) or df.empty:
+        return df
+    return df[df[Columns.DATE] <= end.normalize()]
+
+
+def _transactions_upto(version, end_date, acct) -> pd.DataFrame:
+    """Cached transactions of `acct`, cut to trades on or before `end_date` (same as get_transactions(end=...))."""
+    return _upto(_DERIVED.get_or_compute(version, ("tx", acct), lambda: get_transactions(accounts=acct)), end_date)
+
+
+def _adjusted_upto(version, end_date, acct) -> pd.DataFrame:
+    """_transactions_upto after stocks_split_adjustments; the full adjusted frame is cached per accounts."""
+    adjusted = _DERIVED.get_or_compute(
+        version, ("tx_adjusted", acct), lambda: stocks_split_adjustments(_transactions_upto(version, None, acct))
+    )
+    return _upto(adjusted, end_date)
+
+
+def _ledgers(version, acct) -> pd.DataFrame:
+    """build_position_ledgers over every trade of `acct`; holdings and realized windows slice it by date."""
+    return _DERIVED.get_or_compute(
+        version, ("ledgers", acct),
+        lambda: build_position_ledgers(_adjusted_upto(version, None, acct), split_adjusted=True),
+    )
+
+
+def seed_from_snapshot(snapshot) -> None:
+    """Pre-fill the derived cache from a Parquet snapshot (see data_handler.snapshot) for the default view."""
+    version = snapshot["manifest"]["data_version"]
+    cf = snapshot["daily_cash_flows"]
+    totals = {str(t): float(v) for t, v in cf.groupby("type")["amount"].sum().items()}
+    seeds = {
+        ("tx", None): coerce_transactions(snapshot["transactions"]),
+        # split-adjusted trades and their ledgers: the first render neither
+        # re-applies splits nor replays a ledger
+        ("tx_adjusted", None): snapshot["transactions_adjusted"],
+        ("ledgers", None): snapshot["ledgers"],
+        ("daily_cash_flows", None): cf,
+        ("cf_totals", None): totals,
+        ("stock_perf", None, None, "realized"): snapshot["perf_realized"],
+        ("stock_perf", None, None, "total"): snapshot["perf_total"],
+    }
+    for key, value in seeds.items():
+        _DERIVED.get_or_compute(version, key, lambda value=value: value)
+
+
+@callback(
+    Output("dashboard-price-status", "children"),
+    Input("dashboard-price-status-interval", "n_intervals"),
+    Input("dashboard-refresh-btn", "n_clicks"),
+)
+def update_price_status(_n_intervals, _n_clicks):
+    status = get_refresher_status()
+    if status is None:
+        return UI.PRICES_ON_DEMAND
+    if status["last_success"] is None:
+        return UI.PRICES_PENDING if status["last_error"] is None else f"{UI.PRICES_PENDING} ({UI.PRICES_REFRESH_FAILED})"
+    ts = pd.Timestamp(status["last_success"], unit="s", tz="UTC").tz_convert("Asia/Tokyo")
+    text = f"{UI.PRICES_UPDATED} {ts:%Y-%m-%d %H:%M} JST"
+    if status["last_error_at"] and status["last_error_at"] > status["last_success"]:
+        text += f" ({UI.PRICES_REFRESH_FAILED})"
+    return text
+
+
+@callback(
+    Output("dashboard-account", "options"),
+    Input("dashboard-refresh-btn", "n_clicks"),
+)
+def update_account_options(_n_clicks):
+    return [{"label": a, "value": a} for a in get_accounts()]
 
 
 @callback(
@@ -57,6 +155,7 @@ from core.constants import Columns, PnLKind, PositionMode, TradeType
     Input("dashboard-benchmark", "value"),
     Input("dashboard-stock-perf-tab", "value"),
     Input("dashboard-pnl-kind", "value"),
+    Input("dashboard-account", "value"),
 )
 def update_dashboard(
     n_clicks,
@@ -72,21 +171,21 @@ def update_dashboard(
     benchmark_ticker,
     perf_tab,
     pnl_kind,
+    accounts=None,
 ):
-    cash_flows = get_cash_flows()
-    net_deposit_total = 0.0
-    tax_total = 0.0
-    dividend_total = 0.0
-    if cash_flows is not None and not cash_flows.empty:
-        cf = cash_flows.copy()
-        cf[Columns.DATE] = pd.to_datetime(cf[Columns.DATE], errors="coerce")
-        cf["amount"] = pd.to_numeric(cf["amount"], errors="coerce").fillna(0.0)
-        cf["type"] = cf["type"].astype(str)
-        net_deposit_total = cf[cf["type"].isin(["Deposit", "Withdrawal"])]["amount"].sum()
-        tax_total = cf[cf["type"] == "Tax"]["amount"].sum()
-        dividend_total = cf[cf["type"] == "Dividend"]["amount"].sum()
-    # 1) load transactions
-    tx = get_all_transactions()
+    # no selection means all accounts; the sorted tuple keys the derived cache
+    acct = tuple(sorted(accounts)) if accounts else None
+    # KPI totals and the per-day flows are aggregated in SQL
+    version = get_data_version()
+    cf_totals = _DERIVED.get_or_compute(version, ("cf_totals", acct), lambda: get_cash_flow_totals(accounts=acct))
+    net_deposit_total = cf_totals.get("Deposit", 0.0) + cf_totals.get("Withdrawal", 0.0)
+    tax_total = cf_totals.get("Tax", 0.0)
+    dividend_total = cf_totals.get("Dividend", 0.0)
+    cash_flows = _DERIVED.get_or_compute(
+        version, ("daily_cash_flows", acct), lambda: get_daily_cash_flows(accounts=acct)
+    )
+    # 1) load transactions up to the as-of date (full history before it for cost basis)
+    tx = _transactions_upto(version, end_date, acct)
     if tx is None or tx.empty:
         empty_fig = {}
         return (
@@ -119,19 +218,32 @@ def update_dashboard(
     if end_date:
         price_map = get_price_map_asof(codes, end_date)
     else:
-        price_map = get_price_map(codes)  # uses yfinance
-
-    # 3) build snapshot (date slicing here affects what trades are considered)
-    snap = build_holdings_snapshot(
-        transactions_df=tx,
-        price_map=price_map,
-        start_date=None,
-        end_date=None,
-        positions_mode=positions_mode or PositionMode.HOLDING,
-    )
+        price_map = get_price_map(codes)  # warm cache; kept fresh by the background refresher
+    # market data unavailable (e.g. circuit open): value positions at their last trade price
+    price_map = fill_missing_prices(price_map, tx, as_of_date=end_date)
+
+    # split-adjusted trades up to the as-of date, for the value series and TWR
+    tx_adjusted = _adjusted_upto(version, end_date, acct)
+
+    # 3) build snapshot: one as-of query on daily_positions when it is current,
+    # otherwise read it off the per-version ledgers (replayed once, or from a snapshot)
+    positions = get_positions_asof(end_date, accounts=acct)
+    if positions is not None:
+        snap = holdings_from_positions(positions, price_map, positions_mode=positions_mode or PositionMode.HOLDING)
+    else:
+        snap = holdings_from_ledgers(
+            _ledgers(version, acct),
+            price_map,
+            end_date=end_date,
+            positions_mode=positions_mode or PositionMode.HOLDING,
+        )
 
     # realized PnL within selected window (uses full history for cost basis)
-    window_df = compute_realized_window(tx, start_date=start_date, end_date=end_date)
+    window_df = _DERIVED.get_or_compute(
+        version,
+        ("realized_window", start_date, end_date, acct),
+        lambda: realized_window_from_ledgers(_ledgers(version, acct), start_date=start_date, end_date=end_date),
+    )
 
     if snap.empty:
         empty_fig = {}
@@ -184,67 +296,34 @@ def update_dashboard(
     # 5) Figures
     fig_alloc = fig_allocation_pie(snap, top_n=int(alloc_topn or 4))
     fig_top = fig_top_pnl_bar(snap, kind=pnl_kind or PnLKind.UNREALIZED, top_n=int(topn or 10))
-    asset_df = build_portfolio_value_timeseries(
-        tx,
-        price_map=price_map,
-        as_of_date=end_date,
-        cash_flows_df=cash_flows,
-    )
+    # materialized daily rows (refreshed after every import) cover all accounts only
+    asset_df = get_current_portfolio_metrics(end_date=end_date) if acct is None else None
+    if asset_df is not None and price_map:
+        asset_df = append_as_of_point(asset_df, market_value, as_of_date=end_date)
+    elif asset_df is None:
+        asset_df = build_portfolio_value_timeseries(
+            tx_adjusted,
+            price_map=price_map,
+            as_of_date=end_date,
+            cash_flows_df=cash_flows,
+            split_adjusted=True,
+        )
     bench_df = None
-    if asset_view == "return" and benchmark_ticker:
+    bench_tickers = [benchmark_ticker] if isinstance(benchmark_ticker, str) else list(benchmark_ticker or [])
+    bench_tickers = [t for t in bench_tickers if t]
+    if asset_view == "return" and bench_tickers:
         bench_start = start_date
         bench_end = end_date
         if (not bench_start or not bench_end) and asset_df is not None and not asset_df.empty:
             bench_start = pd.to_datetime(asset_df[Columns.DATE]).min().strftime("%Y-%m-%d")
             bench_end = pd.to_datetime(asset_df[Columns.DATE]).max().strftime("%Y-%m-%d")
-        print(f"Fetching benchmark {benchmark_ticker} from {bench_start} to {bench_end}")
-        s = get_benchmark_series(benchmark_ticker, bench_start, bench_end)
-        print(f"Benchmark series data points: {len(s)}")
-        if not s.empty:
-            s = s.sort_index()
-
-            cf = cash_flows.copy() if cash_flows is not None else pd.DataFrame()
-            if not cf.empty:
-                cf = cf[cf["type"].isin(["Deposit", "Withdrawal"])].copy()
-                cf[Columns.DATE] = pd.to_datetime(cf[Columns.DATE], errors="coerce")
-                if end_date:
-                    as_of_dt = pd.to_datetime(end_date, errors="coerce")
-                    if not pd.isna(as_of_dt):
-                        cf = cf[cf[Columns.DATE] <= as_of_dt]
-                cf["amount"] = pd.to_numeric(cf["amount"], errors="coerce").fillna(0.0)
-                cash_flow_by_date = cf.groupby(Columns.DATE)["amount"].sum()
-                price_series = s.reindex(s.index.union(cash_flow_by_date.index)).sort_index().ffill().bfill()
-
-                shares = 0.0
-                net_dep = 0.0
-                rows = []
-                for dt, price in price_series.items():
-                    flow = float(cash_flow_by_date.get(dt, 0.0))
-                    if price and price != 0:
-                        shares += flow / float(price)
-                    net_dep += flow
-                    value = shares * float(price)
-                    ret = (value - net_dep) / net_dep * 100.0 if net_dep != 0 else 0.0
-                    rows.append((dt, ret))
-
-                bench_df = pd.DataFrame(
-                    {
-                        Columns.DATE: [r[0] for r in rows],
-                        "benchmark_return_pct": [r[1] for r in rows],
-                        "label": [f"{benchmark_ticker} (cash-flow matched)"] * len(rows),
-                    }
-                )
-            else:
-                first = float(s.iloc[0]) if len(s) else None
-                if first and first != 0:
-                    ret = (s / first - 1.0) * 100.0
-                    bench_df = pd.DataFrame(
-                        {
-                            Columns.DATE: ret.index,
-                            "benchmark_return_pct": ret.values,
-                            "label": [benchmark_ticker] * len(ret),
-                        }
-                    )
+        bench_df = build_benchmark_returns(
+            bench_tickers,
+            bench_start,
+            bench_end,
+            cash_flows_df=cash_flows,
+            as_of_date=end_date,
+        )
     # account growth + capital return
     net_value = asset_df[Columns.NET_VALUE].iloc[-1] if Columns.NET_VALUE in asset_df.columns and not asset_df.empty else 0.0
     account_growth = compute_account_growth(float(net_value), float(net_deposit_total or 0))
@@ -253,7 +332,15 @@ def update_dashboard(
     kpi_cash = _yen(net_value - market_value)
 
     irr = compute_irr(tx, ending_value=float(net_value), net_deposit=float(net_deposit_total or 0), cash_flows_df=cash_flows, as_of_date=end_date)
-    twr = compute_twr(tx, price_map=price_map, net_deposit=float(net_deposit_total or 0), cash_flows_df=cash_flows, as_of_date=end_date)
+    twr = compute_twr(
+        tx_adjusted,
+        price_map=price_map,
+        net_deposit=float(net_deposit_total or 0),
+        cash_flows_df=cash_flows,
+        as_of_date=end_date,
+        asset_df=asset_df,
+        split_adjusted=True,
+    )
     kpi_irr = _pct(irr)
     # annualize TWR based on span of transactions
     ann_twr = 0.0
@@ -271,7 +358,11 @@ def update_dashboard(
         benchmark_df=bench_df,
         twr_pct=float(twr),
     )
-    perf_df = build_stock_perf_timeseries(tx, kind=perf_tab or "realized")
+    perf_df = _DERIVED.get_or_compute(
+        version,
+        ("stock_perf", end_date, acct, perf_tab),
+        lambda: build_stock_perf_timeseries(tx_adjusted, kind=perf_tab or "realized", split_adjusted=True),
+    )
     fig_perf = fig_stock_perf_area(perf_df)
 
     # 6) Table data
@@ -1,8 +1,9 @@
 from dash import Input, Output, State, callback, html, dcc
 import base64
 import io
-from data_handler.csv_parser import clean_sbi_transaction_csv, clean_sbi_cash_flow_csv  # your parser
-from data_handler.db_manager import insert_transactions, insert_cash_flows
+from data_handler.csv_parser import clean_sbi_cash_flow_csv  # your parser
+from data_handler.db_manager import insert_cash_flows
+from data_handler.importer import import_sbi_transaction_csv, refresh_after_import
 from core.constants import UI, TabValues
 
 @callback(
@@ -18,6 +19,15 @@ def render_upload_section(tab):
     }
     return html.Div([
         html.H4(label_map[tab]),
+        html.Div([
+            html.Label(UI.UPLOAD_ACCOUNT, style={"marginRight": "8px"}),
+            dcc.Input(
+                id=f"upload-account-{tab}",
+                type="text",
+                placeholder=UI.UPLOAD_ACCOUNT_PLACEHOLDER,
+                debounce=True,
+            ),
+        ], style={"marginBottom": "8px"}),
         dcc.Upload(
             id=f"upload-{tab}",
             children=html.Div([UI.UPLOAD_DROP, html.A(UI.UPLOAD_SELECT)]),
@@ -34,17 +44,22 @@ def render_upload_section(tab):
     Output("upload-status-transactions", "children"),
     Input("upload-transactions", "contents"),
     State("upload-transactions", "filename"),
+    State("upload-account-transactions", "value"),
 )
-def handle_upload_transactions(contents, filename):
+def handle_upload_transactions(contents, filename, account_id=None):
     if contents is None:
         return ""
     try:
         content_type, content_string = contents.split(',')
         decoded = base64.b64decode(content_string)
-        file_buffer = io.StringIO(decoded.decode('shift_jis'))  # or utf-8 if needed
-        df = clean_sbi_transaction_csv(file_buffer)  # Clean and return DataFrame
-        insert_transactions(df)          # Insert DataFrame into DB
-        return f"{UI.UPLOAD_SUCCESS_PREFIX} {len(df)} transactions from: {filename}"
+        # streamed in chunks (decoded as Shift-JIS); refreshes positions/metrics when rows were added
+        result = import_sbi_transaction_csv(
+            io.BytesIO(decoded), account_id=(account_id or "").strip() or None
+        )
+        return (
+            f"{UI.UPLOAD_SUCCESS_PREFIX} {result.inserted} transactions from: {filename} "
+            f"({result.skipped} {UI.UPLOAD_DUPLICATES_SKIPPED})"
+        )
     except Exception as e:
         return f"{UI.UPLOAD_ERROR_PREFIX} {filename}: {e}"
 
@@ -53,8 +68,9 @@ def handle_upload_transactions(contents, filename):
     Output("upload-status-cash_flows", "children"),
     Input("upload-cash_flows", "contents"),
     State("upload-cash_flows", "filename"),
+    State("upload-account-cash_flows", "value"),
 )
-def handle_upload_cash_flows(contents, filename):
+def handle_upload_cash_flows(contents, filename, account_id=None):
     if contents is None:
         return ""
     try:
@@ -62,7 +78,12 @@ def handle_upload_cash_flows(contents, filename):
         decoded = base64.b64decode(content_string)
         file_buffer = io.StringIO(decoded.decode('utf-8-sig'))
         df = clean_sbi_cash_flow_csv(file_buffer)
-        insert_cash_flows(df)
-        return f"{UI.UPLOAD_SUCCESS_PREFIX} {len(df)} cash flows from: {filename}"
+        result = insert_cash_flows(df, account_id=(account_id or "").strip() or None)
+        if result.inserted:
+            refresh_after_import(transactions=False)
+        return (
+            f"{UI.UPLOAD_SUCCESS_PREFIX} {result.inserted} cash flows from: {filename} "
+            f"({result.skipped} {UI.UPLOAD_DUPLICATES_SKIPPED})"
+        )
     except Exception as e:
         return f"{UI.UPLOAD_ERROR_PREFIX} {filename}: {e}"
@@ -1,42 +1,199 @@
 # cli.py
 import argparse
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Optional
+
+import pandas as pd
+
+from core import config
+from core.constants import Columns
+from core.schema import coerce_transactions
 from data_handler.csv_parser import clean_sbi_transaction_csv, clean_sbi_cash_flow_csv
-from data_handler.db_manager import insert_new_rows, insert_cash_flows, init_db, clear_db, clear_cash_flows, fetch_summary
+from data_handler.connection import close_connections
+from data_handler.db_manager import (
+    insert_cash_flows,
+    insert_transaction_batches,
+    init_db,
+    clear_db,
+    clear_cash_flows,
+    fetch_summary,
+)
 
 UPLOAD_FOLDER = "uploads"
+# the transactions UNIQUE key (see data_handler/migrations.py), minus account_id
+_TX_KEY = [
+    Columns.ACCOUNT, Columns.DATE, Columns.STOCK_CODE, Columns.TRADE_TYPE,
+    Columns.QUANTITY, Columns.PRICE_PER_SHARE, Columns.TOTAL_AMOUNT,
+]
+
+
+@dataclass
+class FileImportReport:
+    file: str
+    parsed: int = 0
+    inserted: int = 0
+    skipped: int = 0  # already in the DB or in an earlier file of the batch
+    seconds: float = 0.0
+    error: Optional[str] = None
+
+
+def _parse_transactions_file(path):
+    # runs in a worker process: Shift-JIS decoding and date parsing are CPU bound
+    start = time.perf_counter()
+    try:
+        df = clean_sbi_transaction_csv(path, chunksize=config.TRANSACTION_CSV_CHUNK_ROWS)
+        return df, time.perf_counter() - start, None
+    except Exception as e:
+        return None, time.perf_counter() - start, str(e)
+
+
+def _stream_transactions_file(report, path, account_id, db_path):
+    # large files: bounded memory in this process; refreshed once with the rest of the batch
+    from data_handler.importer import import_sbi_transaction_csv
+    start = time.perf_counter()
+    try:
+        result = import_sbi_transaction_csv(
+            path, db_path=db_path, account_id=account_id,
+            chunksize=config.TRANSACTION_CSV_CHUNK_ROWS, refresh=False,
+        )
+        report.parsed = result.inserted + result.skipped
+        report.inserted = result.inserted
+        report.skipped = result.skipped
+    except Exception as e:
+        report.error = str(e)
+    report.seconds = time.perf_counter() - start
+
+
+def _dedup_keys(df):
+    """_TX_KEY per row, normalized like the DB stores it so 100 and 100.0 compare equal."""
+    key = coerce_transactions(df[_TX_KEY].copy()).astype(object)
+    key[Columns.ACCOUNT] = key[Columns.ACCOUNT].fillna("").astype(str).str.strip()
+    return pd.MultiIndex.from_frame(key.astype(str))
+
 
-def import_csvs():
-    csv_files = [f for f in os.listdir(UPLOAD_FOLDER) if f.endswith('.csv')]
+def import_csvs(folder=UPLOAD_FOLDER, workers=None, account_id=None, db_path="data/portfolio.db"):
+    """
+    Parse every CSV in `folder` in a process pool, drop rows repeated across
+    files, and insert everything in one transaction. Files larger than
+    config.TRANSACTION_CSV_STREAM_BYTES are streamed into the DB chunk by chunk
+    afterwards instead (duplicates then only caught by the DB). Returns per-file reports.
+    """
+    csv_files = sorted(f for f in os.listdir(folder) if f.endswith('.csv')) if os.path.isdir(folder) else []
     if not csv_files:
-        print("No CSV files found in 'uploads/' folder.")
-        return
-    for file in csv_files:
-        path = os.path.join(UPLOAD_FOLDER, file)
-        try:
-            print(f"📂 Importing {file}...")
-            df = clean_sbi_transaction_csv(path)
-            insert_new_rows(df)
-            print(f"✅ Done: {file}")
-        except Exception as e:
-            print(f"❌ Failed to import {file}: {e}")
-
-def import_cash_flows(file_path):
+        print(f"No CSV files found in '{folder}/' folder.")
+        return []
+    paths = [os.path.join(folder, f) for f in csv_files]
+    streamed = {p for p in paths if os.path.getsize(p) > config.TRANSACTION_CSV_STREAM_BYTES}
+    pooled = [p for p in paths if p not in streamed]
+
+    started = time.perf_counter()
+    workers = max(1, min(len(pooled), workers or os.cpu_count() or 1))
+    print(f"📂 Parsing {len(pooled)} files with {workers} worker(s), streaming {len(streamed)}...")
+    if workers == 1:
+        parsed = [_parse_transactions_file(p) for p in pooled]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parsed = list(pool.map(_parse_transactions_file, pooled))
+    parsed = dict(zip(pooled, parsed))
+
+    reports = []
+    frames = []
+    seen = None
+    for file, path in zip(csv_files, paths):
+        if path in streamed:
+            reports.append(FileImportReport(file=file))
+            frames.append(None)
+            continue
+        df, seconds, error = parsed[path]
+        report = FileImportReport(file=file, seconds=seconds, error=error)
+        reports.append(report)
+        if df is None:
+            frames.append(None)
+            continue
+        report.parsed = len(df)
+        # overlapping exports repeat trades; keep each row from the first file that has it
+        keys = _dedup_keys(df)
+        fresh = ~keys.duplicated()
+        if seen is not None:
+            fresh &= ~keys.isin(seen)
+        seen = keys[fresh] if seen is None else seen.append(keys[fresh])
+        frames.append(df[fresh])
+
+    batch = [f for f in frames if f is not None]
+    results = iter(insert_transaction_batches(batch, db_path=db_path, account_id=account_id) if batch else [])
+    for report, frame in zip(reports, frames):
+        if frame is not None:
+            result = next(results)
+            report.inserted = result.inserted
+            report.skipped = report.parsed - result.inserted
+
+    for report, path in zip(reports, paths):
+        if path in streamed:
+            _stream_transactions_file(report, path, account_id, db_path)
+
+    for r in reports:
+        if r.error:
+            print(f"❌ Failed to import {r.file}: {r.error}")
+        else:
+            print(f"✅ {r.file}: {r.parsed} parsed, {r.inserted} inserted, {r.skipped} duplicates skipped ({r.seconds:.2f}s)")
+    if any(r.inserted for r in reports):
+        from data_handler.importer import refresh_after_import
+        refresh_after_import(db_path)
+    print(f"Done in {time.perf_counter() - started:.2f}s")
+    return reports
+
+def import_cash_flows(file_path, account_id=None):
     try:
         print(f"📂 Importing cash flows from {file_path}...")
         df = clean_sbi_cash_flow_csv(file_path)
-        insert_cash_flows(df)
-        print(f"✅ Done: {file_path}")
+        result = insert_cash_flows(df, account_id=account_id)
+        if result.inserted:
+            from data_handler.importer import refresh_after_import
+            refresh_after_import(transactions=False)
+        print(f"✅ Done: {file_path} ({result.inserted} inserted, {result.skipped} duplicates skipped)")
     except Exception as e:
         print(f"❌ Failed to import {file_path}: {e}")
 
 def reset_db():
     db_path = "data/portfolio.db"
-    if os.path.exists(db_path):
-        os.remove(db_path)
+    close_connections(db_path)
+    for path in (db_path, db_path + "-wal", db_path + "-shm"):
+        if os.path.exists(path):
+            os.remove(path)
     init_db(db_path)
     print("Database reset and initialized.")
 
+def export_snapshot_cmd(root=None):
+    from data_handler.snapshot import export_snapshot
+    path = export_snapshot(root=root)
+    print(f"✅ Snapshot written to {path}")
+
+def import_snapshot_cmd(path):
+    from data_handler.importer import refresh_after_import
+    from data_handler.snapshot import export_snapshot, import_snapshot
+    init_db()
+    tx_result, cf_result = import_snapshot(path)
+    refresh_after_import()
+    print(f"✅ Imported {tx_result.inserted} transactions ({tx_result.skipped} duplicates skipped), "
+          f"{cf_result.inserted} cash flows ({cf_result.skipped} duplicates skipped)")
+    # re-snapshot at the new data version so the app can start from it
+    print(f"✅ Snapshot written to {export_snapshot()}")
+
+def materialize_metrics_cmd(full=False):
+    from data_handler.materialize import materialize_portfolio_metrics
+    init_db()
+    written = materialize_portfolio_metrics(full=full)
+    print(f"✅ portfolio_metrics up to date ({written} rows written)")
+
+def refresh_positions_cmd(full=False):
+    from data_handler.positions import refresh_daily_positions
+    init_db()
+    written = refresh_daily_positions(full=full)
+    print(f"✅ daily_positions up to date ({written} rows written)")
+
 def main():
     parser = argparse.ArgumentParser(description="Stock Portfolio CLI Tool")
     subparsers = parser.add_subparsers(dest="command", help="Sub-commands")
@@ -50,10 +207,13 @@ def main():
     subparsers.add_parser("clear-cash", help="Clear cash_flows table")
 
     # import
-    subparsers.add_parser("import", help="Import CSVs from uploads folder")
+    import_tx = subparsers.add_parser("import", help="Import CSVs from uploads folder")
+    import_tx.add_argument("--workers", type=int, default=None, help="Parser processes (default: CPU count)")
+    import_tx.add_argument("--account", default=None, help="Account ID to file the rows under (default: default)")
     # import-cash
     import_cash = subparsers.add_parser("import-cash", help="Import cash flow CSV")
     import_cash.add_argument("file", help="Path to cash flow CSV file")
+    import_cash.add_argument("--account", default=None, help="Account ID to file the rows under (default: default)")
 
     # summary
     subparsers.add_parser("summary", help="Show portfolio summary (total buy/sell)")
@@ -61,6 +221,20 @@ def main():
     # reset-db
     subparsers.add_parser("reset-db", help="Delete and re-initialize the database")
 
+    # export-snapshot / import-snapshot
+    export_snap = subparsers.add_parser("export-snapshot", help="Write Parquet snapshot of data and derived ledgers")
+    export_snap.add_argument("--dir", default=None, help="Snapshot root (default: data/snapshots)")
+    import_snap = subparsers.add_parser("import-snapshot", help="Load a Parquet snapshot directory into the database")
+    import_snap.add_argument("path", help="Snapshot directory (contains manifest.json)")
+
+    # materialize-metrics (also run after every import; --full rebuilds)
+    materialize = subparsers.add_parser("materialize-metrics", help="Update the daily portfolio_metrics table")
+    materialize.add_argument("--full", action="store_true", help="Recompute every date instead of only new ones")
+
+    # refresh-positions (normally run after each import)
+    positions = subparsers.add_parser("refresh-positions", help="Update the daily_positions as-of holdings table")
+    positions.add_argument("--full", action="store_true", help="Rebuild every stock instead of only new trades")
+
     args = parser.parse_args()
 
     if args.command == "init-db":
@@ -73,9 +247,10 @@ def main():
         clear_cash_flows()
         print("🧹 Cash flows cleared.")
     elif args.command == "import":
-        import_csvs()
+        init_db()
+        import_csvs(workers=args.workers, account_id=args.account)
     elif args.command == "import-cash":
-        import_cash_flows(args.file)
+        import_cash_flows(args.file, args.account)
     elif args.command == "summary":
         summary = fetch_summary()
         print("📊 Portfolio Summary:")
@@ -83,6 +258,14 @@ def main():
             print(row)
     elif args.command == "reset-db":
         reset_db()
+    elif args.command == "materialize-metrics":
+        materialize_metrics_cmd(args.full)
+    elif args.command == "refresh-positions":
+        refresh_positions_cmd(args.full)
+    elif args.command == "export-snapshot":
+        export_snapshot_cmd(args.dir)
+    elif args.command == "import-snapshot":
+        import_snapshot_cmd(args.path)
     else:
         parser.print_help()
 
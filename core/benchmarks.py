@@ -1,13 +1,95 @@
 from __future__ import annotations
 
+import json
+import os
+import re
+import threading
 import time
-from typing import Dict, Optional
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
 import pandas as pd
-import yfinance as yf
 
+from core import config
+from core.constants import Columns
+from core.dates import to_dt
+from core.providers import get_provider
 
-_BENCH_CACHE: Dict[str, Dict[str, object]] = {}
+
+# one growing close series per ticker; "start"/"end" bound the covered range
+# (end exclusive, None = unbounded start) and are persisted next to the data
+_BENCH_CACHE: Dict[str, Dict[str, Any]] = {
+    # "SPY": {"ts": 0.0, "start": None, "end": pd.Timestamp(...), "data": pd.Series(...)}
+}
+_BENCH_LOCK = threading.Lock()
 BENCH_CACHE_TTL_SEC = 6 * 60 * 60  # 6 hours
+BENCH_CACHE_DIR = config.BENCH_CACHE_DIR
+
+
+def _cache_paths(ticker: str) -> Tuple[str, str]:
+    name = re.sub(r"[^A-Za-z0-9._-]", "_", ticker)
+    return (
+        os.path.join(BENCH_CACHE_DIR, f"{name}.csv"),
+        os.path.join(BENCH_CACHE_DIR, f"{name}.json"),
+    )
+
+
+def _load_from_disk(ticker: str) -> Optional[Dict[str, Any]]:
+    data_path, meta_path = _cache_paths(ticker)
+    if not (os.path.exists(data_path) and os.path.exists(meta_path)):
+        return None
+    try:
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        df = pd.read_csv(data_path)
+        s = pd.Series(df["close"].astype(float).values, index=pd.DatetimeIndex(pd.to_datetime(df["date"])))
+        return {
+            "ts": float(meta.get("ts", 0.0)),
+            "start": pd.Timestamp(meta["start"]) if meta.get("start") else None,
+            "end": pd.Timestamp(meta["end"]),
+            "data": s.sort_index(),
+        }
+    except Exception as e:
+        print(f"Warning: Ignoring unreadable benchmark cache for {ticker}: {e}")
+        return None
+
+
+def _save_to_disk(ticker: str, entry: Dict[str, Any]) -> None:
+    data_path, meta_path = _cache_paths(ticker)
+    try:
+        if not os.path.exists(BENCH_CACHE_DIR):
+            os.makedirs(BENCH_CACHE_DIR)
+        s = entry["data"]
+        pd.DataFrame({"date": s.index.strftime("%Y-%m-%d"), "close": s.values}).to_csv(data_path, index=False)
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "ts": entry["ts"],
+                    "start": entry["start"].strftime("%Y-%m-%d") if entry["start"] is not None else None,
+                    "end": entry["end"].strftime("%Y-%m-%d"),
+                },
+                f,
+            )
+    except Exception as e:
+        print(f"Warning: Failed to persist benchmark cache for {ticker}: {e}")
+
+
+def _missing_ranges(
+    entry: Optional[Dict[str, Any]],
+    start: Optional[pd.Timestamp],
+    end: pd.Timestamp,
+    now: float,
+) -> List[Tuple[Optional[pd.Timestamp], pd.Timestamp]]:
+    """Uncovered [start, end) edges of the request."""
+    if entry is None:
+        return [(start, end)]
+    ranges = []
+    if entry["start"] is not None and (start is None or start < entry["start"]):
+        ranges.append((start, entry["start"]))
+    if end > entry["end"]:
+        # a gap before today must be fetched; today's still-moving close honours the TTL
+        if entry["end"] < pd.Timestamp.today().normalize() or now - float(entry["ts"]) >= BENCH_CACHE_TTL_SEC:
+            ranges.append((entry["end"], end))
+    return ranges
 
 
 def get_benchmark_series(
@@ -20,62 +102,126 @@ def get_benchmark_series(
 
     start_dt = pd.to_datetime(start_date, errors="coerce") if start_date else None
     end_dt = pd.to_datetime(end_date, errors="coerce") if end_date else None
+    start = start_dt.normalize() if start_dt is not None and not pd.isna(start_dt) else None
 
-    start = start_dt.strftime("%Y-%m-%d") if start_dt is not None and not pd.isna(start_dt) else None
-    end = None
+    today = pd.Timestamp.today().normalize()
     if end_dt is not None and not pd.isna(end_dt):
-        end = (end_dt + pd.Timedelta(days=1)).strftime("%Y-%m-%d")
+        end = end_dt.normalize() + pd.Timedelta(days=1)
+    else:
+        end = today + pd.Timedelta(days=1)
 
-    cache_key = f"{ticker}|{start}|{end}"
     now = time.time()
-    cached = _BENCH_CACHE.get(cache_key)
-    if cached and (now - float(cached.get("ts", 0.0)) < BENCH_CACHE_TTL_SEC):
-        return cached.get("data", pd.Series(dtype=float))
-    print(f"Downloading benchmark prices for {ticker} from {start} to {end}...")
-    try:
-        data = yf.download(
-            tickers=ticker,
-            start=start,
-            end=end,
-            interval="1d",
-            progress=False,
-            auto_adjust=False,
-            threads=True,
-        )
-        if not isinstance(data, pd.DataFrame) or data.empty:
-            return pd.Series(dtype=float)
-
-        s = None
-        if isinstance(data.columns, pd.MultiIndex):
-            lvl0 = data.columns.get_level_values(0)
-            lvl1 = data.columns.get_level_values(1)
-            if "Close" in lvl1:
-                s = data.xs("Close", axis=1, level=1)
-            elif "Close" in lvl0:
-                s = data["Close"]
-            elif "Adj Close" in lvl1:
-                s = data.xs("Adj Close", axis=1, level=1)
-            elif "Adj Close" in lvl0:
-                s = data["Adj Close"]
-        else:
-            if "Close" in data.columns:
-                s = data["Close"]
-            elif "Adj Close" in data.columns:
-                s = data["Adj Close"]
+    with _BENCH_LOCK:
+        entry = _BENCH_CACHE.get(ticker)
+    if entry is None:
+        entry = _load_from_disk(ticker)
 
-        if s is None:
-            return pd.Series(dtype=float)
-
-        if isinstance(s, pd.DataFrame):
-            if ticker in s.columns:
-                s = s[ticker]
+    ranges = _missing_ranges(entry, start, end, now)
+    if ranges:
+        parts = [entry["data"]] if entry is not None else []
+        try:
+            for lo, hi in ranges:
+                lo_str = lo.strftime("%Y-%m-%d") if lo is not None else None
+                print(f"Downloading benchmark prices for {ticker} from {lo_str} to {hi:%Y-%m-%d}...")
+                data = get_provider().get_close_history([ticker], start=lo_str, end=hi.strftime("%Y-%m-%d"))
+                if ticker in data.columns:
+                    parts.append(data[ticker].dropna().astype(float))
+        except Exception as e:
+            print(f"Warning: Failed to download benchmark prices for {ticker}: {e}")
+        else:
+            parts = [p for p in parts if not p.empty]
+            merged = pd.concat(parts) if parts else pd.Series(dtype=float)
+            merged = merged[~merged.index.duplicated(keep="last")].sort_index()
+            if entry is None:
+                covered_start, covered_end = start, min(end, today)
             else:
-                s = s.iloc[:, 0]
-        s = s.dropna()
-        s.index = pd.to_datetime(s.index)
-    except Exception as e:
-        print(f"Warning: Failed to download benchmark prices for {ticker}: {e}")
+                covered_start = None if start is None or entry["start"] is None else min(start, entry["start"])
+                covered_end = max(entry["end"], min(end, today))
+            entry = {"ts": now, "start": covered_start, "end": covered_end, "data": merged}
+            _save_to_disk(ticker, entry)
+
+    if entry is None:
         return pd.Series(dtype=float)
+    with _BENCH_LOCK:
+        _BENCH_CACHE[ticker] = entry
+
+    s = entry["data"]
+    if start is not None:
+        s = s[s.index >= start]
+    return s[s.index < end]
+
+
+def get_benchmark_frame(
+    tickers: List[str],
+    start_date: Optional[str],
+    end_date: Optional[str],
+) -> pd.DataFrame:
+    """Date x ticker closes for several benchmarks on the union of their calendars."""
+    series = {t: get_benchmark_series(t, start_date, end_date) for t in dict.fromkeys(tickers) if t}
+    series = {t: s for t, s in series.items() if not s.empty}
+    if not series:
+        return pd.DataFrame(dtype=float)
+    return pd.DataFrame(series).sort_index()
+
+
+def cash_flow_matched_returns(prices: pd.DataFrame, flows: pd.Series) -> pd.DataFrame:
+    """
+    Return % (date x ticker) of putting every deposit/withdrawal into each
+    column of `prices` on its date: units = cumsum(flow / price) and
+    return = (units * price - net deposit) / net deposit.
+    """
+    if prices is None or prices.empty:
+        return pd.DataFrame(dtype=float)
+
+    flows = flows.groupby(level=0).sum() if flows is not None and not flows.empty else pd.Series(dtype=float)
+    calendar = prices.index.union(flows.index).sort_values()
+    px = prices.reindex(calendar).ffill().bfill().to_numpy(dtype=np.float64)
+    f = flows.reindex(calendar, fill_value=0.0).to_numpy(dtype=np.float64)[:, None]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        step_units = np.where(np.isfinite(px) & (px != 0), f / px, 0.0)
+        units = np.cumsum(step_units, axis=0)
+        net_dep = np.cumsum(f, axis=0)
+        ret = np.where(net_dep != 0, (units * px - net_dep) / net_dep * 100.0, 0.0)
+
+    return pd.DataFrame(ret, index=calendar, columns=prices.columns)
+
+
+def build_benchmark_returns(
+    tickers: List[str],
+    start_date: Optional[str],
+    end_date: Optional[str],
+    cash_flows_df: Optional[pd.DataFrame] = None,
+    as_of_date: Optional[str] = None,
+) -> pd.DataFrame:
+    """
+    Long frame (date, benchmark_return_pct, label) for all `tickers` in one pass:
+    cash-flow matched against deposits/withdrawals when cash flows exist,
+    otherwise plain price return since the first close.
+    """
+    out_cols = [Columns.DATE, "benchmark_return_pct", "label"]
+    prices = get_benchmark_frame(tickers, start_date, end_date)
+    if prices.empty:
+        return pd.DataFrame(columns=out_cols)
+
+    if cash_flows_df is not None and not cash_flows_df.empty:
+        cf = cash_flows_df[cash_flows_df["type"].isin(["Deposit", "Withdrawal"])]
+        dates = to_dt(cf[Columns.DATE])
+        amounts = pd.to_numeric(cf["amount"], errors="coerce").fillna(0.0)
+        if as_of_date and not pd.isna(to_dt(as_of_date)):
+            keep = dates <= to_dt(as_of_date)
+            dates, amounts = dates[keep], amounts[keep]
+        flows = pd.Series(amounts.to_numpy(dtype=np.float64), index=pd.DatetimeIndex(dates))
+        wide = cash_flow_matched_returns(prices, flows)
+        labels = {t: f"{t} (cash-flow matched)" for t in wide.columns}
+    else:
+        first = prices.bfill().iloc[0]
+        wide = (prices / first.where(first != 0) - 1.0) * 100.0
+        labels = {t: t for t in wide.columns}
 
-    _BENCH_CACHE[cache_key] = {"ts": now, "data": s}
-    return s
+    long = wide.rename_axis(Columns.DATE).reset_index().melt(
+        id_vars=Columns.DATE, var_name="ticker", value_name="benchmark_return_pct"
+    )
+    long = long.dropna(subset=["benchmark_return_pct"])
+    long["label"] = long["ticker"].map(labels)
+    return long[out_cols].reset_index(drop=True)
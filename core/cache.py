@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Hashable, Optional
+
+
+@dataclass
+class CacheEntry:
+    value: Any
+    fetched_at: float
+    ttl_sec: float
+
+    def is_fresh(self, now: Optional[float] = None) -> bool:
+        now = time.time() if now is None else now
+        return now - self.fetched_at < self.ttl_sec
+
+
+class TTLCache:
+    """
+    Size-bounded LRU cache where every key keeps its own fetch time and TTL.
+    Expired entries are kept (and returned by get_entry) so callers can serve
+    the last known value while they refresh it.
+    """
+
+    def __init__(self, ttl_sec: float, maxsize: int = 512):
+        self.ttl_sec = float(ttl_sec)
+        self.maxsize = int(maxsize)
+        self._data: "OrderedDict[Hashable, CacheEntry]" = OrderedDict()
+        self._lock = threading.RLock()
+
+    def get_entry(self, key: Hashable) -> Optional[CacheEntry]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                self._data.move_to_end(key)
+            return entry
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the value only if it is still fresh."""
+        entry = self.get_entry(key)
+        if entry is None or not entry.is_fresh():
+            return default
+        return entry.value
+
+    def set(self, key: Hashable, value: Any, ttl_sec: Optional[float] = None, now: Optional[float] = None) -> None:
+        entry = CacheEntry(
+            value=value,
+            fetched_at=time.time() if now is None else now,
+            ttl_sec=self.ttl_sec if ttl_sec is None else float(ttl_sec),
+        )
+        with self._lock:
+            self._data[key] = entry
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return default if entry is None else entry.value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._data
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+
+class VersionedCache:
+    """
+    LRU cache for values derived from the database. Entries never expire on
+    their own; they are all dropped as soon as a different data version is seen.
+    """
+
+    def __init__(self, maxsize: int = 64):
+        self.maxsize = int(maxsize)
+        self.version: Optional[Hashable] = None
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.RLock()
+
+    def get_or_compute(self, version: Hashable, key: Hashable, compute: Callable[[], Any]) -> Any:
+        with self._lock:
+            if version != self.version:
+                self._data.clear()
+                self.version = version
+            elif key in self._data:
+                self._data.move_to_end(key)
+                return self._data[key]
+        value = compute()
+        with self._lock:
+            if version == self.version:
+                self._data[key] = value
+                while len(self._data) > self.maxsize:
+                    self._data.popitem(last=False)
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.version = None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
@@ -0,0 +1,38 @@
+from __future__ import annotations
+
+import os
+
+# Market data source: "yfinance" (network) or "local" (CSV/Parquet fixtures).
+PRICE_PROVIDER = os.environ.get("SBI_PRICE_PROVIDER", "yfinance")
+PRICE_FIXTURES_DIR = os.environ.get("SBI_PRICE_FIXTURES_DIR", os.path.join("data", "fixtures", "prices"))
+BENCH_CACHE_DIR = os.environ.get("SBI_BENCH_CACHE_DIR", os.path.join("data", "cache", "benchmarks"))
+# Parquet snapshots of DB-derived frames (cli.py export-snapshot), one directory per data version.
+SNAPSHOT_DIR = os.environ.get("SBI_SNAPSHOT_DIR", os.path.join("data", "snapshots"))
+
+# Resilience policy for provider calls (prices, splits, benchmarks).
+MARKET_DATA_TIMEOUT_SEC = float(os.environ.get("SBI_MARKET_DATA_TIMEOUT_SEC", "8"))
+MARKET_DATA_RETRIES = int(os.environ.get("SBI_MARKET_DATA_RETRIES", "2"))
+MARKET_DATA_BACKOFF_SEC = float(os.environ.get("SBI_MARKET_DATA_BACKOFF_SEC", "0.5"))
+MARKET_DATA_DEADLINE_SEC = float(os.environ.get("SBI_MARKET_DATA_DEADLINE_SEC", "15"))
+MARKET_DATA_BREAKER_THRESHOLD = int(os.environ.get("SBI_MARKET_DATA_BREAKER_THRESHOLD", "3"))
+MARKET_DATA_BREAKER_RESET_SEC = float(os.environ.get("SBI_MARKET_DATA_BREAKER_RESET_SEC", "120"))
+
+# Background price refresher (app process only).
+PRICE_REFRESHER_ENABLED = os.environ.get("SBI_PRICE_REFRESHER", "1") not in ("0", "false", "False", "")
+PRICE_REFRESH_INTERVAL_SEC = float(os.environ.get("SBI_PRICE_REFRESH_SEC", "300"))
+
+# SQLite connection tuning (see data_handler/connection.py).
+SQLITE_CACHE_SIZE_KB = int(os.environ.get("SBI_SQLITE_CACHE_KB", "65536"))
+SQLITE_MMAP_SIZE = int(os.environ.get("SBI_SQLITE_MMAP_BYTES", str(256 * 1024 * 1024)))
+# Idle connections kept per database file for reuse by later request threads.
+SQLITE_POOL_SIZE = int(os.environ.get("SBI_SQLITE_POOL_SIZE", "4"))
+# Serve dashboard reads from an in-memory copy of the database (refreshed on data version change).
+SQLITE_READ_MIRROR = os.environ.get("SBI_SQLITE_READ_MIRROR", "0") not in ("0", "false", "False", "")
+# How long a mirror is served before data_version is re-checked; writes made by
+# this process are seen at once, other processes' (CLI imports) within this delay.
+SQLITE_READ_MIRROR_CHECK_SEC = float(os.environ.get("SBI_SQLITE_MIRROR_CHECK_SEC", "1.0"))
+
+# Rows per chunk when streaming large SBI transaction CSVs (data_handler/csv_parser.py).
+TRANSACTION_CSV_CHUNK_ROWS = int(os.environ.get("SBI_CSV_CHUNK_ROWS", "50000"))
+# cli import: files larger than this are streamed into the DB instead of parsed whole in a worker.
+TRANSACTION_CSV_STREAM_BYTES = int(os.environ.get("SBI_CSV_STREAM_BYTES", str(64 * 1024 * 1024)))
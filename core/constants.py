@@ -15,6 +15,7 @@ class Columns:
     MARKET = "market"
     TERM = "term"
     ACCOUNT = "account"
+    ACCOUNT_ID = "account_id"
     TAX = "tax"
     TAX_AMOUNT = "tax_amount"
     NET_DEPOSIT = "net_deposit"
@@ -38,6 +39,7 @@ class Columns:
     AVG_COST_AFTER = "avg_cost_after"
     REALIZED_DELTA = "realized_delta"
     REALIZED_CUM = "realized_cum"
+    COST_BASIS = "cost_basis"
     CASH_FLOW = "cash_flow"
     UNREALIZED_PROFIT = "unrealized_profit"
     TOTAL_EQUITY = "total_equity"
@@ -78,10 +80,16 @@ class UI:
     DASHBOARD_TITLE = "Dashboard"
     DASHBOARD_SUBTITLE = "Portfolio overview (current snapshot)"
     REFRESH = "Refresh"
+    PRICES_ON_DEMAND = "Prices: fetched on demand"
+    PRICES_UPDATED = "Prices updated"
+    PRICES_PENDING = "Prices: warming up..."
+    PRICES_REFRESH_FAILED = "last refresh failed"
     DATE_RANGE = "Date range"
     START_DATE = "Start date"
     END_DATE = "End date"
     POSITIONS = "Positions"
+    ACCOUNTS = "Accounts"
+    ACCOUNTS_ALL = "All accounts"
     HOLDING_ONLY = "Holding only"
     INCLUDE_CLOSED = "Include closed"
     TOP_N = "Top N"
@@ -98,6 +106,8 @@ class UI:
     BENCHMARK_NONE = "None"
     BENCHMARK_SP500 = "S&P 500 (SPY)"
     BENCHMARK_NIKKEI500 = "Nikkei 500"
+    BENCHMARK_NIKKEI225 = "Nikkei 225"
+    BENCHMARK_TOPIX = "TOPIX (1306 ETF)"
     STOCK_PERF_TITLE = "Stock Performance"
     TAB_REALIZED = "Realized PnL"
     TAB_TOTAL = "Total PnL"
@@ -146,6 +156,9 @@ class UI:
     UPLOAD_DROP = "Drag and Drop or "
     UPLOAD_SELECT = "Select CSV File"
     UPLOAD_SUCCESS_PREFIX = "Uploaded and inserted"
+    UPLOAD_DUPLICATES_SKIPPED = "duplicates skipped"
+    UPLOAD_ACCOUNT = "Account ID:"
+    UPLOAD_ACCOUNT_PLACEHOLDER = "default"
     UPLOAD_ERROR_PREFIX = "Error processing file"
 
 
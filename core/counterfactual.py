@@ -0,0 +1,198 @@
+from __future__ import annotations
+
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+
+from core.benchmarks import get_benchmark_frame
+from core.constants import Columns, TradeType
+from core.dates import to_dt
+from core.prices import get_price_matrix
+from core.splits import stocks_split_adjustments
+
+# scenario name -> number of monthly installments each deposit is spread over
+DEFAULT_SCHEDULES: Dict[str, int] = {
+    "lump_sum": 1,
+    "dca_3m": 3,
+    "dca_12m": 12,
+}
+
+
+def load_counterfactual_prices(
+    stock_codes: Optional[List[str]] = None,
+    benchmark_tickers: Optional[List[str]] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+) -> pd.DataFrame:
+    """Date x instrument closes from the local price store (JP codes) and the benchmark cache."""
+    frames = []
+    if stock_codes:
+        frames.append(get_price_matrix(stock_codes, end=end_date).to_frame())
+    if benchmark_tickers:
+        frames.append(get_benchmark_frame(benchmark_tickers, start_date, end_date))
+    frames = [f for f in frames if not f.empty]
+    if not frames:
+        return pd.DataFrame(dtype=float)
+    out = pd.concat(frames, axis=1).sort_index()
+    if start_date:
+        out = out[out.index >= to_dt(start_date)]
+    return out
+
+
+def _prepare_prices(prices: pd.DataFrame, as_of_date: Optional[str]) -> pd.DataFrame:
+    px = prices.sort_index().astype(float)
+    if as_of_date:
+        px = px[px.index <= to_dt(as_of_date)]
+    # flows before an instrument's first close buy at that first close
+    return px.ffill().bfill()
+
+
+def _snap_to_calendar(dates: pd.DatetimeIndex, calendar: pd.DatetimeIndex) -> np.ndarray:
+    """Row of the first trading day on/after each date (clipped to the last row)."""
+    pos = calendar.searchsorted(dates, side="left")
+    return np.clip(pos, 0, len(calendar) - 1)
+
+
+def build_flow_schedules(
+    flows: pd.Series,
+    calendar: pd.DatetimeIndex,
+    schedules: Dict[str, int] = DEFAULT_SCHEDULES,
+) -> pd.DataFrame:
+    """
+    (date x scenario) flows on `calendar`. Each scenario splits every flow into
+    N equal monthly installments; installments past the calendar end are
+    invested on the last day so every scenario has the same net deposit.
+    """
+    out = np.zeros((len(calendar), len(schedules)), dtype=np.float64)
+    if flows is None or flows.empty or len(calendar) == 0:
+        return pd.DataFrame(out, index=calendar, columns=list(schedules))
+
+    amounts = flows.to_numpy(dtype=np.float64)
+    dates = pd.DatetimeIndex(flows.index)
+    for j, n in enumerate(schedules.values()):
+        n = max(int(n), 1)
+        part_dates = pd.DatetimeIndex(np.concatenate([(dates + pd.DateOffset(months=k)).values for k in range(n)]))
+        part_amounts = np.tile(amounts / n, n)
+        np.add.at(out[:, j], _snap_to_calendar(part_dates, calendar), part_amounts)
+    return pd.DataFrame(out, index=calendar, columns=list(schedules))
+
+
+def replay_flows(prices: np.ndarray, flows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Replay every flow schedule into every instrument at once.
+    prices: (T, K) closes, flows: (T, S) cash in (+) / out (-).
+    Returns (units, values), both (T, S, K).
+    """
+    px = prices[:, None, :]
+    valid = np.isfinite(px) & (px > 0)
+    step = np.where(valid, flows[:, :, None] / np.where(valid, px, 1.0), 0.0)
+    units = np.cumsum(step, axis=0)
+    values = units * np.where(valid, px, 0.0)
+    return units, values
+
+
+def _deposit_flows(cash_flows_df: pd.DataFrame, as_of_date: Optional[str]) -> pd.Series:
+    cf = cash_flows_df[cash_flows_df["type"].isin(["Deposit", "Withdrawal"])]
+    dates = to_dt(cf[Columns.DATE])
+    amounts = pd.to_numeric(cf["amount"], errors="coerce").fillna(0.0)
+    flows = pd.Series(amounts.to_numpy(dtype=np.float64), index=pd.DatetimeIndex(dates))
+    flows = flows[flows.index.notna()]
+    if as_of_date:
+        flows = flows[flows.index <= to_dt(as_of_date)]
+    return flows.groupby(level=0).sum()
+
+
+def simulate_dca(
+    cash_flows_df: pd.DataFrame,
+    prices: pd.DataFrame,
+    schedules: Dict[str, int] = DEFAULT_SCHEDULES,
+    as_of_date: Optional[str] = None,
+) -> pd.DataFrame:
+    """
+    "What if every deposit had gone into X": replays deposits/withdrawals from
+    get_cash_flows() under each schedule into every column of `prices` in one
+    batched computation. Long frame: date, scenario, ticker, value, net_deposit, return_pct.
+    """
+    out_cols = [Columns.DATE, "scenario", "ticker", "value", Columns.NET_DEPOSIT, "return_pct"]
+    if cash_flows_df is None or cash_flows_df.empty or prices is None or prices.empty:
+        return pd.DataFrame(columns=out_cols)
+
+    px = _prepare_prices(prices, as_of_date)
+    flows = _deposit_flows(cash_flows_df, as_of_date)
+    if px.empty or flows.empty:
+        return pd.DataFrame(columns=out_cols)
+
+    calendar = pd.DatetimeIndex(px.index)
+    flow_matrix = build_flow_schedules(flows, calendar, schedules)
+    _, values = replay_flows(px.to_numpy(dtype=np.float64), flow_matrix.to_numpy())
+    net_dep = np.cumsum(flow_matrix.to_numpy(), axis=0)[:, :, None]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ret = np.where(net_dep != 0, (values - net_dep) / net_dep * 100.0, 0.0)
+
+    T, S, K = values.shape
+    return pd.DataFrame(
+        {
+            Columns.DATE: np.repeat(calendar.values, S * K),
+            "scenario": np.tile(np.repeat(np.array(list(schedules), dtype=object), K), T),
+            "ticker": np.tile(np.array([str(c) for c in px.columns], dtype=object), T * S),
+            "value": values.reshape(-1),
+            Columns.NET_DEPOSIT: np.broadcast_to(net_dep, values.shape).reshape(-1),
+            "return_pct": ret.reshape(-1),
+        },
+        columns=out_cols,
+    )
+
+
+def simulate_never_sold(
+    transactions_df: pd.DataFrame,
+    prices: pd.DataFrame,
+    as_of_date: Optional[str] = None,
+) -> pd.DataFrame:
+    """
+    "What if I had never sold Y": for every sold code with a price column, the
+    value of the (split-adjusted) shares sold had they been kept, against the
+    net proceeds actually received. Long frame: date, stock_code, sold_qty_cum,
+    proceeds_cum, value_if_held, missed_gain.
+    """
+    out_cols = [Columns.DATE, Columns.STOCK_CODE, "sold_qty_cum", "proceeds_cum", "value_if_held", "missed_gain"]
+    if transactions_df is None or transactions_df.empty or prices is None or prices.empty:
+        return pd.DataFrame(columns=out_cols)
+
+    df = stocks_split_adjustments(transactions_df.copy())
+    df[Columns.DATE] = to_dt(df[Columns.DATE])
+    df[Columns.STOCK_CODE] = df[Columns.STOCK_CODE].astype(str)
+    px = _prepare_prices(prices, as_of_date)
+    px.columns = [str(c) for c in px.columns]
+    sells = df[(df[Columns.TRADE_TYPE] == TradeType.SELL) & df[Columns.STOCK_CODE].isin(px.columns)]
+    if as_of_date:
+        sells = sells[sells[Columns.DATE] <= to_dt(as_of_date)]
+    if sells.empty or px.empty:
+        return pd.DataFrame(columns=out_cols)
+
+    codes = list(dict.fromkeys(sells[Columns.STOCK_CODE]))
+    calendar = pd.DatetimeIndex(px.index)
+    rows = _snap_to_calendar(pd.DatetimeIndex(sells[Columns.DATE]), calendar)
+    cols = pd.Index(codes).get_indexer(sells[Columns.STOCK_CODE])
+    fee = pd.to_numeric(sells[Columns.FEE], errors="coerce").fillna(0.0) if Columns.FEE in sells.columns else 0.0
+    proceeds = pd.to_numeric(sells[Columns.TOTAL_AMOUNT], errors="coerce").fillna(0.0) - fee
+
+    qty = np.zeros((len(calendar), len(codes)), dtype=np.float64)
+    cash = np.zeros_like(qty)
+    np.add.at(qty, (rows, cols), pd.to_numeric(sells[Columns.QUANTITY], errors="coerce").fillna(0.0).to_numpy())
+    np.add.at(cash, (rows, cols), np.asarray(proceeds, dtype=np.float64))
+    qty_cum = np.cumsum(qty, axis=0)
+    cash_cum = np.cumsum(cash, axis=0)
+    held_value = qty_cum * px[codes].to_numpy(dtype=np.float64)
+
+    T, K = qty_cum.shape
+    return pd.DataFrame(
+        {
+            Columns.DATE: np.repeat(calendar.values, K),
+            Columns.STOCK_CODE: np.tile(np.array(codes, dtype=object), T),
+            "sold_qty_cum": qty_cum.reshape(-1),
+            "proceeds_cum": cash_cum.reshape(-1),
+            "value_if_held": held_value.reshape(-1),
+            "missed_gain": (held_value - cash_cum).reshape(-1),
+        },
+        columns=out_cols,
+    )
@@ -5,6 +5,8 @@ import pandas as pd
 
 
 def to_dt(s):
+    if isinstance(s, pd.Series) and pd.api.types.is_datetime64_any_dtype(s.dtype):
+        return s  # already typed (db loaders)
     return pd.to_datetime(s, errors="coerce")
 
 
@@ -12,30 +12,56 @@ from core.schema import (
     TransactionSchema,
     TradeLedgerInputSchema,
     RealizedWindowInputSchema,
+    as_str_codes,
+    share_array,
     validate_schema,
+    yen_array,
 )
 
 
-def _normalize_fee(df: pd.DataFrame) -> pd.Series:
+def _normalize_fee(df: pd.DataFrame) -> np.ndarray:
     if Columns.FEE not in df.columns:
-        return pd.Series([0] * len(df), index=df.index)
-    return pd.to_numeric(df[Columns.FEE], errors="coerce").fillna(0).astype(int)
-
-
-def _stock_ledger_last_row(df_stock: pd.DataFrame, current_price: float) -> dict:
-    g = df_stock.sort_values([Columns.DATE, "id"] if "id" in df_stock.columns else [Columns.DATE]).copy()
-    g["fee"] = _normalize_fee(g)
-
-    qty = 0
-    cost_total = 0
-    realized = 0
-
-    for _, r in g.iterrows():
-        t = str(r[Columns.TRADE_TYPE])
-        sh = int(round(float(r[Columns.QUANTITY])))
-        amount = int(round(float(r[Columns.TOTAL_AMOUNT])))
-        fee = int(r["fee"])
-
+        return np.zeros(len(df), dtype=np.int64)
+    return yen_array(df[Columns.FEE])
+
+
+def ledger_partition_keys(df: pd.DataFrame) -> list:
+    """
+    Columns a ledger is partitioned by: (account_id, account, stock_code) when
+    present, since average cost is tracked per account and tax bucket.
+    """
+    keys = [col for col in (Columns.ACCOUNT_ID, Columns.ACCOUNT) if col in df.columns]
+    return keys + [Columns.STOCK_CODE]
+
+
+def ledger_partitions(df: pd.DataFrame):
+    """
+    df grouped by ledger_partition_keys(df); missing account values group as ""
+    (filled on local Series, the caller's frame is not modified).
+    """
+    groupers = []
+    for col in ledger_partition_keys(df):
+        s = df[col]
+        if col != Columns.STOCK_CODE and s.isna().any():
+            s = s.astype(object).fillna("")
+        groupers.append(s)
+    return df.groupby(groupers, sort=False, observed=True)
+
+
+def _position_states(g: pd.DataFrame, qty=0, cost_total=0, realized=0):
+    """
+    Yield (date, qty, cost_total, realized) after each trade of one ledger
+    partition (rows already in date, id order), starting from the given state.
+    """
+    # integer yen end to end: python ints from int64 arrays stay exact; share
+    # counts are ints too unless a split made them fractional
+    dates = g[Columns.DATE].tolist()
+    types = g[Columns.TRADE_TYPE].astype(object).to_numpy()
+    shares = share_array(g[Columns.QUANTITY]).tolist()
+    amounts = yen_array(g[Columns.TOTAL_AMOUNT]).tolist()
+    fees = _normalize_fee(g).tolist()
+
+    for d, t, sh, amount, fee in zip(dates, types, shares, amounts, fees):
         if t == TradeType.BUY:
             qty += sh
             cost_total += (amount + fee)
@@ -55,9 +81,10 @@ def _stock_ledger_last_row(df_stock: pd.DataFrame, current_price: float) -> dict
 
             if qty == 0:
                 cost_total = 0
-        else:
-            pass
+        yield d, qty, cost_total, realized
 
+
+def _valuation(qty, cost_total, realized, current_price: float) -> dict:
     avg_cost_after = (cost_total / qty) if qty > 0 else 0.0
     market_value = int(round(current_price * qty))
     unrealized = market_value - int(round(cost_total))
@@ -76,13 +103,27 @@ def _stock_ledger_last_row(df_stock: pd.DataFrame, current_price: float) -> dict
     }
 
 
+def _stock_ledger_last_row(df_stock: pd.DataFrame, current_price: float) -> dict:
+    g = df_stock.sort_values([Columns.DATE, "id"] if "id" in df_stock.columns else [Columns.DATE])
+
+    qty, cost_total, realized = 0, 0, 0
+    for _, qty, cost_total, realized in _position_states(g):
+        pass
+    return _valuation(qty, cost_total, realized, current_price)
+
+
 def build_holdings_snapshot(
     transactions_df: pd.DataFrame,
     price_map: Dict[str, float],
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
     positions_mode: str = PositionMode.HOLDING,
+    by_account: bool = False,
 ) -> pd.DataFrame:
+    """
+    Holdings per stock, valued with `price_map`. Ledgers run per (account, code)
+    in one grouped pass; rows are summed per code unless `by_account`.
+    """
     if transactions_df is None or transactions_df.empty:
         return pd.DataFrame(columns=[
             Columns.STOCK_CODE, Columns.STOCK_NAME, Columns.QTY, Columns.AVG_COST, Columns.COST_TOTAL,
@@ -105,10 +146,12 @@ def build_holdings_snapshot(
         ])
 
     df[Columns.DATE] = to_dt(df[Columns.DATE])
-    df[Columns.STOCK_CODE] = df[Columns.STOCK_CODE].astype(str)
+    df[Columns.STOCK_CODE] = as_str_codes(df[Columns.STOCK_CODE])
 
+    keys = ledger_partition_keys(df)
     rows = []
-    for code, g in df.groupby(Columns.STOCK_CODE, sort=False):
+    for key, g in ledger_partitions(df):
+        code = key[-1]
         if code not in price_map:
             continue
 
@@ -116,14 +159,20 @@ def build_holdings_snapshot(
 
         name = g[Columns.STOCK_NAME].iloc[0] if Columns.STOCK_NAME in g.columns and len(g) else ""
         rows.append({
+            **dict(zip(keys[:-1], key[:-1])),
             Columns.STOCK_CODE: code,
             Columns.STOCK_NAME: name,
             **last,
         })
 
-    snap = pd.DataFrame(rows)
+    return _finish_snapshot(pd.DataFrame(rows), len(keys) > 1 and not by_account, positions_mode)
+
+
+def _finish_snapshot(snap: pd.DataFrame, merge_partitions: bool, positions_mode: str) -> pd.DataFrame:
     if snap.empty:
         return snap
+    if merge_partitions:
+        snap = _sum_partitions(snap)
 
     if positions_mode == PositionMode.HOLDING:
         snap = snap[snap[Columns.QTY] > 0].copy()
@@ -132,10 +181,189 @@ def build_holdings_snapshot(
     return snap
 
 
+def build_daily_positions(transactions_df: pd.DataFrame, opening: Optional[Dict[tuple, tuple]] = None) -> pd.DataFrame:
+    """
+    End-of-day position after every trade date, per (account_id, account,
+    stock_code): split-adjusted qty, cost_total and realized_cum. `opening`
+    maps a partition key to the (qty, cost_total, realized_cum) carried in
+    from dates before `transactions_df` starts.
+    """
+    cols = [Columns.ACCOUNT_ID, Columns.ACCOUNT, Columns.STOCK_CODE, Columns.STOCK_NAME, Columns.DATE,
+            Columns.QTY, Columns.COST_TOTAL, Columns.REALIZED_CUM]
+    if transactions_df is None or transactions_df.empty:
+        return pd.DataFrame(columns=cols)
+
+    df = stocks_split_adjustments(transactions_df.copy())
+    df[Columns.DATE] = to_dt(df[Columns.DATE])
+    df[Columns.STOCK_CODE] = as_str_codes(df[Columns.STOCK_CODE])
+    for col in (Columns.ACCOUNT_ID, Columns.ACCOUNT):
+        if col not in df.columns:
+            df[col] = ""
+    keys = ledger_partition_keys(df)
+    opening = opening or {}
+
+    rows = []
+    for key, g in ledger_partitions(df):
+        g = g.sort_values([Columns.DATE, "id"] if "id" in g.columns else [Columns.DATE])
+        name = g[Columns.STOCK_NAME].iloc[-1] if Columns.STOCK_NAME in g.columns else ""
+        by_date = {}
+        for d, qty, cost_total, realized in _position_states(g, *opening.get(tuple(key), (0, 0, 0))):
+            by_date[d] = (qty, cost_total, realized)  # last trade of the day wins
+        for d, (qty, cost_total, realized) in by_date.items():
+            rows.append((*key[:-1], key[-1], name, d, qty, float(cost_total), float(realized)))
+    return pd.DataFrame(rows, columns=cols)
+
+
+def holdings_from_positions(
+    positions_df: pd.DataFrame,
+    price_map: Dict[str, float],
+    positions_mode: str = PositionMode.HOLDING,
+    by_account: bool = False,
+) -> pd.DataFrame:
+    """
+    Same frame as build_holdings_snapshot, valued from materialized as-of
+    positions (see data_handler.positions) instead of replaying the ledger.
+    """
+    if positions_df is None or positions_df.empty:
+        return build_holdings_snapshot(None, price_map)
+
+    keys = [c for c in (Columns.ACCOUNT_ID, Columns.ACCOUNT) if c in positions_df.columns]
+    rows = []
+    for r in positions_df.itertuples(index=False):
+        code = str(getattr(r, Columns.STOCK_CODE))
+        if code not in price_map:
+            continue
+        rows.append({
+            **{k: getattr(r, k) for k in keys},
+            Columns.STOCK_CODE: code,
+            Columns.STOCK_NAME: getattr(r, Columns.STOCK_NAME),
+            **_valuation(
+                getattr(r, Columns.QTY),
+                getattr(r, Columns.COST_TOTAL),
+                getattr(r, Columns.REALIZED_CUM),
+                current_price=price_map[code],
+            ),
+        })
+    return _finish_snapshot(pd.DataFrame(rows), bool(keys) and not by_account, positions_mode)
+
+
+def build_position_ledgers(transactions_df: pd.DataFrame, split_adjusted: bool = False) -> pd.DataFrame:
+    """
+    One row per trade of every (account_id, account, stock_code) ledger: the
+    position after it (qty, cost_total, realized_cum) plus the trade's
+    realized_delta and cost_basis. Holdings and realized windows for any date
+    range are slices of this frame (holdings_from_ledgers,
+    realized_window_from_ledgers). Pass `split_adjusted` when the trades
+    already went through stocks_split_adjustments.
+    """
+    cols = [Columns.ACCOUNT_ID, Columns.ACCOUNT, Columns.STOCK_CODE, Columns.STOCK_NAME, Columns.DATE,
+            Columns.TRADE_TYPE, Columns.QTY, Columns.COST_TOTAL, Columns.REALIZED_CUM,
+            Columns.REALIZED_DELTA, Columns.COST_BASIS]
+    if transactions_df is None or transactions_df.empty:
+        return pd.DataFrame(columns=cols)
+
+    df = transactions_df.copy() if split_adjusted else stocks_split_adjustments(transactions_df.copy())
+    df[Columns.DATE] = to_dt(df[Columns.DATE])
+    df[Columns.STOCK_CODE] = as_str_codes(df[Columns.STOCK_CODE])
+    for col in (Columns.ACCOUNT_ID, Columns.ACCOUNT):
+        if col not in df.columns:
+            df[col] = ""
+
+    rows = []
+    for key, g in ledger_partitions(df):
+        g = g.sort_values([Columns.DATE, "id"] if "id" in g.columns else [Columns.DATE])
+        names = g[Columns.STOCK_NAME].astype(object).tolist() if Columns.STOCK_NAME in g.columns else [""] * len(g)
+        types = g[Columns.TRADE_TYPE].astype(object).tolist()
+        prev_cost, prev_realized = 0, 0
+        for name, t, (d, qty, cost_total, realized) in zip(names, types, _position_states(g)):
+            # a sell's cost basis is what it took out of cost_total (all of it when the position closes)
+            cost_basis = prev_cost - cost_total if t == TradeType.SELL else 0
+            rows.append((*key[:-1], key[-1], name, d, t, qty, float(cost_total), float(realized),
+                         float(realized - prev_realized), float(cost_basis)))
+            prev_cost, prev_realized = cost_total, realized
+    return pd.DataFrame(rows, columns=cols)
+
+
+def _ledger_keys(ledgers: pd.DataFrame) -> list:
+    return [c for c in (Columns.ACCOUNT_ID, Columns.ACCOUNT) if c in ledgers.columns] + [Columns.STOCK_CODE]
+
+
+def holdings_from_ledgers(
+    ledgers: pd.DataFrame,
+    price_map: Dict[str, float],
+    end_date: Optional[str] = None,
+    positions_mode: str = PositionMode.HOLDING,
+    by_account: bool = False,
+) -> pd.DataFrame:
+    """build_holdings_snapshot as of `end_date`, read off precomputed build_position_ledgers rows."""
+    if ledgers is None or ledgers.empty:
+        return build_holdings_snapshot(None, price_map)
+    if end_date:
+        end_dt = to_dt(end_date)
+        if not pd.isna(end_dt):
+            ledgers = ledgers[ledgers[Columns.DATE] <= end_dt]
+    # rows are in trade order within each ledger, so the last one is the current position
+    last = ledgers.groupby(_ledger_keys(ledgers), sort=False, observed=True).tail(1)
+    return holdings_from_positions(last, price_map, positions_mode=positions_mode, by_account=by_account)
+
+
+def realized_window_from_ledgers(
+    ledgers: pd.DataFrame,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    by_account: bool = False,
+) -> pd.DataFrame:
+    """compute_realized_window over precomputed build_position_ledgers rows."""
+    if ledgers is None or ledgers.empty:
+        return compute_realized_window(None)
+
+    if end_date:
+        ledgers = ledgers[ledgers[Columns.DATE] <= to_dt(end_date)]
+    in_window = (ledgers[Columns.TRADE_TYPE].astype(object) == TradeType.SELL).to_numpy()
+    if start_date:
+        in_window = in_window & (ledgers[Columns.DATE] >= to_dt(start_date)).to_numpy()
+
+    keys = _ledger_keys(ledgers)
+    window = pd.DataFrame({
+        **{k: ledgers[k].astype(object).to_numpy() for k in keys},
+        Columns.REALIZED_WINDOW: np.where(in_window, ledgers[Columns.REALIZED_DELTA].to_numpy(dtype=float), 0.0),
+        Columns.COST_BASIS_WINDOW: np.where(in_window, ledgers[Columns.COST_BASIS].to_numpy(dtype=float), 0.0),
+    })
+    out = window.groupby(keys, sort=False, as_index=False).sum()
+    # rounded per ledger, as compute_realized_window does
+    out[Columns.REALIZED_WINDOW] = out[Columns.REALIZED_WINDOW].round().astype("int64")
+    if not by_account and len(keys) > 1:
+        out = out.groupby(Columns.STOCK_CODE, sort=False, as_index=False)[
+            [Columns.REALIZED_WINDOW, Columns.COST_BASIS_WINDOW]
+        ].sum()
+    return out
+
+
+def _sum_partitions(snap: pd.DataFrame) -> pd.DataFrame:
+    """Collapse per-account snapshot rows into one row per stock code."""
+    out = snap.groupby(Columns.STOCK_CODE, sort=False, as_index=False).agg({
+        Columns.STOCK_NAME: "first",
+        Columns.QTY: "sum",
+        Columns.COST_TOTAL: "sum",
+        Columns.CURRENT_PRICE: "first",
+        Columns.MARKET_VALUE: "sum",
+        Columns.REALIZED: "sum",
+        Columns.UNREALIZED: "sum",
+        Columns.TOTAL_PNL: "sum",
+    })
+    qty = out[Columns.QTY].to_numpy()
+    cost = out[Columns.COST_TOTAL].to_numpy(dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out[Columns.AVG_COST] = np.where(qty > 0, cost / qty, 0.0)
+        out[Columns.UNREALIZED_PCT] = np.where(cost > 0, out[Columns.UNREALIZED].to_numpy() / cost * 100.0, 0.0)
+    return out[list(snap.columns.drop([c for c in snap.columns if c in (Columns.ACCOUNT_ID, Columns.ACCOUNT)]))]
+
+
 def compute_realized_window(
     transactions_df: pd.DataFrame,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
+    by_account: bool = False,
 ) -> pd.DataFrame:
     if transactions_df is None or transactions_df.empty:
         return pd.DataFrame(columns=[Columns.STOCK_CODE, Columns.REALIZED_WINDOW, Columns.COST_BASIS_WINDOW])
@@ -144,28 +372,29 @@ def compute_realized_window(
 
     df = transactions_df.copy()
     df[Columns.DATE] = to_dt(df[Columns.DATE])
-    df[Columns.STOCK_CODE] = df[Columns.STOCK_CODE].astype(str)
+    df[Columns.STOCK_CODE] = as_str_codes(df[Columns.STOCK_CODE])
 
     start_dt = to_dt(start_date) if start_date else None
     end_dt = to_dt(end_date) if end_date else None
 
+    keys = ledger_partition_keys(df)
     rows = []
-    for code, g in df.groupby(Columns.STOCK_CODE, sort=False):
-        g = g.sort_values([Columns.DATE, "id"] if "id" in g.columns else [Columns.DATE]).copy()
-        g["fee"] = _normalize_fee(g)
-
+    for key, g in ledger_partitions(df):
+        code = key[-1]
+        g = g.sort_values([Columns.DATE, "id"] if "id" in g.columns else [Columns.DATE])
+        types = g[Columns.TRADE_TYPE].astype(object).to_numpy()
+        shares = share_array(g[Columns.QUANTITY]).tolist()
+        amounts = yen_array(g[Columns.TOTAL_AMOUNT]).tolist()
+        fees = _normalize_fee(g).tolist()
+        dates = g[Columns.DATE].tolist()
+
+        # integer yen until an average cost splits a lot, as in _position_states
         qty = 0
-        cost_total = 0.0
-        realized_window = 0.0
-        cost_basis_window = 0.0
-
-        for _, r in g.iterrows():
-            t = str(r[Columns.TRADE_TYPE])
-            sh = int(round(float(r[Columns.QUANTITY])))
-            amount = float(r[Columns.TOTAL_AMOUNT])
-            fee = float(r["fee"])
-            d = r["date"]
+        cost_total = 0
+        realized_window = 0
+        cost_basis_window = 0
 
+        for t, sh, amount, fee, d in zip(types, shares, amounts, fees, dates):
             if t == TradeType.BUY:
                 qty += sh
                 cost_total += (amount + fee)
@@ -188,15 +417,21 @@ def compute_realized_window(
                 cost_total -= cost_basis
                 qty -= sh
                 if qty == 0:
-                    cost_total = 0.0
+                    cost_total = 0
 
         rows.append({
+            **dict(zip(keys[:-1], key[:-1])),
             Columns.STOCK_CODE: code,
             Columns.REALIZED_WINDOW: int(round(realized_window)),
             Columns.COST_BASIS_WINDOW: float(cost_basis_window),
         })
 
-    return pd.DataFrame(rows)
+    out = pd.DataFrame(rows)
+    if not by_account and len(keys) > 1 and not out.empty:
+        out = out.groupby(Columns.STOCK_CODE, sort=False, as_index=False)[
+            [Columns.REALIZED_WINDOW, Columns.COST_BASIS_WINDOW]
+        ].sum()
+    return out
 
 
 def compute_ledger_decimal(df_symbol: pd.DataFrame) -> pd.DataFrame:
@@ -259,7 +494,7 @@ def compute_ledger_decimal(df_symbol: pd.DataFrame) -> pd.DataFrame:
 
 def build_trade_ledger(df: pd.DataFrame) -> pd.DataFrame:
     validate_schema(df, TradeLedgerInputSchema.required, name="trade_ledger_input", raise_on_error=True)
-    pos_qty = 0.0
+    pos_qty = 0
     avg_cost = 0.0
     realized_cum = 0.0
     cash_flow = 0.0
@@ -275,12 +510,14 @@ def build_trade_ledger(df: pd.DataFrame) -> pd.DataFrame:
 
     ledger_rows = []
 
-    for _, row in df.iterrows():
-        trade_type = row[Columns.TRADE_TYPE]
-        qty = row[Columns.QUANTITY]
-        price = row[Columns.PRICE_PER_SHARE]
-        fee = row[Columns.FEE] if row[Columns.FEE] else 0.0
+    # fees as python ints; share counts too unless split-adjusted to fractions
+    dates = df[Columns.DATE].tolist()
+    types = df[Columns.TRADE_TYPE].astype(object).tolist()
+    quantities = share_array(df[Columns.QUANTITY]).tolist()
+    prices = pd.to_numeric(df[Columns.PRICE_PER_SHARE], errors="coerce").astype(float).tolist()
+    fees = _normalize_fee(df).tolist()
 
+    for date, trade_type, qty, price, fee in zip(dates, types, quantities, prices, fees):
         realized_delta = 0.0
 
         if trade_type == TradeType.BUY:
@@ -312,7 +549,7 @@ def build_trade_ledger(df: pd.DataFrame) -> pd.DataFrame:
         break_even_point_price = break_even_point_price if break_even_point_price > 0 else 0
 
         ledger_rows.append({
-            Columns.DATE: row[Columns.DATE],
+            Columns.DATE: date,
             Columns.TRADE_TYPE: trade_type,
             Columns.QUANTITY: qty,
             Columns.PRICE: price,
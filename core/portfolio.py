@@ -1,13 +1,16 @@
 from __future__ import annotations
 
+from itertools import groupby
+from operator import itemgetter
 from typing import Dict, Optional
+import numpy as np
 import pandas as pd
 
 from core.constants import Columns, TradeType
 from core.dates import to_dt
 from core.splits import stocks_split_adjustments
-from core.schema import TransactionSchema, validate_schema
-from core.ledger import build_trade_ledger
+from core.schema import TransactionSchema, share_array, validate_schema, yen_array
+from core.ledger import build_trade_ledger, ledger_partitions
 
 
 def build_portfolio_value_timeseries(
@@ -16,10 +19,15 @@ def build_portfolio_value_timeseries(
     as_of_date: Optional[str] = None,
     cash_flows_df: Optional[pd.DataFrame] = None,
     net_deposit: float = 0.0,
+    start_date: Optional[str] = None,
+    split_adjusted: bool = False,
 ) -> pd.DataFrame:
     """
     Build a simple portfolio value time series using last known trade price
     for each stock. Optionally appends an as-of point using price_map.
+    With `start_date`, history before it only seeds the opening positions and
+    cash, and rows are emitted from that date on (incremental materialization).
+    Pass `split_adjusted` when the trades already went through stocks_split_adjustments.
     """
     if transactions_df is None or transactions_df.empty:
         return pd.DataFrame(columns=[Columns.DATE, Columns.MARKET_VALUE])
@@ -27,8 +35,10 @@ def build_portfolio_value_timeseries(
     validate_schema(transactions_df, TransactionSchema.required, name="transactions_df", raise_on_error=True)
 
     df = transactions_df.copy()
-    df = stocks_split_adjustments(df)
+    if not split_adjusted:
+        df = stocks_split_adjustments(df)
     df[Columns.DATE] = to_dt(df[Columns.DATE])
+    df = df[df[Columns.DATE].notna()]
     df = df.sort_values([Columns.DATE, "id"] if "id" in df.columns else [Columns.DATE])
     if as_of_date:
         as_of_dt = pd.to_datetime(as_of_date, errors="coerce")
@@ -56,37 +66,33 @@ def build_portfolio_value_timeseries(
         cash_flow_by_date = cf.groupby(Columns.DATE)["amount"].sum()
         net_deposit_by_date = cf[cf["type"].isin(["Deposit", "Withdrawal"])].groupby(Columns.DATE)["amount"].sum()
 
+    start_dt = pd.to_datetime(start_date, errors="coerce") if start_date else None
+    if start_dt is not None and not pd.isna(start_dt):
+        # fold earlier history into the opening state instead of replaying it day by day
+        before = df[df[Columns.DATE] < start_dt]
+        df = df[df[Columns.DATE] >= start_dt]
+        qty_by_code, last_price_by_code, net_cash_flow = _opening_positions(before)
+        if cash_flow_by_date is not None:
+            cash_flow_total += float(cash_flow_by_date[cash_flow_by_date.index < start_dt].sum())
+            net_deposit_cum += float(net_deposit_by_date[net_deposit_by_date.index < start_dt].sum())
+            cash_flow_by_date = cash_flow_by_date[cash_flow_by_date.index >= start_dt]
+            net_deposit_by_date = net_deposit_by_date[net_deposit_by_date.index >= start_dt]
+
     dates = set(df[Columns.DATE].tolist())
     if cash_flow_by_date is not None:
         dates.update(cash_flow_by_date.index.tolist())
     dates = sorted(dates)
 
+    # one grouped pass over column arrays instead of rescanning the frame per date
+    trades_by_date = {d: list(day) for d, day in groupby(zip(*_trade_arrays(df)), key=itemgetter(0))}
     for date in dates:
-        g = df[df[Columns.DATE] == date]
-        for _, r in g.iterrows():
-            code = str(r[Columns.STOCK_CODE])
-            trade_type = str(r[Columns.TRADE_TYPE])
-            qty = float(r[Columns.QUANTITY])
-            price = float(r[Columns.PRICE_PER_SHARE])
-
-            amount = r.get(Columns.TOTAL_AMOUNT, 0)
-            fee_val = r.get(Columns.FEE, 0)
-            try:
-                amount = float(amount) if amount is not None else 0.0
-            except Exception:
-                amount = 0.0
-            try:
-                fee_val = float(fee_val) if fee_val is not None else 0.0
-            except Exception:
-                fee_val = 0.0
-
+        for _, code, trade_type, qty, price, amount, fee in trades_by_date.get(date, ()):
             if trade_type == TradeType.BUY:
-                qty_by_code[code] = qty_by_code.get(code, 0.0) + qty
-                net_cash_flow -= (amount + fee_val)
+                qty_by_code[code] = qty_by_code.get(code, 0) + qty
+                net_cash_flow -= (amount + fee)
             elif trade_type == TradeType.SELL:
-                qty_by_code[code] = qty_by_code.get(code, 0.0) - qty
-                net_cash_flow += (amount - fee_val)
-
+                qty_by_code[code] = qty_by_code.get(code, 0) - qty
+                net_cash_flow += (amount - fee)
             last_price_by_code[code] = price
 
         if cash_flow_by_date is not None:
@@ -150,9 +156,78 @@ def build_portfolio_value_timeseries(
     return out
 
 
+def _opening_positions(df: pd.DataFrame):
+    """(qty_by_code, last_price_by_code, net_cash_flow) after all trades in `df`."""
+    if df.empty:
+        return {}, {}, 0.0
+    codes = df[Columns.STOCK_CODE].astype(str)
+    trade_type = df[Columns.TRADE_TYPE].astype(str)
+    is_buy = (trade_type == TradeType.BUY).to_numpy()
+    is_sell = (trade_type == TradeType.SELL).to_numpy()
+    qty = df[Columns.QUANTITY].astype(float).to_numpy()
+    amount = _numeric_or_zero(df, Columns.TOTAL_AMOUNT)
+    fee = _numeric_or_zero(df, Columns.FEE)
+
+    signed_qty = pd.Series(np.where(is_buy, qty, np.where(is_sell, -qty, 0.0)), index=df.index)
+    qty_by_code = signed_qty.groupby(codes).sum().to_dict()
+    last_price_by_code = df[Columns.PRICE_PER_SHARE].astype(float).groupby(codes).last().to_dict()
+    net_cash_flow = float((amount - fee)[is_sell].sum() - (amount + fee)[is_buy].sum())
+    return qty_by_code, last_price_by_code, net_cash_flow
+
+
+def _numeric_or_zero(df: pd.DataFrame, col: str) -> np.ndarray:
+    if col not in df.columns:
+        return np.zeros(len(df))
+    return pd.to_numeric(df[col], errors="coerce").fillna(0.0).to_numpy(dtype=float)
+
+
+def _yen_or_zero(df: pd.DataFrame, col: str) -> np.ndarray:
+    if col not in df.columns:
+        return np.zeros(len(df), dtype=np.int64)
+    return yen_array(df[col])
+
+
+def _trade_arrays(df: pd.DataFrame):
+    """(dates, codes, trade types, shares, prices, amounts, fees) of `df` as lists, amounts and fees in int yen."""
+    return (
+        df[Columns.DATE].tolist(),
+        df[Columns.STOCK_CODE].astype(str).tolist(),
+        df[Columns.TRADE_TYPE].astype(object).tolist(),
+        share_array(df[Columns.QUANTITY]).tolist(),
+        pd.to_numeric(df[Columns.PRICE_PER_SHARE], errors="coerce").astype(float).tolist(),
+        _yen_or_zero(df, Columns.TOTAL_AMOUNT).tolist(),
+        _yen_or_zero(df, Columns.FEE).tolist(),
+    )
+
+
+def append_as_of_point(
+    asset_df: pd.DataFrame,
+    market_value: float,
+    as_of_date: Optional[str] = None,
+) -> pd.DataFrame:
+    """
+    Append the valuation point build_portfolio_value_timeseries adds for a
+    price_map to a precomputed series (e.g. materialized portfolio_metrics).
+    `market_value` is the holdings value at current prices.
+    """
+    if asset_df is None or asset_df.empty:
+        return asset_df
+    last = asset_df.iloc[-1]
+    cash = float(last[Columns.NET_VALUE]) - float(last[Columns.MARKET_VALUE])
+    as_of = pd.to_datetime(as_of_date).normalize() if as_of_date else pd.Timestamp.today().normalize()
+    point = pd.DataFrame([{
+        Columns.DATE: as_of,
+        Columns.MARKET_VALUE: float(market_value),
+        Columns.NET_VALUE: cash + float(market_value),
+        Columns.NET_DEPOSIT: float(last[Columns.NET_DEPOSIT]),
+    }])
+    return pd.concat([asset_df[[Columns.DATE, Columns.MARKET_VALUE, Columns.NET_VALUE, Columns.NET_DEPOSIT]], point], ignore_index=True)
+
+
 def build_stock_perf_timeseries(
     transactions_df: pd.DataFrame,
     kind: str,
+    split_adjusted: bool = False,
 ) -> pd.DataFrame:
     """
     Build per-stock performance time series (stackable).
@@ -164,13 +239,15 @@ def build_stock_perf_timeseries(
     validate_schema(transactions_df, TransactionSchema.required, name="transactions_df", raise_on_error=True)
 
     df = transactions_df.copy()
-    df = stocks_split_adjustments(df)
+    if not split_adjusted:
+        df = stocks_split_adjustments(df)
     df[Columns.DATE] = to_dt(df[Columns.DATE])
 
     series_map = {}
     all_dates = set()
 
-    for code, g in df.groupby(Columns.STOCK_CODE, sort=False):
+    for key, g in ledger_partitions(df):
+        code = key[-1]
         g = g.sort_values([Columns.DATE, "id"] if "id" in g.columns else [Columns.DATE])
         ledger = build_trade_ledger(g)
         if Columns.DATE not in ledger.columns:
@@ -183,7 +260,7 @@ def build_stock_perf_timeseries(
         s = pd.Series(vals, index=ledger_dates).sort_index()
         if s.index.has_duplicates:
             s = s.groupby(level=0).last()
-        series_map[str(code)] = s
+        series_map.setdefault(str(code), []).append(s)
         all_dates.update(s.index.tolist())
 
     if not series_map:
@@ -193,8 +270,9 @@ def build_stock_perf_timeseries(
     out = pd.DataFrame({Columns.DATE: all_dates})
     out = out.set_index(Columns.DATE)
 
-    for code, s in series_map.items():
-        out[code] = s.reindex(out.index).ffill().fillna(0.0)
+    # per-account ledgers of the same stock are summed into one column
+    for code, parts in series_map.items():
+        out[code] = sum(s.reindex(out.index).ffill().fillna(0.0) for s in parts)
 
     out = out.reset_index()
     return out
@@ -266,39 +344,28 @@ def compute_irr(
                 cf = cf[cf[Columns.DATE] <= as_of_dt]
         cf["amount"] = pd.to_numeric(cf["amount"], errors="coerce").fillna(0.0)
         # cash_flows are from account perspective; invert to investor perspective for IRR
-        for _, r in cf.iterrows():
-            cashflows.append((pd.to_datetime(r[Columns.DATE]), -float(r["amount"])))
+        cashflows.extend(zip(cf[Columns.DATE].tolist(), (-cf["amount"].to_numpy(dtype=float)).tolist()))
         if as_of_date:
             last_date = pd.to_datetime(as_of_date)
         else:
             last_date = pd.to_datetime(cf[Columns.DATE].max())
         cashflows.append((last_date, float(ending_value)))
     else:
+        # only amounts and fees are used, and splits do not change them
         df = transactions_df.copy()
-        df = stocks_split_adjustments(df)
         df[Columns.DATE] = to_dt(df[Columns.DATE])
         df = df.sort_values([Columns.DATE, "id"] if "id" in df.columns else [Columns.DATE])
 
         if net_deposit:
             cashflows.append((pd.to_datetime(df[Columns.DATE].min()), -float(net_deposit)))
 
-        for _, r in df.iterrows():
-            d = pd.to_datetime(r[Columns.DATE])
-            amt = r.get(Columns.TOTAL_AMOUNT, 0) or 0
-            fee = r.get(Columns.FEE, 0) or 0
-            try:
-                amt = float(amt)
-            except Exception:
-                amt = 0.0
-            try:
-                fee = float(fee)
-            except Exception:
-                fee = 0.0
-
-            if r[Columns.TRADE_TYPE] == TradeType.BUY:
-                cashflows.append((d, -(amt + fee)))
-            elif r[Columns.TRADE_TYPE] == TradeType.SELL:
-                cashflows.append((d, amt - fee))
+        trade_type = df[Columns.TRADE_TYPE].astype(object).to_numpy()
+        amount = _yen_or_zero(df, Columns.TOTAL_AMOUNT)
+        fee = _yen_or_zero(df, Columns.FEE)
+        is_buy = trade_type == TradeType.BUY
+        is_trade = is_buy | (trade_type == TradeType.SELL)
+        flows = np.where(is_buy, -(amount + fee), amount - fee)
+        cashflows.extend(zip(df[Columns.DATE][is_trade].tolist(), flows[is_trade].astype(float).tolist()))
 
         last_date = pd.to_datetime(as_of_date) if as_of_date else pd.to_datetime(df[Columns.DATE].max())
         cashflows.append((last_date, float(ending_value)))
@@ -313,17 +380,27 @@ def compute_twr(
     net_deposit: float,
     cash_flows_df: Optional[pd.DataFrame] = None,
     as_of_date: Optional[str] = None,
+    asset_df: Optional[pd.DataFrame] = None,
+    split_adjusted: bool = False,
 ) -> float:
+    """
+    Time-weighted return in percent. With cash flows the periods come from the
+    portfolio value series; pass `asset_df` when it is already built (or
+    materialized) to skip rebuilding it, and `split_adjusted` when the trades
+    already went through stocks_split_adjustments.
+    """
     if transactions_df is None or transactions_df.empty:
         return 0.0
 
     if cash_flows_df is not None and not cash_flows_df.empty:
-        asset_df = build_portfolio_value_timeseries(
-            transactions_df,
-            price_map=price_map,
-            as_of_date=as_of_date,
-            cash_flows_df=cash_flows_df,
-        )
+        if asset_df is None:
+            asset_df = build_portfolio_value_timeseries(
+                transactions_df,
+                price_map=price_map,
+                as_of_date=as_of_date,
+                cash_flows_df=cash_flows_df,
+                split_adjusted=split_adjusted,
+            )
         if asset_df is None or asset_df.empty or Columns.NET_VALUE not in asset_df.columns:
             return 0.0
 
@@ -339,9 +416,9 @@ def compute_twr(
         asset_df = asset_df.sort_values(Columns.DATE)
         prev_value = None
         twr = 1.0
-        for _, r in asset_df.iterrows():
-            date = pd.to_datetime(r[Columns.DATE])
-            end_value = float(r[Columns.NET_VALUE])
+        for date, end_value in zip(
+            pd.to_datetime(asset_df[Columns.DATE]).tolist(), asset_df[Columns.NET_VALUE].to_numpy(dtype=float).tolist()
+        ):
             if prev_value is None:
                 prev_value = end_value
                 continue
@@ -354,8 +431,10 @@ def compute_twr(
         return (twr - 1.0) * 100.0
 
     df = transactions_df.copy()
-    df = stocks_split_adjustments(df)
+    if not split_adjusted:
+        df = stocks_split_adjustments(df)
     df[Columns.DATE] = to_dt(df[Columns.DATE])
+    df = df[df[Columns.DATE].notna()]
     df = df.sort_values([Columns.DATE, "id"] if "id" in df.columns else [Columns.DATE])
     if as_of_date:
         as_of_dt = pd.to_datetime(as_of_date, errors="coerce")
@@ -367,35 +446,21 @@ def compute_twr(
     prev_value = None
     twr = 1.0
 
-    for date, g in df.groupby(Columns.DATE, sort=True):
+    # rows are in date order, so consecutive runs are the trading days
+    for _date, day in groupby(zip(*_trade_arrays(df)), key=itemgetter(0)):
         # start-of-period value
         if prev_value is None:
             prev_value = float(net_deposit)
 
         # apply trades and compute cash flow on this date
-        cash_flow = 0.0
-        for _, r in g.iterrows():
-            code = str(r[Columns.STOCK_CODE])
-            qty = float(r[Columns.QUANTITY])
-            price = float(r[Columns.PRICE_PER_SHARE])
-            amt = r.get(Columns.TOTAL_AMOUNT, 0) or 0
-            fee = r.get(Columns.FEE, 0) or 0
-            try:
-                amt = float(amt)
-            except Exception:
-                amt = 0.0
-            try:
-                fee = float(fee)
-            except Exception:
-                fee = 0.0
-
-            if r[Columns.TRADE_TYPE] == TradeType.BUY:
-                qty_by_code[code] = qty_by_code.get(code, 0.0) + qty
+        cash_flow = 0
+        for _, code, trade_type, qty, price, amt, fee in day:
+            if trade_type == TradeType.BUY:
+                qty_by_code[code] = qty_by_code.get(code, 0) + qty
                 cash_flow += (amt + fee)
-            elif r[Columns.TRADE_TYPE] == TradeType.SELL:
-                qty_by_code[code] = qty_by_code.get(code, 0.0) - qty
+            elif trade_type == TradeType.SELL:
+                qty_by_code[code] = qty_by_code.get(code, 0) - qty
                 cash_flow -= (amt - fee)
-
             last_price_by_code[code] = price
 
         # end-of-period value using last trade prices
@@ -1,19 +1,87 @@
 from __future__ import annotations
 
+import json
+import os
+import threading
 import time
-from typing import Dict, List, Tuple
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, List, Optional, Set
+import numpy as np
 import pandas as pd
-import yfinance as yf
 
+from core.cache import TTLCache
+from core.constants import Columns
+from core.dates import to_dt
+from core.providers import get_provider
+from core.schema import as_str_codes
+from core.splits import get_stock_splits
 
-_PRICE_CACHE = {
-    "ts": 0.0,
-    "data": {},  # { "6526": 1234.0 }
-}
-# keep prices for a few minutes to avoid repeated yfinance calls
+
+# per-ticker latest prices; stale entries are served while a background refresh runs
 CACHE_TTL_SEC = 300
+PRICE_CACHE_MAXSIZE = 512
+_PRICE_CACHE = TTLCache(ttl_sec=CACHE_TTL_SEC, maxsize=PRICE_CACHE_MAXSIZE)
+
+_REFRESHING: Set[str] = set()
+_REFRESHING_LOCK = threading.Lock()
+
+# full daily close history per code; "through" is the last date known to be final
+_HIST_SERIES: Dict[str, Dict[str, Any]] = {
+    # "6526": {"ts": 0.0, "through": pd.Timestamp(...), "data": pd.Series(...)}
+}
+_HIST_LOCK = threading.Lock()
+
+
+class _Flight:
+    """One in-flight download; concurrent callers for the same keys wait on it."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Dict[Hashable, Any] = {}
+        self.error: Optional[BaseException] = None
+
+
+_INFLIGHT: Dict[Hashable, _Flight] = {}
+_INFLIGHT_LOCK = threading.Lock()
 
-_HIST_PRICE_CACHE: Dict[Tuple[str, str], float] = {}
+
+def _single_flight(
+    keys: List[Hashable],
+    fetch: Callable[[List[Hashable]], Dict[Hashable, Any]],
+) -> Dict[Hashable, Any]:
+    """
+    Run `fetch` for the keys nobody is already fetching and wait for the rest,
+    so overlapping concurrent requests share one download per key.
+    """
+    with _INFLIGHT_LOCK:
+        joined = {k: _INFLIGHT[k] for k in keys if k in _INFLIGHT}
+        own = [k for k in dict.fromkeys(keys) if k not in joined]
+        flight = _Flight() if own else None
+        for k in own:
+            _INFLIGHT[k] = flight
+
+    result: Dict[Hashable, Any] = {}
+    if flight is not None:
+        try:
+            flight.result = fetch(own)
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with _INFLIGHT_LOCK:
+                for k in own:
+                    if _INFLIGHT.get(k) is flight:
+                        del _INFLIGHT[k]
+            flight.done.set()
+        result.update(flight.result)
+
+    for k, other in joined.items():
+        other.done.wait()
+        if other.error is not None:
+            raise other.error
+        if k in other.result:
+            result[k] = other.result[k]
+    return result
 
 
 def _to_yf_ticker_jp(stock_code: str) -> str:
@@ -22,125 +90,378 @@ def _to_yf_ticker_jp(stock_code: str) -> str:
 
 
 def get_stock_current_price(stock_code: str) -> float | None:
-    ticker = f"{stock_code}.T"
+    ticker = _to_yf_ticker_jp(stock_code)
     try:
-        today_price = yf.Ticker(ticker).history(period="1d")["Close"].iloc[0]
+        today_price = get_provider().get_close_history([ticker], period="1d")[ticker].dropna().iloc[-1]
         return float(today_price)
     except Exception as e:
         print(f"Warning: Failed to retrieve current price for {stock_code}: {e}")
         return None
 
 
-def get_price_map(stock_codes: List[str]) -> Dict[str, float]:
-    if not stock_codes:
-        return {}
-    now = time.time()
-    cached = _PRICE_CACHE["data"]
+def refresh_prices(stock_codes: List[str], ttl_sec: Optional[float] = None) -> Dict[str, float]:
+    """Download the latest prices for `stock_codes` into the cache. Provider errors propagate."""
+
+    def fetch(keys: List[Hashable]) -> Dict[Hashable, float]:
+        codes = [k[1] for k in keys]
+        tickers = [_to_yf_ticker_jp(c) for c in codes]
+        data = get_provider().get_close_history(tickers, period="2d")
 
-    if now - _PRICE_CACHE["ts"] < CACHE_TTL_SEC and all(str(c) in cached for c in stock_codes):
-        return {str(c): float(cached[str(c)]) for c in stock_codes}
+        fetched: Dict[Hashable, float] = {}
+        for key, code, tk in zip(keys, codes, tickers):
+            try:
+                px = float(data[tk].dropna().iloc[-1])
+            except Exception:
+                continue
+            fetched[key] = px
+            _PRICE_CACHE.set(code, px, ttl_sec=ttl_sec)
+        return fetched
 
-    missing = [str(c) for c in stock_codes if str(c) not in cached]
-    if not missing and now - _PRICE_CACHE["ts"] < CACHE_TTL_SEC:
-        return {str(c): float(cached[str(c)]) for c in stock_codes}
+    keys = [("latest", str(c)) for c in stock_codes]
+    return {k[1]: px for k, px in _single_flight(keys, fetch).items()}
 
-    if not missing:
-        return {str(c): float(cached[str(c)]) for c in stock_codes if str(c) in cached}
 
-    tickers = [_to_yf_ticker_jp(c) for c in missing]
+def _fetch_latest_prices(codes: List[str]) -> Dict[str, float]:
     try:
-        data = yf.download(
-            tickers=tickers,
-            period="2d",
-            interval="1d",
-            progress=False,
-            group_by="ticker",
-            auto_adjust=False,
-            threads=True,
-        )
+        return refresh_prices(codes)
     except Exception as e:
         print(f"Warning: Failed to download prices: {e}")
-        return {str(c): float(cached[str(c)]) for c in stock_codes if str(c) in cached}
+        return {}
 
-    result: Dict[str, float] = {}
-    for code, tk in zip(missing, tickers):
-        px = None
+
+def _refresh_in_background(codes: List[str]) -> Optional[threading.Thread]:
+    with _REFRESHING_LOCK:
+        todo = [c for c in codes if c not in _REFRESHING]
+        _REFRESHING.update(todo)
+    if not todo:
+        return None
+
+    def run():
         try:
-            if len(tickers) == 1:
-                px = float(data["Close"].dropna().iloc[-1])
-            else:
-                px = float(data[(tk, "Close")].dropna().iloc[-1])
-        except Exception:
-            px = None
-
-        if px is not None:
-            result[code] = px
-            cached[code] = px
-
-    _PRICE_CACHE["ts"] = now
-    _PRICE_CACHE["data"] = cached
-
-    out = {}
-    for c in stock_codes:
-        key = str(c)
-        if key in cached:
-            out[key] = float(cached[key])
+            _fetch_latest_prices(todo)
+        finally:
+            with _REFRESHING_LOCK:
+                _REFRESHING.difference_update(todo)
+
+    t = threading.Thread(target=run, name="price-refresh", daemon=True)
+    t.start()
+    return t
+
+
+def get_price_map(stock_codes: List[str]) -> Dict[str, float]:
+    """
+    Latest price per code. Fresh entries come from the cache, expired ones are
+    returned as-is and refreshed in the background, and only codes that were
+    never fetched block on a download.
+    """
+    if not stock_codes:
+        return {}
+    codes = [str(c) for c in stock_codes]
+
+    out: Dict[str, float] = {}
+    missing: List[str] = []
+    stale: List[str] = []
+    for code in codes:
+        entry = _PRICE_CACHE.get_entry(code)
+        if entry is None:
+            missing.append(code)
+            continue
+        out[code] = float(entry.value)
+        if not entry.is_fresh():
+            stale.append(code)
+
+    if stale:
+        _refresh_in_background(stale)
+    if missing:
+        out.update(_fetch_latest_prices(missing))
+        # provider down: fall back to the last stored daily close
+        with _HIST_LOCK:
+            for code in missing:
+                hist = _HIST_SERIES.get(code)
+                if code not in out and hist is not None and not hist["data"].empty:
+                    out[code] = float(hist["data"].iloc[-1])
+
+    return {c: out[c] for c in codes if c in out}
+
+
+def fill_missing_prices(
+    price_map: Dict[str, float],
+    transactions_df: pd.DataFrame,
+    as_of_date: Optional[str] = None,
+) -> Dict[str, float]:
+    """
+    Use the last trade price (on or before `as_of_date`) for codes without a
+    market price, divided by the splits after that trade so it values the
+    split-adjusted quantities the ledgers hold.
+    """
+    if transactions_df is None or transactions_df.empty:
+        return dict(price_map)
+
+    df = transactions_df[[Columns.DATE, Columns.STOCK_CODE, Columns.PRICE_PER_SHARE]].copy()
+    df[Columns.DATE] = to_dt(df[Columns.DATE])
+    df[Columns.STOCK_CODE] = as_str_codes(df[Columns.STOCK_CODE])
+    df = df[~df[Columns.STOCK_CODE].isin(list(price_map))]
+    if as_of_date:
+        df = df[df[Columns.DATE] <= to_dt(as_of_date)]
+    df[Columns.PRICE_PER_SHARE] = pd.to_numeric(df[Columns.PRICE_PER_SHARE], errors="coerce")
+    df = df.dropna(subset=[Columns.PRICE_PER_SHARE])
+
+    out = dict(price_map)
+    if df.empty:
+        return out
+    sort_cols = [Columns.DATE, "id"] if "id" in transactions_df.columns else [Columns.DATE]
+    if "id" in sort_cols:
+        df["id"] = transactions_df.loc[df.index, "id"]
+    last = df.sort_values(sort_cols).groupby(Columns.STOCK_CODE, observed=True)[[Columns.DATE, Columns.PRICE_PER_SHARE]].last()
+    for code, (traded, px) in zip(last.index, last.itertuples(index=False)):
+        splits = get_stock_splits(code)
+        if splits is not None and not splits.empty:
+            # same UTC comparison as record_stock_split_adjustments
+            traded = traded.tz_localize("UTC") if traded.tzinfo is None else traded.tz_convert("UTC")
+            px = px / float(splits[splits.index > traded].prod())
+        out[str(code)] = float(px)
     return out
 
 
+def _history_covers(entry: Optional[Dict[str, Any]], end_dt: Optional[pd.Timestamp], now: float) -> bool:
+    if entry is None:
+        return False
+    if end_dt is not None and end_dt <= entry["through"]:
+        return True
+    return now - float(entry["ts"]) < CACHE_TTL_SEC
+
+
+def _load_price_history(codes: List[str]) -> None:
+    """Fetch full history for new codes and only the tail for codes already loaded."""
+
+    def fetch(keys: List[Hashable]) -> Dict[Hashable, Any]:
+        codes = [k[1] for k in keys]
+        with _HIST_LOCK:
+            last_dates = {
+                c: _HIST_SERIES[c]["data"].index[-1]
+                for c in codes
+                if c in _HIST_SERIES and not _HIST_SERIES[c]["data"].empty
+            }
+        now = time.time()
+        through = pd.Timestamp.today().normalize() - pd.Timedelta(days=1)
+
+        provider = get_provider()
+        batches = []
+        new_codes = [c for c in codes if c not in last_dates]
+        if new_codes:
+            tickers = [_to_yf_ticker_jp(c) for c in new_codes]
+            batches.append((new_codes, provider.get_close_history(tickers, period="max")))
+        tail_codes = [c for c in codes if c in last_dates]
+        if tail_codes:
+            tickers = [_to_yf_ticker_jp(c) for c in tail_codes]
+            start = min(last_dates[c] for c in tail_codes).strftime("%Y-%m-%d")
+            batches.append((tail_codes, provider.get_close_history(tickers, start=start)))
+
+        fetched: Dict[Hashable, Any] = {}
+        for batch_codes, data in batches:
+            for code in batch_codes:
+                tk = _to_yf_ticker_jp(code)
+                s = data[tk].dropna().astype(float) if tk in data.columns else pd.Series(dtype=float)
+                with _HIST_LOCK:
+                    old = _HIST_SERIES.get(code, {}).get("data")
+                    if old is not None and not old.empty:
+                        s = pd.concat([old[old.index < s.index[0]], s]) if not s.empty else old
+                    _HIST_SERIES[code] = {"ts": now, "through": through, "data": s.sort_index()}
+                fetched[("history", code)] = len(s)
+        return fetched
+
+    _single_flight([("history", c) for c in codes], fetch)
+
+
+def get_price_history(
+    stock_codes: List[str],
+    end_date: Optional[str] = None,
+) -> Dict[str, pd.Series]:
+    """
+    Cached daily closes per code. Downloads only when the cache cannot answer
+    `end_date` (default: today); otherwise no network call is made.
+    """
+    codes = [str(c) for c in dict.fromkeys(stock_codes)]
+    end_dt = pd.to_datetime(end_date, errors="coerce") if end_date else None
+    if end_dt is not None and pd.isna(end_dt):
+        end_dt = None
+    now = time.time()
+
+    with _HIST_LOCK:
+        missing = [c for c in codes if not _history_covers(_HIST_SERIES.get(c), end_dt, now)]
+    if missing:
+        try:
+            _load_price_history(missing)
+        except Exception as e:
+            print(f"Warning: Failed to download historical prices: {e}")
+
+    with _HIST_LOCK:
+        return {c: _HIST_SERIES[c]["data"] for c in codes if c in _HIST_SERIES}
+
+
 def get_price_map_asof(stock_codes: List[str], end_date: str) -> Dict[str, float]:
+    """Close on `end_date`, or on the previous trading day when it is a holiday."""
     if not stock_codes or not end_date:
         return {}
 
     end_dt = pd.to_datetime(end_date, errors="coerce")
     if pd.isna(end_dt):
         return {}
-
-    start = end_dt.strftime("%Y-%m-%d")
-    end = (end_dt + pd.Timedelta(days=1)).strftime("%Y-%m-%d")
+    end_dt = end_dt.normalize()
 
     result: Dict[str, float] = {}
-    missing: List[str] = []
+    for code, s in get_price_history(stock_codes, end_date=end_dt).items():
+        pos = s.index.searchsorted(end_dt, side="right") - 1
+        if pos >= 0:
+            result[code] = float(s.iloc[pos])
+    return result
 
-    for code in stock_codes:
-        key = (start, str(code))
-        if key in _HIST_PRICE_CACHE:
-            result[str(code)] = float(_HIST_PRICE_CACHE[key])
-        else:
-            missing.append(str(code))
 
-    if not missing:
-        return result
+@dataclass(frozen=True)
+class PriceMatrix:
+    """Closes on a shared calendar: values[i, j] is the close of codes[j] on dates[i]."""
 
-    tickers = [_to_yf_ticker_jp(c) for c in missing]
-    try:
-        data = yf.download(
-            tickers=tickers,
-            start=start,
-            end=end,
-            interval="1d",
-            progress=False,
-            group_by="ticker",
-            auto_adjust=False,
-            threads=True,
+    values: np.ndarray
+    dates: pd.DatetimeIndex
+    codes: List[str]
+    # last date the data is known to be complete for (may be a holiday after dates[-1])
+    through: Optional[pd.Timestamp] = None
+
+    def covers(self, codes: List[str], start: Optional[pd.Timestamp], end: Optional[pd.Timestamp]) -> bool:
+        if len(self.dates) == 0 or not set(codes).issubset(self.codes):
+            return False
+        if start is not None and start < self.dates[0]:
+            return False
+        if end is not None and end > (self.through if self.through is not None else self.dates[-1]):
+            return False
+        return True
+
+    def select(
+        self,
+        codes: List[str],
+        start: Optional[pd.Timestamp] = None,
+        end: Optional[pd.Timestamp] = None,
+    ) -> "PriceMatrix":
+        # row slices stay views (no copy for memory-mapped data); reordering columns copies
+        lo = self.dates.searchsorted(start, side="left") if start is not None else 0
+        hi = self.dates.searchsorted(end, side="right") if end is not None else len(self.dates)
+        values = self.values[lo:hi]
+        if list(codes) != list(self.codes):
+            pos = {c: i for i, c in enumerate(self.codes)}
+            values = values[:, [pos[c] for c in codes]]
+        return PriceMatrix(values=values, dates=self.dates[lo:hi], codes=list(codes), through=self.through)
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame(self.values, index=self.dates, columns=self.codes)
+
+
+def _matrix_meta_path(npy_path: str) -> str:
+    return os.path.splitext(npy_path)[0] + ".json"
+
+
+def save_price_matrix(matrix: PriceMatrix, npy_path: str) -> None:
+    folder = os.path.dirname(npy_path)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder)
+    # write aside and rename: readers may still have the previous file memory-mapped
+    tmp_npy = npy_path + ".tmp.npy"
+    tmp_meta = _matrix_meta_path(npy_path) + ".tmp"
+    np.save(tmp_npy, np.ascontiguousarray(matrix.values, dtype=np.float64))
+    with open(tmp_meta, "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "codes": list(matrix.codes),
+                "dates": [d.strftime("%Y-%m-%d") for d in matrix.dates],
+                "through": matrix.through.strftime("%Y-%m-%d") if matrix.through is not None else None,
+            },
+            f,
         )
-    except Exception as e:
-        print(f"Warning: Failed to download historical prices: {e}")
-        return result
+    os.replace(tmp_npy, npy_path)
+    os.replace(tmp_meta, _matrix_meta_path(npy_path))
 
-    for code, tk in zip(missing, tickers):
-        px = None
-        try:
-            if len(tickers) == 1:
-                px = float(data["Close"].dropna().iloc[-1])
-            else:
-                px = float(data[(tk, "Close")].dropna().iloc[-1])
-        except Exception:
-            px = None
-
-        if px is not None:
-            key = (start, str(code))
-            _HIST_PRICE_CACHE[key] = px
-            result[str(code)] = px
 
-    return result
+def load_price_matrix(npy_path: str, mmap: bool = True) -> PriceMatrix:
+    values = np.load(npy_path, mmap_mode="r" if mmap else None)
+    with open(_matrix_meta_path(npy_path), encoding="utf-8") as f:
+        meta = json.load(f)
+    return PriceMatrix(
+        values=values,
+        dates=pd.DatetimeIndex(pd.to_datetime(meta["dates"])),
+        codes=list(meta["codes"]),
+        through=pd.Timestamp(meta["through"]) if meta.get("through") else None,
+    )
+
+
+def _build_price_matrix(codes: List[str], end_dt: Optional[pd.Timestamp]) -> PriceMatrix:
+    history = get_price_history(codes, end_date=end_dt.strftime("%Y-%m-%d") if end_dt is not None else None)
+    frame = pd.DataFrame(
+        {c: history.get(c, pd.Series(dtype=float)) for c in codes},
+        columns=codes,
+        dtype=float,
+    ).sort_index()
+    # fill before slicing so the first row inherits the last close before `start`
+    frame = frame.ffill()
+    if end_dt is not None:
+        frame = frame[frame.index <= end_dt]
+
+    through = end_dt
+    if through is None or through > pd.Timestamp.today().normalize() - pd.Timedelta(days=1):
+        through = frame.index[-1] if len(frame) else None
+    return PriceMatrix(
+        values=frame.to_numpy(dtype=np.float64),
+        dates=pd.DatetimeIndex(frame.index),
+        codes=codes,
+        through=through,
+    )
+
+
+def _merge_price_matrices(stored: PriceMatrix, added: PriceMatrix) -> PriceMatrix:
+    """`stored` plus the columns of `added` (built through the same date) on the union calendar."""
+    frame = pd.concat([stored.to_frame(), added.to_frame()], axis=1).sort_index().ffill()
+    return PriceMatrix(
+        values=frame.to_numpy(dtype=np.float64),
+        dates=pd.DatetimeIndex(frame.index),
+        codes=list(stored.codes) + list(added.codes),
+        through=stored.through,
+    )
+
+
+def get_price_matrix(
+    stock_codes: List[str],
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    npy_path: Optional[str] = None,
+    refresh: bool = False,
+) -> PriceMatrix:
+    """
+    Date x code float64 closes on the union of the codes' trading days within
+    [start, end], forward-filled across gaps (NaN before a code's first close).
+    With `npy_path`, a saved matrix that covers the request is memory-mapped
+    instead of rebuilt. Otherwise the request is merged into the saved matrix
+    (new codes are added as columns, a later `end` rebuilds every saved code
+    through it) and written back, so callers with different universes share
+    one file instead of evicting each other's codes.
+    """
+    codes = [str(c) for c in dict.fromkeys(stock_codes)]
+    start_dt = pd.to_datetime(start).normalize() if start else None
+    end_dt = pd.to_datetime(end).normalize() if end else None
+
+    stored = None
+    if npy_path and os.path.exists(npy_path) and os.path.exists(_matrix_meta_path(npy_path)):
+        stored = load_price_matrix(npy_path, mmap=True)
+        if not refresh and stored.covers(codes, start_dt, end_dt):
+            return stored.select(codes, start_dt, end_dt)
+
+    new_codes = codes if stored is None else [c for c in codes if c not in stored.codes]
+    if (
+        stored is not None and not refresh and stored.through is not None
+        and end_dt is not None and end_dt <= stored.through
+    ):
+        # dates are already known: only the new codes need building
+        matrix = _merge_price_matrices(stored, _build_price_matrix(new_codes, stored.through))
+    else:
+        kept = [] if stored is None else [c for c in stored.codes if c not in codes]
+        matrix = _build_price_matrix(codes + kept, end_dt)
+    if npy_path:
+        save_price_matrix(matrix, npy_path)
+    return matrix.select(codes, start_dt, end_dt)
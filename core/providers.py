@@ -0,0 +1,217 @@
+from __future__ import annotations
+
+import os
+import re
+from typing import Dict, List, Optional, Protocol
+import pandas as pd
+import yfinance as yf
+
+from core import config
+from core.resilience import ResilientProvider
+
+
+class PriceProvider(Protocol):
+    """Source of daily closes and split history for yfinance-style tickers."""
+
+    name: str
+
+    def get_close_history(
+        self,
+        tickers: List[str],
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        period: Optional[str] = None,
+    ) -> pd.DataFrame:
+        """Return a date x ticker frame of daily closes (end is exclusive)."""
+        ...
+
+    def get_splits(self, ticker: str) -> pd.Series:
+        """Return split ratios indexed by tz-aware split date."""
+        ...
+
+
+def _empty_close_frame(tickers: List[str]) -> pd.DataFrame:
+    return pd.DataFrame(columns=list(tickers), index=pd.DatetimeIndex([]), dtype=float)
+
+
+def _naive_index(index) -> pd.DatetimeIndex:
+    idx = pd.DatetimeIndex(pd.to_datetime(index))
+    if idx.tz is not None:
+        idx = idx.tz_localize(None)
+    return idx
+
+
+class YFinanceProvider:
+    name = "yfinance"
+
+    def get_close_history(
+        self,
+        tickers: List[str],
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        period: Optional[str] = None,
+    ) -> pd.DataFrame:
+        tickers = list(tickers)
+        if not tickers:
+            return _empty_close_frame(tickers)
+
+        kwargs = {"start": start, "end": end, "period": period}
+        data = yf.download(
+            tickers=tickers,
+            interval="1d",
+            progress=False,
+            group_by="ticker",
+            auto_adjust=False,
+            threads=True,
+            **{k: v for k, v in kwargs.items() if v is not None},
+        )
+        return self._extract_close(data, tickers)
+
+    @staticmethod
+    def _extract_close(data: pd.DataFrame, tickers: List[str]) -> pd.DataFrame:
+        if not isinstance(data, pd.DataFrame) or data.empty:
+            return _empty_close_frame(tickers)
+
+        out: Dict[str, pd.Series] = {}
+        if isinstance(data.columns, pd.MultiIndex):
+            for tk in tickers:
+                for field in ("Close", "Adj Close"):
+                    if (tk, field) in data.columns:
+                        out[tk] = data[(tk, field)]
+                        break
+                    if (field, tk) in data.columns:
+                        out[tk] = data[(field, tk)]
+                        break
+        elif len(tickers) == 1:
+            for field in ("Close", "Adj Close"):
+                if field in data.columns:
+                    out[tickers[0]] = data[field]
+                    break
+
+        frame = pd.DataFrame(out, columns=tickers, dtype=float)
+        frame.index = _naive_index(frame.index)
+        return frame
+
+    def get_splits(self, ticker: str) -> pd.Series:
+        splits = yf.Ticker(ticker).splits
+        if splits is None:
+            return pd.Series(dtype=float)
+        return splits
+
+
+class LocalFixtureProvider:
+    """
+    Deterministic provider backed by files under `root`:
+      <root>/<ticker>.csv|.parquet         columns: date, close
+      <root>/splits/<ticker>.csv|.parquet  columns: date, ratio
+    Missing files behave like a ticker with no data.
+    """
+
+    name = "local"
+
+    def __init__(self, root: Optional[str] = None):
+        self.root = root or config.PRICE_FIXTURES_DIR
+        self._frames: Dict[str, pd.DataFrame] = {}
+
+    def _find(self, folder: str, ticker: str) -> Optional[str]:
+        for ext in (".parquet", ".csv"):
+            path = os.path.join(folder, f"{ticker}{ext}")
+            if os.path.exists(path):
+                return path
+        return None
+
+    def _read(self, path: str) -> pd.DataFrame:
+        df = pd.read_parquet(path) if path.endswith(".parquet") else pd.read_csv(path)
+        df.columns = [str(c).strip().lower() for c in df.columns]
+        return df
+
+    def _load_closes(self, ticker: str) -> pd.Series:
+        if ticker not in self._frames:
+            path = self._find(self.root, ticker)
+            if path is None:
+                self._frames[ticker] = pd.DataFrame(
+                    columns=["close"], index=pd.DatetimeIndex([]), dtype=float
+                )
+            else:
+                df = self._read(path)
+                df.index = _naive_index(df["date"])
+                self._frames[ticker] = df[["close"]].astype(float).sort_index()
+        return self._frames[ticker]["close"]
+
+    @staticmethod
+    def _apply_period(s: pd.Series, period: Optional[str]) -> pd.Series:
+        if not period or period == "max" or s.empty:
+            return s
+        m = re.fullmatch(r"(\d+)(d|wk|mo|y)", period)
+        if not m:
+            raise ValueError(f"Unsupported period: {period}")
+        n, unit = int(m.group(1)), m.group(2)
+        if unit == "d":
+            return s.iloc[-n:]
+        offset = {
+            "wk": pd.DateOffset(weeks=n),
+            "mo": pd.DateOffset(months=n),
+            "y": pd.DateOffset(years=n),
+        }[unit]
+        return s[s.index > s.index[-1] - offset]
+
+    def get_close_history(
+        self,
+        tickers: List[str],
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        period: Optional[str] = None,
+    ) -> pd.DataFrame:
+        tickers = list(tickers)
+        if not tickers:
+            return _empty_close_frame(tickers)
+
+        out: Dict[str, pd.Series] = {}
+        for tk in tickers:
+            s = self._load_closes(tk)
+            if start:
+                s = s[s.index >= pd.to_datetime(start)]
+            if end:
+                s = s[s.index < pd.to_datetime(end)]
+            out[tk] = self._apply_period(s, period)
+
+        frame = pd.DataFrame(out, columns=tickers, dtype=float)
+        frame.index = _naive_index(frame.index)
+        return frame.sort_index()
+
+    def get_splits(self, ticker: str) -> pd.Series:
+        path = self._find(os.path.join(self.root, "splits"), ticker)
+        if path is None:
+            return pd.Series(dtype=float)
+        df = self._read(path)
+        idx = pd.to_datetime(df["date"])
+        idx = idx.dt.tz_localize("UTC") if idx.dt.tz is None else idx.dt.tz_convert("UTC")
+        return pd.Series(df["ratio"].astype(float).values, index=pd.DatetimeIndex(idx)).sort_index()
+
+
+_PROVIDERS = {
+    YFinanceProvider.name: YFinanceProvider,
+    LocalFixtureProvider.name: LocalFixtureProvider,
+}
+
+_ACTIVE_PROVIDER: Optional[PriceProvider] = None
+
+
+def make_provider(name: str) -> PriceProvider:
+    try:
+        return _PROVIDERS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown price provider: {name!r} (expected one of {sorted(_PROVIDERS)})")
+
+
+def get_provider() -> PriceProvider:
+    global _ACTIVE_PROVIDER
+    if _ACTIVE_PROVIDER is None:
+        _ACTIVE_PROVIDER = ResilientProvider(make_provider(config.PRICE_PROVIDER))
+    return _ACTIVE_PROVIDER
+
+
+def set_provider(provider: Optional[PriceProvider]) -> None:
+    """Override the active provider (None re-reads config on next use)."""
+    global _ACTIVE_PROVIDER
+    _ACTIVE_PROVIDER = provider
@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import threading
+import time
+from datetime import time as dtime
+from typing import Callable, Dict, List, Optional
+import pandas as pd
+
+from core import config
+from core.prices import refresh_prices
+
+TSE_TZ = "Asia/Tokyo"
+# morning / afternoon sessions (close moved to 15:30 in Nov 2024); holidays are not modelled
+TSE_SESSIONS = (
+    (dtime(9, 0), dtime(11, 30)),
+    (dtime(12, 30), dtime(15, 30)),
+)
+
+
+def _tokyo_now(now: Optional[pd.Timestamp] = None) -> pd.Timestamp:
+    if now is None:
+        return pd.Timestamp.now(tz=TSE_TZ)
+    now = pd.Timestamp(now)
+    return now.tz_localize(TSE_TZ) if now.tz is None else now.tz_convert(TSE_TZ)
+
+
+def is_tse_trading_time(now: Optional[pd.Timestamp] = None) -> bool:
+    t = _tokyo_now(now)
+    if t.weekday() >= 5:
+        return False
+    return any(open_ <= t.time() < close for open_, close in TSE_SESSIONS)
+
+
+def seconds_until_next_session(now: Optional[pd.Timestamp] = None) -> float:
+    t = _tokyo_now(now)
+    day = t.normalize()
+    for _ in range(8):
+        if day.weekday() < 5:
+            for open_, _close in TSE_SESSIONS:
+                start = day + pd.Timedelta(hours=open_.hour, minutes=open_.minute)
+                if start > t:
+                    return (start - t).total_seconds()
+        day += pd.Timedelta(days=1)
+    return 7 * 24 * 60 * 60.0
+
+
+class PriceRefresher:
+    """
+    Daemon thread that keeps the latest-price cache warm so dashboard callbacks
+    never block on a download. Refreshes `codes_fn()` every `interval_sec` while
+    the TSE is open, plus once at startup and once right after each close.
+    """
+
+    def __init__(
+        self,
+        codes_fn: Callable[[], List[str]],
+        interval_sec: float = config.PRICE_REFRESH_INTERVAL_SEC,
+        warmup_codes_fn: Optional[Callable[[], List[str]]] = None,
+    ):
+        self.codes_fn = codes_fn
+        self.warmup_codes_fn = warmup_codes_fn or codes_fn
+        self.interval_sec = float(interval_sec)
+        self.last_success: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.last_error_at: Optional[float] = None
+        self.last_count = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _entry_ttl(self) -> float:
+        # outside trading hours prices cannot move, so keep them until the next open
+        if is_tse_trading_time():
+            return self.interval_sec * 2
+        return seconds_until_next_session() + self.interval_sec
+
+    def refresh_once(self, codes_fn: Optional[Callable[[], List[str]]] = None) -> bool:
+        try:
+            codes = list((codes_fn or self.codes_fn)())
+            if codes:
+                self.last_count = len(refresh_prices(codes, ttl_sec=self._entry_ttl()))
+            self.last_success = time.time()
+            return True
+        except Exception as e:
+            self.last_error = str(e)
+            self.last_error_at = time.time()
+            print(f"Warning: Background price refresh failed: {e}")
+            return False
+
+    def _run(self) -> None:
+        self.refresh_once(self.warmup_codes_fn)
+        was_open = is_tse_trading_time()
+        while not self._stop.wait(self.interval_sec):
+            is_open = is_tse_trading_time()
+            if is_open or was_open:
+                self.refresh_once()
+            was_open = is_open
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="price-refresher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def status(self) -> Dict[str, object]:
+        return {
+            "running": self._thread is not None and self._thread.is_alive(),
+            "last_success": self.last_success,
+            "last_error": self.last_error,
+            "last_error_at": self.last_error_at,
+            "last_count": self.last_count,
+        }
+
+
+_REFRESHER: Optional[PriceRefresher] = None
+
+
+def start_price_refresher(
+    codes_fn: Callable[[], List[str]],
+    interval_sec: float = config.PRICE_REFRESH_INTERVAL_SEC,
+    warmup_codes_fn: Optional[Callable[[], List[str]]] = None,
+) -> PriceRefresher:
+    global _REFRESHER
+    if _REFRESHER is None:
+        _REFRESHER = PriceRefresher(codes_fn, interval_sec=interval_sec, warmup_codes_fn=warmup_codes_fn)
+    _REFRESHER.start()
+    return _REFRESHER
+
+
+def get_refresher_status() -> Optional[Dict[str, object]]:
+    return _REFRESHER.status() if _REFRESHER is not None else None
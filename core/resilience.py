@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, List, Optional
+import pandas as pd
+
+from core import config
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+class CallTimeoutError(TimeoutError):
+    pass
+
+
+class CircuitBreaker:
+    """
+    closed -> open after `failure_threshold` consecutive failures; while open every
+    call fails fast. After `reset_timeout_sec` one trial call is let through
+    (half-open): success closes the breaker, failure re-opens it.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout_sec: float = 60.0):
+        self.failure_threshold = int(failure_threshold)
+        self.reset_timeout_sec = float(reset_timeout_sec)
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.time() - self.opened_at >= self.reset_timeout_sec:
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    print(f"Warning: Market data circuit opened after {self.failures} failures")
+                self.state = self.OPEN
+                self.opened_at = time.time()
+
+
+# hung calls cannot be killed; they keep a worker until the library gives up
+_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix="market-data")
+
+
+def call_with_deadline(fn: Callable[..., Any], timeout_sec: Optional[float], *args, **kwargs) -> Any:
+    if not timeout_sec:
+        return fn(*args, **kwargs)
+    future = _EXECUTOR.submit(fn, *args, **kwargs)
+    try:
+        return future.result(timeout=timeout_sec)
+    except FutureTimeoutError:
+        future.cancel()
+        raise CallTimeoutError(f"{getattr(fn, '__name__', 'call')} exceeded {timeout_sec:.1f}s")
+
+
+def call_resilient(
+    fn: Callable[..., Any],
+    *args,
+    breaker: Optional[CircuitBreaker] = None,
+    timeout_sec: Optional[float] = config.MARKET_DATA_TIMEOUT_SEC,
+    retries: int = config.MARKET_DATA_RETRIES,
+    backoff_sec: float = config.MARKET_DATA_BACKOFF_SEC,
+    deadline_sec: Optional[float] = config.MARKET_DATA_DEADLINE_SEC,
+    **kwargs,
+) -> Any:
+    """
+    Call `fn` with a per-attempt timeout and up to `retries` retries using
+    exponential backoff, never starting an attempt that cannot finish within
+    `deadline_sec` overall. Fails fast with CircuitOpenError while `breaker` is open.
+    The breaker counts one failure per call, once all attempts are spent.
+    """
+    if breaker is not None and not breaker.allow():
+        raise CircuitOpenError("market data circuit is open")
+    started = time.time()
+    attempt = 0
+    while True:
+        try:
+            result = call_with_deadline(fn, timeout_sec, *args, **kwargs)
+        except Exception:
+            delay = backoff_sec * (2 ** attempt)
+            elapsed = time.time() - started
+            out_of_budget = deadline_sec is not None and elapsed + delay + (timeout_sec or 0.0) > deadline_sec
+            if attempt >= retries or out_of_budget:
+                if breaker is not None:
+                    breaker.record_failure()
+                raise
+            attempt += 1
+            time.sleep(delay)
+            continue
+        if breaker is not None:
+            breaker.record_success()
+        return result
+
+
+class ResilientProvider:
+    """PriceProvider wrapper adding deadlines, retries and a shared circuit breaker."""
+
+    def __init__(self, inner, breaker: Optional[CircuitBreaker] = None, **policy):
+        self.inner = inner
+        self.name = inner.name
+        self.breaker = breaker or CircuitBreaker(
+            failure_threshold=config.MARKET_DATA_BREAKER_THRESHOLD,
+            reset_timeout_sec=config.MARKET_DATA_BREAKER_RESET_SEC,
+        )
+        self.policy = policy
+
+    def get_close_history(
+        self,
+        tickers: List[str],
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        period: Optional[str] = None,
+    ) -> pd.DataFrame:
+        return call_resilient(
+            self.inner.get_close_history, tickers, start=start, end=end, period=period,
+            breaker=self.breaker, **self.policy,
+        )
+
+    def get_splits(self, ticker: str) -> pd.Series:
+        return call_resilient(self.inner.get_splits, ticker, breaker=self.breaker, **self.policy)
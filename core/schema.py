@@ -2,6 +2,7 @@ from __future__ import annotations
 
 from dataclasses import dataclass
 from typing import Iterable, List
+import numpy as np
 import pandas as pd
 
 from core.constants import Columns
@@ -71,6 +72,68 @@ class RealizedWindowInputSchema:
     )
 
 
+# dtype contract of transaction frames returned by the db loaders
+TRANSACTION_DTYPES = {
+    "id": "int64",
+    Columns.ACCOUNT_ID: "category",
+    Columns.ACCOUNT: "category",
+    Columns.DATE: "datetime64[ns]",
+    Columns.STOCK_CODE: "category",
+    Columns.STOCK_NAME: "category",
+    Columns.TRADE_TYPE: "category",
+    Columns.QUANTITY: "int64",
+    Columns.PRICE_PER_SHARE: "float64",
+    Columns.TOTAL_AMOUNT: "int64",  # integer yen
+    Columns.SETTLEMENT_DATE: "datetime64[ns]",
+    Columns.FEE: "int64",
+}
+
+
+def coerce_transactions(df: pd.DataFrame) -> pd.DataFrame:
+    """Cast the known columns of `df` to TRANSACTION_DTYPES (in place); typed columns are left alone."""
+    for col, dtype in TRANSACTION_DTYPES.items():
+        if col not in df.columns or str(df[col].dtype) == dtype:
+            continue
+        s = df[col]
+        if dtype.startswith("datetime64"):
+            df[col] = pd.to_datetime(s, errors="coerce").astype(dtype)
+        elif dtype == "category":
+            df[col] = s.astype(str).where(s.notna()).astype("category")
+        elif dtype == "int64":
+            df[col] = pd.to_numeric(s, errors="coerce").fillna(0).round().astype("int64")
+        else:
+            df[col] = pd.to_numeric(s, errors="coerce").astype(dtype)
+    return df
+
+
+def yen_array(s: pd.Series) -> np.ndarray:
+    """int64 yen/share counts; typed columns are returned without conversion."""
+    if s.dtype == "int64":
+        return s.to_numpy()
+    return pd.to_numeric(s, errors="coerce").fillna(0).round().to_numpy(dtype=np.int64)
+
+
+def share_array(s: pd.Series) -> np.ndarray:
+    """
+    Share counts: int64 when every value is whole (typed columns, or splits
+    with whole ratios), float64 otherwise. Split-adjusted quantities are only
+    integral by luck (reverse or odd-ratio splits), so they are never rounded.
+    """
+    if s.dtype == "int64":
+        return s.to_numpy()
+    values = pd.to_numeric(s, errors="coerce").fillna(0).to_numpy(dtype=float)
+    if np.array_equal(values, np.trunc(values)):
+        return values.astype(np.int64)
+    return values
+
+
+def as_str_codes(s: pd.Series) -> pd.Series:
+    """Stock codes as strings; categorical (typed) columns already are."""
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        return s
+    return s.astype(str)
+
+
 def missing_columns(df: pd.DataFrame, required: Iterable[str]) -> List[str]:
     if df is None:
         return list(required)
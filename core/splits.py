@@ -3,9 +3,9 @@ from __future__ import annotations
 import time
 from typing import Dict
 import pandas as pd
-import yfinance
 
 from core.constants import Columns
+from core.providers import get_provider
 
 _SPLIT_CACHE: Dict[str, Dict[str, object]] = {
     # "7203.T": {"ts": 0.0, "data": pd.Series(...)}
@@ -13,14 +13,14 @@ _SPLIT_CACHE: Dict[str, Dict[str, object]] = {
 SPLIT_CACHE_TTL_SEC = 24 * 60 * 60  # 24 hours
 
 
-def _get_splits_for_ticker(ticker: str) -> pd.Series:
+def _get_splits_for_ticker(ticker: str, raise_on_error: bool = False) -> pd.Series:
     now = time.time()
     cached = _SPLIT_CACHE.get(ticker)
     if cached and (now - float(cached.get("ts", 0.0)) < SPLIT_CACHE_TTL_SEC):
         return cached.get("data", pd.Series(dtype=float))
 
     try:
-        splits = yfinance.Ticker(ticker).splits
+        splits = get_provider().get_splits(ticker)
         if splits is None:
             splits = pd.Series(dtype=float)
         _SPLIT_CACHE[ticker] = {"ts": now, "data": splits}
@@ -28,16 +28,45 @@ def _get_splits_for_ticker(ticker: str) -> pd.Series:
     except Exception as e:
         if cached and "data" in cached:
             return cached["data"]  # type: ignore[return-value]
+        if raise_on_error:
+            raise
         print(f"Warning: Failed to retrieve stock splits for {ticker}: {e}")
         return pd.Series(dtype=float)
 
 
+def get_stock_splits(stock_code, raise_on_error: bool = False) -> pd.Series:
+    """
+    Split ratios for a stock code (UTC-indexed), from the 24h cache when fresh.
+    A failed fetch with nothing cached returns an empty Series, or re-raises
+    with `raise_on_error` so callers can tell "no splits" from "unknown".
+    """
+    return _get_splits_for_ticker(f"{stock_code}.T", raise_on_error=raise_on_error)
+
+
+def seed_split_cache(stock_code, splits: pd.Series, fetched_at: float) -> bool:
+    """
+    Serve `splits` for `stock_code` as if fetched at `fetched_at` (until the TTL
+    runs out). Entries already in the cache win; returns whether it was seeded.
+    """
+    ticker = f"{stock_code}.T"
+    if ticker in _SPLIT_CACHE:
+        return False
+    _SPLIT_CACHE[ticker] = {"ts": float(fetched_at), "data": splits}
+    return True
+
+
+def clear_split_cache() -> None:
+    _SPLIT_CACHE.clear()
+
+
 def record_stock_split_adjustments(df: pd.DataFrame, stock_code) -> pd.DataFrame:
     stock_df = df[df[Columns.STOCK_CODE] == stock_code].copy()
     ticker = f"{stock_code}.T"
     try:
         splits = _get_splits_for_ticker(ticker)
         if splits is not None and not splits.empty:
+            # typed frames carry int64 quantities; adjusted ones become fractional-safe floats
+            stock_df[Columns.QUANTITY] = stock_df[Columns.QUANTITY].astype(float)
             dates = pd.to_datetime(stock_df[Columns.DATE], errors="coerce")
             if dates.dt.tz is None:
                 dates = dates.dt.tz_localize("UTC")
@@ -57,7 +86,7 @@ def record_stock_split_adjustments(df: pd.DataFrame, stock_code) -> pd.DataFrame
 
 def stocks_split_adjustments(df: pd.DataFrame) -> pd.DataFrame:
     adjusted_rows = []
-    for code, group in df.groupby(Columns.STOCK_CODE, sort=False):
+    for code, group in df.groupby(Columns.STOCK_CODE, sort=False, observed=True):
         adjusted_group = record_stock_split_adjustments(group, code)
         adjusted_rows.append(adjusted_group)
     adjusted_df = pd.concat(adjusted_rows, ignore_index=True)
@@ -0,0 +1,329 @@
+# data_handler/connection.py
+from __future__ import annotations
+
+import itertools
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from urllib.request import pathname2url
+
+from core import config
+
+# each thread leases one connection per db file. Connections are shared by all
+# threads through a small idle pool: when a thread finishes (Werkzeug runs every
+# request on a new thread), its lease goes back to the pool for the next one
+# instead of being closed, so requests do not pay for connect + PRAGMAs.
+_LOCAL = threading.local()
+# live leases (db file, connection, owning thread); close_connections() uses
+# them to release every handle before a file is deleted
+_ALL: List[Tuple[str, sqlite3.Connection, threading.Thread]] = []
+# idle connections per db file, at most config.SQLITE_POOL_SIZE each: key -> [(conn, generation)]
+_IDLE: Dict[str, List[Tuple[sqlite3.Connection, int]]] = {}
+_ALL_LOCK = threading.Lock()
+# bumped by close_connections(); other threads notice and reconnect lazily
+_GENERATION: Dict[str, int] = {}
+# optional in-memory copies of the data tables, one per db file (see get_read_connection)
+_MIRRORS: Dict[str, "_Mirror"] = {}
+_MIRROR_LOCK = threading.Lock()
+# last data_version check per mirror: key -> (monotonic time, _MIRROR_WRITES value seen)
+_MIRROR_CHECKS: Dict[str, Tuple[float, int]] = {}
+# committed data writes made by this process, per db file (see expire_read_mirror)
+_MIRROR_WRITES: Dict[str, int] = {}
+# memdb names are process-wide; each full copy gets a fresh one
+_MIRROR_IDS = itertools.count(1)
+
+
+def _apply_pragmas(conn: sqlite3.Connection) -> None:
+    # WAL lets dashboard reads run while an import is writing
+    conn.execute("PRAGMA journal_mode=WAL")
+    # NORMAL is durable across app crashes in WAL mode; only an OS crash can lose the last commit
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA cache_size={-int(config.SQLITE_CACHE_SIZE_KB)}")
+    conn.execute(f"PRAGMA mmap_size={int(config.SQLITE_MMAP_SIZE)}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA busy_timeout=5000")
+
+
+def get_connection(db_path: str = "data/portfolio.db") -> sqlite3.Connection:
+    """Pooled connection leased to the calling thread; do not close it, use close_connections()."""
+    key = os.path.abspath(db_path)
+    pool: Dict[str, Tuple[sqlite3.Connection, int]] = getattr(_LOCAL, "pool", None)
+    if pool is None:
+        pool = _LOCAL.pool = {}
+
+    gen = _GENERATION.get(key, 0)
+    cached = pool.get(key)
+    if cached is not None:
+        conn, conn_gen = cached
+        if conn_gen == gen and os.path.exists(key):
+            return conn
+        # closed elsewhere, or the file was removed behind our back (reset-db)
+        _discard(conn)
+        pool.pop(key, None)
+
+    conn = _lease(key, gen)
+    pool[key] = (conn, gen)
+    return conn
+
+
+def _lease(key: str, gen: int) -> sqlite3.Connection:
+    stale: List[sqlite3.Connection] = []
+    conn = None
+    with _ALL_LOCK:
+        # return connections of finished threads to the idle pool
+        for k, c, t in [e for e in _ALL if not e[2].is_alive()]:
+            idle = _IDLE.setdefault(k, [])
+            if not c.in_transaction and len(idle) < config.SQLITE_POOL_SIZE:
+                idle.append((c, _GENERATION.get(k, 0)))
+            else:
+                stale.append(c)
+        _ALL[:] = [e for e in _ALL if e[2].is_alive()]
+        idle = _IDLE.get(key, [])
+        if not os.path.exists(key):
+            stale.extend(c for c, _ in idle)
+            idle.clear()
+        while idle and conn is None:
+            c, c_gen = idle.pop()
+            if c_gen == gen:
+                conn = c
+            else:
+                stale.append(c)
+        if conn is not None:
+            _ALL.append((key, conn, threading.current_thread()))
+    for c in stale:
+        _close_quietly(c)
+    if conn is not None:
+        return conn
+
+    conn = sqlite3.connect(key, check_same_thread=False)
+    _apply_pragmas(conn)
+    with _ALL_LOCK:
+        _ALL.append((key, conn, threading.current_thread()))
+    return conn
+
+
+def _meta_value(conn: sqlite3.Connection, key: str, schema: str = "main") -> int:
+    try:
+        row = conn.execute(f"SELECT value FROM {schema}.db_meta WHERE key = ?", (key,)).fetchone()
+    except sqlite3.OperationalError:
+        return 0
+    return int(row[0]) if row else 0
+
+
+def data_version(conn: sqlite3.Connection) -> int:
+    """The db_meta data_version counter (bumped once per data write transaction); 0 before init_db."""
+    return _meta_value(conn, "data_version")
+
+
+def bump_data_version(conn: sqlite3.Connection) -> None:
+    """Mark the versioned data tables as changed; run inside the write transaction."""
+    conn.execute("UPDATE db_meta SET value = value + 1 WHERE key = 'data_version'")
+
+
+def rewrite_version(conn: sqlite3.Connection) -> int:
+    """The db_meta rewrite_version counter (bumped when stored data rows are updated or deleted); 0 if never."""
+    return _meta_value(conn, "rewrite_version")
+
+
+def bump_rewrite_version(conn: sqlite3.Connection) -> None:
+    """
+    Mark a write that changed or removed stored rows of the versioned tables.
+    Incremental refreshes (daily_positions, the read mirror) only see appends
+    through id/count high-water marks; this tells them to rebuild instead.
+    """
+    conn.execute("""
+        INSERT INTO db_meta (key, value) VALUES ('rewrite_version', 1)
+        ON CONFLICT(key) DO UPDATE SET value = value + 1
+    """)
+
+
+def expire_read_mirror(db_path: str) -> None:
+    """Make the next get_read_connection re-check data_version; call after committing a data write."""
+    key = os.path.abspath(db_path)
+    with _MIRROR_LOCK:
+        _MIRROR_WRITES[key] = _MIRROR_WRITES.get(key, 0) + 1
+
+
+class _Mirror:
+    """
+    In-memory copy of one db file in a named memdb database. A loader
+    connection opens the file read-only with the copy ATTACHed as `mirror`
+    and applies refreshes; every reading thread opens its own connection to
+    the copy (see _mirror_reader), so readers never share a handle.
+    """
+
+    def __init__(self, key: str):
+        self.loader = sqlite3.connect(f"file:{pathname2url(key)}?mode=ro", uri=True, check_same_thread=False)
+        self.loader.isolation_level = None  # transactions are explicit below
+        self.loader.execute("PRAGMA busy_timeout=5000")
+        self.name: Optional[str] = None
+        self.version: Optional[int] = None
+        self.rewrites = 0
+        # versioned table -> (max id, row count) of the copy
+        self.marks: Dict[str, Tuple[int, int]] = {}
+
+    def refresh(self) -> None:
+        """Bring the copy up to the file: appended rows only, or a full copy after updates/deletes."""
+        if self.name is None or not self._append_new_rows():
+            self._copy_all()
+
+    def _append_new_rows(self) -> bool:
+        # imported here: migrations imports this module
+        from data_handler.migrations import VERSIONED_TABLES
+
+        conn = self.loader
+        # one read transaction: every table is copied from the same snapshot of the file
+        conn.execute("BEGIN")
+        try:
+            if rewrite_version(conn) != self.rewrites:
+                conn.execute("ROLLBACK")
+                return False
+            marks = {}
+            for table in VERSIONED_TABLES:
+                old_max, old_count = self.marks[table]
+                new_count = conn.execute(f"SELECT COUNT(*) FROM main.{table} WHERE id > ?", (old_max,)).fetchone()[0]
+                max_id, count = conn.execute(f"SELECT COALESCE(MAX(id), 0), COUNT(*) FROM main.{table}").fetchone()
+                # anything other than appends (deletes, rebuilt tables) changes history
+                if old_count + int(new_count) != int(count):
+                    conn.execute("ROLLBACK")
+                    return False
+                marks[table] = (int(max_id), int(count))
+            for table in VERSIONED_TABLES:
+                if marks[table][0] > self.marks[table][0]:
+                    conn.execute(f"INSERT INTO mirror.{table} SELECT * FROM main.{table} WHERE id > ?", (self.marks[table][0],))
+            conn.execute("INSERT OR REPLACE INTO mirror.db_meta SELECT * FROM main.db_meta")
+            version = data_version(conn)
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            # e.g. a migration changed a table's columns
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            return False
+        self.marks, self.version = marks, version
+        return True
+
+    def _copy_all(self) -> None:
+        from data_handler.migrations import VERSIONED_TABLES
+
+        # copy into a fresh database and swap it in, so readers still holding
+        # the previous copy are never disturbed mid-query
+        name = f"/portfolio-mirror-{next(_MIRROR_IDS)}"
+        uri = f"file:{name}?vfs=memdb"
+        # held open so the memdb exists across VACUUM INTO until the loader attaches it
+        target = sqlite3.connect(uri, uri=True)
+        try:
+            # one read transaction on the file; unlike backup() the copy is not left in WAL mode,
+            # which memdb cannot open
+            self.loader.execute("VACUUM INTO ?", (uri,))
+            if self.name is not None:
+                self.loader.execute("DETACH DATABASE mirror")
+            self.loader.execute("ATTACH DATABASE ? AS mirror", (uri,))
+        finally:
+            target.close()
+        self.name = name
+        # read back from the copy: a write may have landed while it was taken
+        self.version = _meta_value(self.loader, "data_version", "mirror")
+        self.rewrites = _meta_value(self.loader, "rewrite_version", "mirror")
+        self.marks = {
+            table: tuple(int(v) for v in self.loader.execute(
+                f"SELECT COALESCE(MAX(id), 0), COUNT(*) FROM mirror.{table}"
+            ).fetchone())
+            for table in VERSIONED_TABLES
+        }
+
+
+def _mirror_reader(key: str, mirror: _Mirror) -> sqlite3.Connection:
+    """The calling thread's own read-only connection to `mirror`'s current copy."""
+    readers: Dict[str, Tuple[str, sqlite3.Connection]] = getattr(_LOCAL, "mirror_readers", None)
+    if readers is None:
+        readers = _LOCAL.mirror_readers = {}
+    cached = readers.get(key)
+    if cached is not None and cached[0] == mirror.name:
+        return cached[1]
+    if cached is not None:
+        # drops this thread's hold on a replaced copy
+        _close_quietly(cached[1])
+    conn = sqlite3.connect(f"file:{mirror.name}?vfs=memdb", uri=True)
+    conn.execute("PRAGMA query_only=ON")
+    # a refresh commit briefly locks the copy
+    conn.execute("PRAGMA busy_timeout=5000")
+    readers[key] = (mirror.name, conn)
+    return conn
+
+
+def get_read_connection(db_path: str = "data/portfolio.db") -> sqlite3.Connection:
+    """
+    Connection for read-only queries on the versioned data tables. With
+    config.SQLITE_READ_MIRROR this is the calling thread's connection to an
+    in-memory copy of the file; otherwise it is the pooled file connection.
+    Never write through it.
+
+    When data_version moves, rows appended above each table's id high-water
+    mark are copied into the mirror; a delete, or an update flagged by
+    rewrite_version, copies the whole database into a fresh mirror instead.
+    The version itself is re-checked at most every
+    config.SQLITE_READ_MIRROR_CHECK_SEC, or right after a write from this
+    process (expire_read_mirror).
+    """
+    src = get_connection(db_path)
+    if not config.SQLITE_READ_MIRROR:
+        return src
+    key = os.path.abspath(db_path)
+    mirror = _MIRRORS.get(key)
+    writes = _MIRROR_WRITES.get(key, 0)
+    checked = _MIRROR_CHECKS.get(key)
+    if (
+        mirror is not None and checked is not None and checked[1] == writes
+        and time.monotonic() - checked[0] < config.SQLITE_READ_MIRROR_CHECK_SEC
+    ):
+        return _mirror_reader(key, mirror)
+
+    version = data_version(src)
+    if mirror is not None and mirror.version == version:
+        _MIRROR_CHECKS[key] = (time.monotonic(), writes)
+        return _mirror_reader(key, mirror)
+
+    with _MIRROR_LOCK:
+        mirror = _MIRRORS.get(key)
+        if mirror is None:
+            mirror = _MIRRORS[key] = _Mirror(key)
+        if mirror.version != version:
+            mirror.refresh()
+        _MIRROR_CHECKS[key] = (time.monotonic(), writes)
+    return _mirror_reader(key, mirror)
+
+
+def _close_quietly(conn: sqlite3.Connection) -> None:
+    try:
+        conn.close()
+    except sqlite3.Error:
+        pass
+
+
+def _discard(conn: sqlite3.Connection) -> None:
+    with _ALL_LOCK:
+        _ALL[:] = [e for e in _ALL if e[1] is not conn]
+    _close_quietly(conn)
+
+
+def close_connections(db_path: str = None) -> None:
+    """Close pooled connections for `db_path` (all files when None), leased or idle."""
+    key = os.path.abspath(db_path) if db_path else None
+    with _ALL_LOCK:
+        leased = [e for e in _ALL if key is None or e[0] == key]
+        _ALL[:] = [e for e in _ALL if not (key is None or e[0] == key)]
+        idle_keys = [k for k in _IDLE if key is None or k == key]
+        for k in {e[0] for e in leased} | set(idle_keys):
+            _GENERATION[k] = _GENERATION.get(k, 0) + 1
+        targets = [e[1] for e in leased]
+        for k in idle_keys:
+            targets.extend(c for c, _ in _IDLE.pop(k))
+    for conn in targets:
+        _close_quietly(conn)
+    with _MIRROR_LOCK:
+        for k in [k for k in _MIRRORS if key is None or k == key]:
+            # reader connections of other threads keep the copy alive until they move on
+            _close_quietly(_MIRRORS.pop(k).loader)
+            _MIRROR_CHECKS.pop(k, None)
@@ -1,31 +1,47 @@
 # data_handler/csv_parser.py
+import sqlite3
+
+import numpy as np
 import pandas as pd
 
+from core import config
 from core.constants import Columns, TradeType
 from core.schema import TransactionSchema, validate_schema
 
 
-def clean_sbi_transaction_csv(filepath_or_buffer, encoding="shift_jis"):
-    # Skip metadata and read from row 8 (0-indexed)
-    df = pd.read_csv(filepath_or_buffer, skiprows=8, encoding=encoding)
-
+TRANSACTION_CSV_COLUMNS = [
+    Columns.DATE,
+    Columns.STOCK_NAME,
+    Columns.STOCK_CODE,
+    Columns.MARKET,
+    Columns.TRADE_TYPE,
+    Columns.TERM,
+    Columns.ACCOUNT,
+    Columns.TAX,
+    Columns.QUANTITY,
+    Columns.PRICE_PER_SHARE,
+    Columns.FEE,
+    Columns.TAX_AMOUNT,
+    Columns.SETTLEMENT_DATE,
+    Columns.TOTAL_AMOUNT,
+]
+
+# Combine exact duplicate rows (same date, stock_code, trade_type, price_per_share, etc.);
+# fills in different tax buckets (特定/NISA) stay separate ledgers
+_FILL_GROUP_COLS = [
+    Columns.ACCOUNT,
+    Columns.DATE,
+    Columns.STOCK_CODE,
+    Columns.STOCK_NAME,
+    Columns.TRADE_TYPE,
+    Columns.PRICE_PER_SHARE,
+    Columns.SETTLEMENT_DATE,
+]
+
+
+def _normalize_transactions(df: pd.DataFrame) -> pd.DataFrame:
     # Rename columns to standard English
-    df.columns = [
-        Columns.DATE,
-        Columns.STOCK_NAME,
-        Columns.STOCK_CODE,
-        Columns.MARKET,
-        Columns.TRADE_TYPE,
-        Columns.TERM,
-        Columns.ACCOUNT,
-        Columns.TAX,
-        Columns.QUANTITY,
-        Columns.PRICE_PER_SHARE,
-        Columns.FEE,
-        Columns.TAX_AMOUNT,
-        Columns.SETTLEMENT_DATE,
-        Columns.TOTAL_AMOUNT,
-    ]
+    df.columns = TRANSACTION_CSV_COLUMNS
 
     # Strip whitespace and normalize
     df[Columns.DATE] = pd.to_datetime(df[Columns.DATE], format="%Y/%m/%d")
@@ -43,17 +59,12 @@ def clean_sbi_transaction_csv(filepath_or_buffer, encoding="shift_jis"):
 
     # Remove invalid rows (optional)
     df = df.dropna(subset=[Columns.DATE, Columns.STOCK_CODE, Columns.TRADE_TYPE, Columns.QUANTITY])
-    # print(df.head(3))  # Debug: print first few rows to verify
+    df[Columns.ACCOUNT] = df[Columns.ACCOUNT].fillna("").astype(str).str.strip()
+    return df
 
-    # Combine exact duplicate rows (same date, stock_code, trade_type, price_per_share, etc.)
-    group_cols = [
-        Columns.DATE,
-        Columns.STOCK_CODE,
-        Columns.STOCK_NAME,
-        Columns.TRADE_TYPE,
-        Columns.PRICE_PER_SHARE,
-        Columns.SETTLEMENT_DATE,
-    ]
+
+def _merge_fills(df: pd.DataFrame) -> pd.DataFrame:
+    # sums and "first" re-aggregate cleanly, so partially merged frames can be merged again
     agg_dict = {
         Columns.QUANTITY: "sum",
         Columns.TOTAL_AMOUNT: "sum",
@@ -61,16 +72,95 @@ def clean_sbi_transaction_csv(filepath_or_buffer, encoding="shift_jis"):
     }
     # For other columns, keep the first value
     for col in df.columns:
-        if col not in group_cols and col not in agg_dict:
+        if col not in _FILL_GROUP_COLS and col not in agg_dict:
             agg_dict[col] = "first"
 
-    df = df.groupby(group_cols, as_index=False).agg(agg_dict)
+    return df.groupby(_FILL_GROUP_COLS, as_index=False).agg(agg_dict)
+
+
+def clean_sbi_transaction_csv(filepath_or_buffer, encoding="shift_jis", chunksize=None):
+    """
+    Parse an SBI trade history export into one frame of merged fills. With
+    `chunksize` the file is streamed (see iter_sbi_transaction_csv) and only
+    the result is held in memory.
+    """
+    if chunksize:
+        frames = list(iter_sbi_transaction_csv(filepath_or_buffer, encoding=encoding, chunksize=chunksize))
+        return pd.concat(frames, ignore_index=True) if frames else _merge_fills(_empty_transactions())
+
+    # Skip metadata and read from row 8 (0-indexed)
+    df = pd.read_csv(filepath_or_buffer, skiprows=8, encoding=encoding)
+    df = _normalize_transactions(df)
+    # print(df.head(3))  # Debug: print first few rows to verify
+
+    df = _merge_fills(df)
 
     validate_schema(df, TransactionSchema.required, name="transactions_csv", raise_on_error=True)
 
     return df
 
 
+def _empty_transactions() -> pd.DataFrame:
+    return _normalize_transactions(pd.DataFrame(columns=range(len(TRANSACTION_CSV_COLUMNS))))
+
+
+def _spill_by_date(filepath_or_buffer, encoding, chunksize):
+    """
+    Copy the export into a temporary on-disk SQLite table and read it back in
+    chunks ordered by trade date. Memory stays flat whatever order the file
+    is in, and the input is read once from start to end. `_seq` keeps each
+    date's fills in file order, so "first" values match a whole-file parse.
+    """
+    # "" opens a private temporary database file, deleted on close
+    spill = sqlite3.connect("")
+    try:
+        seq = 0
+        for chunk in pd.read_csv(filepath_or_buffer, skiprows=8, encoding=encoding, chunksize=chunksize):
+            chunk = _normalize_transactions(chunk)
+            if chunk.empty:
+                continue
+            chunk["_seq"] = np.arange(seq, seq + len(chunk))
+            seq += len(chunk)
+            chunk.to_sql("fills", spill, if_exists="append", index=False)
+        if not seq:
+            return
+        query = f'SELECT * FROM fills ORDER BY "{Columns.DATE}", _seq'
+        for chunk in pd.read_sql(
+            query, spill, chunksize=chunksize, parse_dates=[Columns.DATE, Columns.SETTLEMENT_DATE]
+        ):
+            yield chunk.drop(columns="_seq")
+    finally:
+        spill.close()
+
+
+def iter_sbi_transaction_csv(filepath_or_buffer, encoding="shift_jis", chunksize=None):
+    """
+    Stream an SBI trade history export as cleaned, merged frames. Rows are
+    spilled to a temporary SQLite table and read back by trade date, so the
+    fills of a date are complete once a chunk moves past it, whether or not
+    the export itself is sorted. Only the groups of the newest date seen are
+    held back, which keeps memory flat.
+    """
+    chunksize = int(chunksize or config.TRANSACTION_CSV_CHUNK_ROWS)
+    pending = None
+    for chunk in _spill_by_date(filepath_or_buffer, encoding, chunksize):
+        last_date = chunk[Columns.DATE].iloc[-1]
+
+        merged = _merge_fills(chunk if pending is None else pd.concat([pending, chunk], ignore_index=True))
+        # the newest date may continue in the next chunk
+        done = merged[Columns.DATE] != last_date
+        pending = merged[~done]
+        if done.any():
+            out = merged[done].reset_index(drop=True)
+            validate_schema(out, TransactionSchema.required, name="transactions_csv", raise_on_error=True)
+            yield out
+
+    if pending is not None and not pending.empty:
+        out = pending.reset_index(drop=True)
+        validate_schema(out, TransactionSchema.required, name="transactions_csv", raise_on_error=True)
+        yield out
+
+
 def clean_sbi_cash_flow_csv(filepath_or_buffer, encoding="utf-8-sig"):
     # Cash flow log has a 9-line preamble; table header starts at line 10
     df = pd.read_csv(filepath_or_buffer, skiprows=9, encoding=encoding)
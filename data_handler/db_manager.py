@@ -1,16 +1,28 @@
 # data_handler/db_manager.py
 import os
 import sqlite3
+from contextlib import contextmanager
+from dataclasses import dataclass
 import pandas as pd
 
-from core.constants import Columns
+from core.constants import Columns, TradeType
+from core.schema import coerce_transactions
+from data_handler.connection import (
+    bump_data_version,
+    bump_rewrite_version,
+    data_version,
+    expire_read_mirror,
+    get_connection,
+    get_read_connection,
+)
+from data_handler.migrations import VERSIONED_TABLES, apply_migrations
 
 
 def init_db(db_path="data/portfolio.db"):
     # make dir if data/ folder is not exist
     if not os.path.exists(os.path.dirname(db_path)):
         os.makedirs(os.path.dirname(db_path))
-    conn = sqlite3.connect(db_path)
+    conn = get_connection(db_path)
     c = conn.cursor()
     c.execute("""
         CREATE TABLE IF NOT EXISTS transactions (
@@ -19,11 +31,11 @@ def init_db(db_path="data/portfolio.db"):
             stock_code TEXT,
             stock_name TEXT,
             trade_type TEXT,
-            quantity REAL,
+            quantity INTEGER,
             price_per_share REAL,
-            total_amount REAL,
+            total_amount INTEGER,
             settlement_date TEXT,
-            fee REAL,
+            fee INTEGER,
             UNIQUE(date, stock_code, trade_type, quantity, price_per_share, total_amount)
         );
     """)
@@ -63,43 +75,11 @@ def init_db(db_path="data/portfolio.db"):
         );
     """)
     conn.commit()
-    conn.close()
-
-
-def insert_new_rows(df, db_path="data/portfolio.db"):
-    conn = sqlite3.connect(db_path)
-    c = conn.cursor()
-
-    for _, row in df.iterrows():
-        try:
-            date_str = row[Columns.DATE].strftime(
-                "%Y-%m-%d") if not pd.isna(row[Columns.DATE]) else None
-            settlement_str = row[Columns.SETTLEMENT_DATE].strftime(
-                "%Y-%m-%d") if not pd.isna(row[Columns.SETTLEMENT_DATE]) else None
-
-            c.execute("""
-                INSERT INTO trades (date, stock_code, stock_name, trade_type, quantity,
-                                    price_per_share, total_amount, settlement_date)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                date_str,
-                row[Columns.STOCK_CODE],
-                row[Columns.STOCK_NAME],
-                row[Columns.TRADE_TYPE],
-                int(row[Columns.QUANTITY]),
-                float(row[Columns.PRICE_PER_SHARE]),
-                float(row[Columns.TOTAL_AMOUNT]),
-                settlement_str
-            ))
-        except sqlite3.IntegrityError:
-            continue
-
-    conn.commit()
-    conn.close()
+    apply_migrations(conn)
 
 
 def insert_fundamentals(df, db_path="data/portfolio.db"):
-    conn = sqlite3.connect(db_path)
+    conn = get_connection(db_path)
     c = conn.cursor()
 
     for _, row in df.iterrows():
@@ -120,73 +100,240 @@ def insert_fundamentals(df, db_path="data/portfolio.db"):
             continue
 
     conn.commit()
-    conn.close()
+
+
+PORTFOLIO_METRIC_COLUMNS = ("net_value", "market_value", "net_deposit", "cash", "daily_return")
 
 
 def insert_portfolio_metrics(metrics_dict, db_path="data/portfolio.db"):
-    conn = sqlite3.connect(db_path)
-    c = conn.cursor()
+    """Insert or replace one portfolio_metrics row (keyed by date)."""
+    conn = get_connection(db_path)
+    values = [metrics_dict.get(c) for c in PORTFOLIO_METRIC_COLUMNS]
+    with conn:
+        conn.execute(f"""
+            INSERT OR REPLACE INTO portfolio_metrics (date, {', '.join(PORTFOLIO_METRIC_COLUMNS)})
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, [sql_date(metrics_dict.get("date"))] + [None if v is None else float(v) for v in values])
+
+
+# rows changed in TEMP scratch tables by the running _data_write, per connection
+# (each is leased to one thread); they are not data changes
+_SCRATCH_CHANGES = {}
+
+
+@contextmanager
+def _data_write(db_path):
+    """
+    Transaction on the versioned data tables: data_version is bumped once,
+    at the end, if any statement changed a row (ignored duplicates and
+    _scratch_write statements do not count).
+    """
+    conn = get_connection(db_path)
+    changes = conn.total_changes
+    _SCRATCH_CHANGES[id(conn)] = 0
     try:
-        c.execute("""
-            INSERT INTO portfolio_metrics (date, total_value, pe_ratio_avg, pe_ratio_weighted)
-            VALUES (?, ?, ?, ?)
-        """, (
-            metrics_dict.get("date"),
-            float(metrics_dict.get("total_value")) if metrics_dict.get("total_value") is not None else None,
-            float(metrics_dict.get("pe_ratio_avg")) if metrics_dict.get("pe_ratio_avg") is not None else None,
-            float(metrics_dict.get("pe_ratio_weighted")) if metrics_dict.get("pe_ratio_weighted") is not None else None
-        ))
-    except sqlite3.IntegrityError:
-        pass
-    conn.commit()
-    conn.close()
+        with conn:
+            yield conn
+            changed = conn.total_changes - changes != _SCRATCH_CHANGES[id(conn)]
+            if changed:
+                bump_data_version(conn)
+    finally:
+        _SCRATCH_CHANGES.pop(id(conn), None)
+    if changed:
+        expire_read_mirror(db_path)
+
+
+def _scratch_write(conn, sql, rows=None):
+    """Run a write on a TEMP table inside _data_write without it counting as a data change."""
+    before = conn.total_changes
+    if rows is None:
+        conn.execute(sql)
+    else:
+        conn.executemany(sql, rows)
+    _SCRATCH_CHANGES[id(conn)] += conn.total_changes - before
 
 
 def clear_db(db_path="data/portfolio.db"):
-    conn = sqlite3.connect(db_path)
-    c = conn.cursor()
-    c.execute("DELETE FROM trades")
-    conn.commit()
-    conn.close()
+    with _data_write(db_path) as conn:
+        deleted = sum(conn.execute(f"DELETE FROM {table}").rowcount for table in VERSIONED_TABLES)
+        if deleted:
+            bump_rewrite_version(conn)
+
+
+def get_data_version(db_path="data/portfolio.db"):
+    """Counter bumped by every write transaction on the data tables; 0 before init_db."""
+    return data_version(get_connection(db_path))
 
 
 def clear_cash_flows(db_path="data/portfolio.db"):
-    conn = sqlite3.connect(db_path)
-    c = conn.cursor()
-    c.execute("DELETE FROM cash_flows")
-    conn.commit()
-    conn.close()
+    with _data_write(db_path) as conn:
+        if conn.execute("DELETE FROM cash_flows").rowcount:
+            bump_rewrite_version(conn)
 
 
 def fetch_summary(db_path="data/portfolio.db"):
-    conn = sqlite3.connect(db_path)
+    conn = get_read_connection(db_path)
     c = conn.cursor()
     c.execute("""
         SELECT trade_type, COUNT(*), SUM(quantity), SUM(total_amount)
-        FROM trades
+        FROM transactions
         GROUP BY trade_type
     """)
     rows = c.fetchall()
-    conn.close()
     return rows
 
 
 def get_all_transactions(db_path="data/portfolio.db"):
-    conn = sqlite3.connect(db_path)
+    conn = get_read_connection(db_path)
     df = pd.read_sql_query("SELECT * FROM transactions", conn)
-    conn.close()
+    return coerce_transactions(df)
+
+
+DEFAULT_ACCOUNT_ID = "default"
+
+TRANSACTION_COLUMNS = (
+    "id", Columns.ACCOUNT_ID, Columns.ACCOUNT, Columns.DATE, Columns.STOCK_CODE, Columns.STOCK_NAME, Columns.TRADE_TYPE, Columns.QUANTITY,
+    Columns.PRICE_PER_SHARE, Columns.TOTAL_AMOUNT, Columns.SETTLEMENT_DATE, Columns.FEE,
+)
+
+
+def sql_date(value):
+    """'YYYY-MM-DD' for a date-like value, None when it does not parse."""
+    ts = pd.to_datetime(value, errors="coerce")
+    return None if pd.isna(ts) else ts.strftime("%Y-%m-%d")
+
+
+def accounts_filter(accounts, query, params):
+    """Append an account_id IN (...) filter; None means all accounts."""
+    accounts = [str(a) for a in accounts]
+    query += f" AND account_id IN ({', '.join('?' * len(accounts))})"
+    params.extend(accounts)
+    return query
+
+
+def get_accounts(db_path="data/portfolio.db"):
+    rows = get_read_connection(db_path).execute("""
+        SELECT account_id FROM transactions
+        UNION SELECT account_id FROM cash_flows
+        ORDER BY 1
+    """).fetchall()
+    return [str(r[0]) for r in rows]
+
+
+def get_transactions(codes=None, start=None, end=None, columns=None, accounts=None, db_path="data/portfolio.db"):
+    """
+    Transactions filtered in SQL: `codes` (iterable of stock codes), inclusive
+    `start`/`end` trade dates, `accounts` (account_ids) and an optional column
+    projection. Ordered by date, id and typed per core.schema.TRANSACTION_DTYPES.
+    """
+    cols = list(columns) if columns else list(TRANSACTION_COLUMNS)
+    unknown = [c for c in cols if c not in TRANSACTION_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown transaction columns: {unknown}")
+
+    query = f"SELECT {', '.join(cols)} FROM transactions WHERE 1=1"
+    params = []
+    if codes is not None:
+        codes = [str(c) for c in codes]
+        if not codes:
+            return coerce_transactions(pd.DataFrame(columns=cols))
+        query += f" AND stock_code IN ({', '.join('?' * len(codes))})"
+        params.extend(codes)
+    if accounts is not None:
+        if not list(accounts):
+            return coerce_transactions(pd.DataFrame(columns=cols))
+        query = accounts_filter(accounts, query, params)
+    if start is not None and sql_date(start):
+        query += " AND date >= ?"
+        params.append(sql_date(start))
+    if end is not None and sql_date(end):
+        query += " AND date <= ?"
+        params.append(sql_date(end))
+    query += " ORDER BY date, id"
+    df = pd.read_sql_query(query, get_read_connection(db_path), params=params)
+    return coerce_transactions(df)
+
+
+def get_stock_codes(db_path="data/portfolio.db"):
+    conn = get_read_connection(db_path)
+    rows = conn.execute("SELECT DISTINCT stock_code FROM transactions ORDER BY stock_code").fetchall()
+    return [str(r[0]) for r in rows]
+
+
+def get_held_stock_codes(db_path="data/portfolio.db"):
+    # raw share balance; split-adjusted quantities only differ in scale, not sign
+    conn = get_read_connection(db_path)
+    rows = conn.execute("""
+        SELECT stock_code
+        FROM transactions
+        GROUP BY stock_code
+        HAVING SUM(CASE trade_type WHEN ? THEN quantity WHEN ? THEN -quantity ELSE 0 END) > 0
+        ORDER BY stock_code
+    """, (TradeType.BUY, TradeType.SELL)).fetchall()
+    return [str(r[0]) for r in rows]
+
+
+def get_cash_flows(db_path="data/portfolio.db", accounts=None):
+    conn = get_read_connection(db_path)
+    query = "SELECT * FROM cash_flows WHERE 1=1"
+    params = []
+    if accounts is not None:
+        if not list(accounts):
+            return pd.read_sql_query("SELECT * FROM cash_flows WHERE 0", conn)
+        query = accounts_filter(accounts, query, params)
+    df = pd.read_sql_query(query + " ORDER BY date DESC, id DESC", conn, params=params)
     return df
 
 
-def get_cash_flows(db_path="data/portfolio.db"):
-    conn = sqlite3.connect(db_path)
-    df = pd.read_sql_query("SELECT * FROM cash_flows ORDER BY date DESC, id DESC", conn)
-    conn.close()
+def get_cash_flow_totals(as_of=None, accounts=None, db_path="data/portfolio.db"):
+    """
+    {type: summed amount} over all cash flows up to `as_of` (inclusive), in one GROUP BY.
+    Undated rows are left out, as in get_daily_cash_flows, so totals always
+    match the daily series they are seeded from.
+    """
+    query = "SELECT type, COALESCE(SUM(amount), 0) FROM cash_flows WHERE date IS NOT NULL"
+    params = []
+    if as_of is not None and sql_date(as_of):
+        query += " AND date <= ?"
+        params.append(sql_date(as_of))
+    if accounts is not None:
+        if not list(accounts):
+            return {}
+        query = accounts_filter(accounts, query, params)
+    query += " GROUP BY type"
+    rows = get_read_connection(db_path).execute(query, params).fetchall()
+    return {str(t): float(v) for t, v in rows}
+
+
+def get_daily_cash_flows(as_of=None, types=None, accounts=None, db_path="data/portfolio.db"):
+    """
+    Cash flows summed per (date, type): columns date (datetime64), type, amount (float).
+    Drop-in for get_cash_flows() wherever only date/type/amount are used.
+    """
+    query = "SELECT date, type, SUM(amount) AS amount FROM cash_flows WHERE date IS NOT NULL"
+    params = []
+    if as_of is not None and sql_date(as_of):
+        query += " AND date <= ?"
+        params.append(sql_date(as_of))
+    if types is not None:
+        types = list(types)
+        if not types:
+            return pd.DataFrame(columns=[Columns.DATE, "type", "amount"])
+        query += f" AND type IN ({', '.join('?' * len(types))})"
+        params.extend(types)
+    if accounts is not None:
+        if not list(accounts):
+            return pd.DataFrame(columns=[Columns.DATE, "type", "amount"])
+        query = accounts_filter(accounts, query, params)
+    query += " GROUP BY date, type ORDER BY date, type"
+    df = pd.read_sql_query(query, get_read_connection(db_path), params=params)
+    df[Columns.DATE] = pd.to_datetime(df[Columns.DATE], errors="coerce")
+    df["amount"] = df["amount"].astype(float).fillna(0.0)
     return df
 
 
 def get_fundamentals(stock_code, start_date=None, end_date=None, db_path="data/portfolio.db"):
-    conn = sqlite3.connect(db_path)
+    conn = get_connection(db_path)
     query = "SELECT date, pe_ratio, eps FROM fundamentals WHERE stock_code = ?"
     params = [stock_code]
     if start_date:
@@ -197,138 +344,233 @@ def get_fundamentals(stock_code, start_date=None, end_date=None, db_path="data/p
         params.append(end_date)
     query += " ORDER BY date"
     df = pd.read_sql_query(query, conn, params=params)
-    conn.close()
     return df
 
 
 def get_portfolio_metrics(start_date=None, end_date=None, db_path="data/portfolio.db"):
-    conn = sqlite3.connect(db_path)
-    query = "SELECT date, total_value, pe_ratio_avg, pe_ratio_weighted FROM portfolio_metrics WHERE 1=1"
+    conn = get_connection(db_path)
+    query = f"SELECT date, {', '.join(PORTFOLIO_METRIC_COLUMNS)} FROM portfolio_metrics WHERE 1=1"
     params = []
-    if start_date:
+    if start_date and sql_date(start_date):
         query += " AND date >= ?"
-        params.append(start_date)
-    if end_date:
+        params.append(sql_date(start_date))
+    if end_date and sql_date(end_date):
         query += " AND date <= ?"
-        params.append(end_date)
+        params.append(sql_date(end_date))
     query += " ORDER BY date"
     df = pd.read_sql_query(query, conn, params=params)
-    conn.close()
+    df[Columns.DATE] = pd.to_datetime(df[Columns.DATE], errors="coerce")
     return df
 
 
-def insert_transactions(df, db_path="data/portfolio.db"):
-    conn = sqlite3.connect(db_path)
-    c = conn.cursor()
-    for _, row in df.iterrows():
-        # Replace '--' with None for numeric columns
-        def safe_float(val):
-            if val == '--' or pd.isna(val):
-                return None
-            try:
-                return float(val)
-            except Exception:
-                return None
-
-        def safe_int(val):
-            if val == '--' or pd.isna(val):
-                return None
-            try:
-                return int(val)
-            except Exception:
-                return None
+@dataclass(frozen=True)
+class InsertResult:
+    inserted: int
+    skipped: int  # rows ignored by the table's UNIQUE constraint
 
-        try:
-            c.execute("""
-                INSERT INTO transactions (
-                    date, stock_code, stock_name, trade_type, quantity,
-                    price_per_share, total_amount, settlement_date, fee
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                row[Columns.DATE].strftime("%Y-%m-%d") if not pd.isna(row[Columns.DATE]) else None,
-                row[Columns.STOCK_CODE],
-                row[Columns.STOCK_NAME],
-                row[Columns.TRADE_TYPE],
-                safe_int(row[Columns.QUANTITY]),
-                safe_float(row[Columns.PRICE_PER_SHARE]),
-                safe_float(row[Columns.TOTAL_AMOUNT]),
-                row[Columns.SETTLEMENT_DATE].strftime("%Y-%m-%d") if not pd.isna(row[Columns.SETTLEMENT_DATE]) else None,
-                safe_float(row[Columns.FEE]) if Columns.FEE in row else 0
-            ))
-        except sqlite3.IntegrityError as e:
-            # print(f"IntegrityError: {e} for row: {row.to_dict()}")
-            continue
-    conn.commit()
-    conn.close()
 
+def _col(df, name, default=None):
+    if name in df.columns:
+        return df[name]
+    return pd.Series(default, index=df.index, dtype=object)
 
-def insert_dividends(df, db_path="data/portfolio.db"):
-    conn = sqlite3.connect(db_path)
-    c = conn.cursor()
-    for _, row in df.iterrows():
-        try:
-            c.execute("""
-                INSERT INTO dividends (date, ticker, amount, currency, notes)
-                VALUES (?, ?, ?, ?, ?)
-            """, (
-                row["date"], row["ticker"], row["amount"], row.get("currency", "JPY"), row.get("notes", "")
-            ))
-        except sqlite3.IntegrityError:
-            continue
-    conn.commit()
-    conn.close()
 
+def _date_values(series):
+    dt = pd.to_datetime(series, errors="coerce")
+    return dt.dt.strftime("%Y-%m-%d").astype(object).where(dt.notna(), None).tolist()
+
+
+def _number_values(series, integer=False):
+    # SBI exports "--" for empty numbers; coerce turns it into NULL
+    num = pd.to_numeric(series, errors="coerce")
+    if integer:
+        num = num.astype(float).round().astype("Int64")
+    return num.astype(object).where(num.notna(), None).tolist()
+
+
+def _text_values(series):
+    return series.astype(object).where(series.notna(), None).tolist()
 
-def insert_cash_flows(df, db_path="data/portfolio.db"):
-    conn = sqlite3.connect(db_path)
-    c = conn.cursor()
-    def to_date_str(val):
-        if pd.isna(val):
-            return None
-        if isinstance(val, pd.Timestamp):
-            return val.strftime("%Y-%m-%d")
-        return str(val)
-    for _, row in df.iterrows():
-        try:
-            c.execute("""
-                INSERT INTO cash_flows (
-                    date, type, amount, currency, notes,
-                    category, description, debit, credit, transfer_debit, transfer_credit, source
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                to_date_str(row["date"]),
-                row.get("type"),
-                row.get("amount"),
-                row.get("currency", "JPY"),
-                row.get("notes", ""),
-                row.get("category"),
-                row.get("description"),
-                row.get("debit"),
-                row.get("credit"),
-                row.get("transfer_debit"),
-                row.get("transfer_credit"),
-                row.get("source"),
-            ))
-        except sqlite3.IntegrityError:
-            continue
-    conn.commit()
-    conn.close()
+
+def _account_values(df, account_id):
+    """Explicit `account_id` wins, else the frame's account_id column, else DEFAULT_ACCOUNT_ID."""
+    if account_id:
+        return [str(account_id)] * len(df)
+    return _text_values(_col(df, Columns.ACCOUNT_ID).fillna(DEFAULT_ACCOUNT_ID))
+
+
+def _insert_rows(sql, rows, db_path):
+    """executemany `rows` in one transaction; INSERT OR IGNORE skips duplicates."""
+    return _insert_row_batches(sql, [rows], db_path)[0]
+
+
+def _insert_row_batches(sql, batches, db_path, prepare=None):
+    """
+    Like _insert_rows for several row lists in a single transaction, counted per
+    list. `prepare(conn, rows)` may return the subset still to insert; rows it
+    drops count as skipped.
+    """
+    results = []
+    with _data_write(db_path) as conn:
+        for rows in batches:
+            todo = prepare(conn, rows) if prepare is not None and rows else rows
+            # rowcount sums the rows each statement inserted
+            inserted = conn.executemany(sql, todo).rowcount if todo else 0
+            results.append(InsertResult(inserted, len(rows) - inserted))
+    return results
+
+
+_INSERT_TRANSACTION_SQL = """
+    INSERT OR IGNORE INTO transactions (
+        account_id, account, date, stock_code, stock_name, trade_type, quantity,
+        price_per_share, total_amount, settlement_date, fee
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+# the transactions UNIQUE key minus `account`, as (column, index in a _transaction_rows tuple)
+_TX_MATCH_COLS = (
+    ("account_id", 0), ("date", 2), ("stock_code", 3), ("trade_type", 5),
+    ("quantity", 6), ("price_per_share", 7), ("total_amount", 8),
+)
+_TX_MATCH_NAMES = ", ".join(col for col, _ in _TX_MATCH_COLS)
+
+
+def _tx_match_on(left, right):
+    return " AND ".join(f"{left}.{col} = {right}.{col}" for col, _ in _TX_MATCH_COLS)
+
+
+def _match_unbucketed(conn, rows):
+    """
+    Trades imported before tax buckets were recorded (migration 5) are stored
+    with account ''. A bucketed row matching one on the rest of the key is the
+    same trade: the stored row takes the bucket instead of a second copy being
+    inserted. An unbucketed row matching a stored row in any bucket is skipped.
+
+    Set-based: the batch goes into a TEMP table once and both rules are single
+    joins against transactions, so legacy databases keep the bulk insert path.
+    """
+    if all(r[1] for r in rows) and conn.execute("SELECT 1 FROM transactions WHERE account = '' LIMIT 1").fetchone() is None:
+        return rows
+    conn.execute(f"""
+        CREATE TEMP TABLE IF NOT EXISTS incoming_transactions (
+            seq INTEGER PRIMARY KEY, account TEXT, {_TX_MATCH_NAMES}, claimed INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    _scratch_write(conn, "DELETE FROM incoming_transactions")
+    _scratch_write(
+        conn,
+        f"INSERT INTO incoming_transactions (seq, account, {_TX_MATCH_NAMES}) VALUES (?, ?{', ?' * len(_TX_MATCH_COLS)})",
+        [(seq, r[1], *(r[i] for _, i in _TX_MATCH_COLS)) for seq, r in enumerate(rows)],
+    )
+    # the first bucketed row per trade claims the stored '' row (bare columns of MIN() come from that row)
+    _scratch_write(conn, f"""
+        UPDATE incoming_transactions SET claimed = 1
+        WHERE seq IN (
+            SELECT first.seq
+            FROM (
+                SELECT MIN(seq) AS seq, {_TX_MATCH_NAMES} FROM incoming_transactions
+                WHERE account <> '' GROUP BY {_TX_MATCH_NAMES}
+            ) first
+            JOIN transactions t ON t.account = '' AND {_tx_match_on("t", "first")}
+        )
+    """)
+    claimed = conn.execute(f"""
+        UPDATE OR IGNORE transactions SET account = i.account
+        FROM incoming_transactions i
+        WHERE i.claimed = 1 AND transactions.account = '' AND {_tx_match_on("transactions", "i")}
+    """)
+    if claimed.rowcount:
+        # stored rows changed partition: not visible to the id/count marks
+        bump_rewrite_version(conn)
+    todo = conn.execute(f"""
+        SELECT seq FROM incoming_transactions i
+        WHERE i.claimed = 0
+          AND (i.account <> '' OR NOT EXISTS (SELECT 1 FROM transactions t WHERE {_tx_match_on("t", "i")}))
+        ORDER BY seq
+    """).fetchall()
+    _scratch_write(conn, "DELETE FROM incoming_transactions")
+    return [rows[seq] for (seq,) in todo]
+
+
+def insert_transactions(df, db_path="data/portfolio.db", account_id=None):
+    return insert_transaction_batches([df], db_path=db_path, account_id=account_id)[0]
+
+
+def insert_transaction_batches(frames, db_path="data/portfolio.db", account_id=None):
+    """Insert several transaction frames in one transaction; one InsertResult per frame."""
+    return _insert_row_batches(
+        _INSERT_TRANSACTION_SQL, [_transaction_rows(df, account_id) for df in frames], db_path,
+        prepare=_match_unbucketed,
+    )
+
+
+def _transaction_rows(df, account_id):
+    return list(zip(
+        _account_values(df, account_id),
+        # SBI tax bucket (特定/NISA); cost basis is tracked per bucket
+        _text_values(_col(df, Columns.ACCOUNT).fillna("").astype(str).str.strip()),
+        _date_values(df[Columns.DATE]),
+        _text_values(df[Columns.STOCK_CODE]),
+        _text_values(df[Columns.STOCK_NAME]),
+        _text_values(df[Columns.TRADE_TYPE]),
+        _number_values(df[Columns.QUANTITY], integer=True),
+        _number_values(df[Columns.PRICE_PER_SHARE]),
+        _number_values(df[Columns.TOTAL_AMOUNT], integer=True),
+        _date_values(df[Columns.SETTLEMENT_DATE]),
+        _number_values(df[Columns.FEE], integer=True) if Columns.FEE in df.columns else [0] * len(df),
+    ))
+
+
+def insert_dividends(df, db_path="data/portfolio.db", account_id=None):
+    rows = list(zip(
+        _account_values(df, account_id),
+        _date_values(df["date"]),
+        _text_values(df["ticker"]),
+        _number_values(df["amount"]),
+        _text_values(_col(df, "currency", "JPY")),
+        _text_values(_col(df, "notes", "")),
+    ))
+    return _insert_rows("""
+        INSERT OR IGNORE INTO dividends (account_id, date, ticker, amount, currency, notes)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, rows, db_path)
+
+
+def insert_cash_flows(df, db_path="data/portfolio.db", account_id=None):
+    rows = list(zip(
+        _account_values(df, account_id),
+        _date_values(df["date"]),
+        _text_values(_col(df, "type")),
+        _number_values(_col(df, "amount")),
+        _text_values(_col(df, "currency", "JPY")),
+        _text_values(_col(df, "notes", "")),
+        _text_values(_col(df, "category")),
+        _text_values(_col(df, "description")),
+        _number_values(_col(df, "debit")),
+        _number_values(_col(df, "credit")),
+        _number_values(_col(df, "transfer_debit")),
+        _number_values(_col(df, "transfer_credit")),
+        _text_values(_col(df, "source")),
+    ))
+    return _insert_rows("""
+        INSERT OR IGNORE INTO cash_flows (
+            account_id, date, type, amount, currency, notes,
+            category, description, debit, credit, transfer_debit, transfer_credit, source
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, rows, db_path)
 
 
 def insert_stock_splits(df, db_path="data/portfolio.db"):
-    conn = sqlite3.connect(db_path)
-    c = conn.cursor()
-    for _, row in df.iterrows():
-        try:
-            c.execute("""
-                INSERT INTO stock_splits (date, ticker, ratio, notes)
-                VALUES (?, ?, ?, ?)
-            """, (
-                row["date"], row["ticker"], row["ratio"], row.get("notes", "")
-            ))
-        except sqlite3.IntegrityError:
-            continue
-    conn.commit()
-    conn.close()
+    rows = list(zip(
+        _date_values(df["date"]),
+        _text_values(df["ticker"]),
+        _number_values(df["ratio"]),
+        _text_values(_col(df, "notes", "")),
+    ))
+    return _insert_rows("""
+        INSERT OR IGNORE INTO stock_splits (date, ticker, ratio, notes)
+        VALUES (?, ?, ?, ?)
+    """, rows, db_path)
 
 # Add similar get_* functions for querying each table as needed.
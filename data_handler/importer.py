@@ -0,0 +1,46 @@
+# data_handler/importer.py
+from __future__ import annotations
+
+from data_handler.csv_parser import iter_sbi_transaction_csv
+from data_handler.db_manager import InsertResult, insert_transactions
+from data_handler.materialize import materialize_portfolio_metrics
+from data_handler.positions import refresh_daily_positions
+
+
+def refresh_after_import(db_path: str = "data/portfolio.db", transactions: bool = True) -> None:
+    """
+    Bring the materialized tables up to date once new rows landed: daily
+    positions (when `transactions` changed) and portfolio_metrics. Failures are
+    reported, not raised; readers replay history while the tables are stale.
+    """
+    steps = [materialize_portfolio_metrics]
+    if transactions:
+        steps.insert(0, refresh_daily_positions)
+    for step in steps:
+        try:
+            step(db_path)
+        except Exception as e:
+            print(f"Warning: {step.__name__} failed after import: {e}")
+
+
+def import_sbi_transaction_csv(
+    filepath_or_buffer,
+    db_path: str = "data/portfolio.db",
+    account_id=None,
+    encoding: str = "shift_jis",
+    chunksize=None,
+    refresh: bool = True,
+) -> InsertResult:
+    """
+    Stream a transactions CSV into the DB chunk by chunk; memory stays flat for
+    any file size. With `refresh`, the materialized tables are brought up to
+    date afterwards (pass False when importing several files in a row).
+    """
+    inserted = skipped = 0
+    for frame in iter_sbi_transaction_csv(filepath_or_buffer, encoding=encoding, chunksize=chunksize):
+        result = insert_transactions(frame, db_path=db_path, account_id=account_id)
+        inserted += result.inserted
+        skipped += result.skipped
+    if refresh and inserted:
+        refresh_after_import(db_path)
+    return InsertResult(inserted=inserted, skipped=skipped)
@@ -0,0 +1,133 @@
+# data_handler/materialize.py
+from __future__ import annotations
+
+import sqlite3
+from typing import Optional
+import pandas as pd
+
+from core.constants import Columns
+from core.portfolio import build_portfolio_value_timeseries
+from data_handler.connection import get_connection
+from data_handler.db_manager import (
+    PORTFOLIO_METRIC_COLUMNS,
+    get_daily_cash_flows,
+    get_data_version,
+    get_portfolio_metrics,
+    get_transactions,
+)
+
+# db_meta keys recording what the materialized rows were built from: the data
+# version plus per-table id high-water marks and row counts, so a run can tell
+# appended rows (recompute from their earliest date) from edits/deletes (rebuild)
+_META_KEYS = ("metrics_version", "metrics_tx_max_id", "metrics_tx_count", "metrics_cf_max_id", "metrics_cf_count")
+
+
+def _read_meta(conn: sqlite3.Connection) -> dict:
+    rows = conn.execute(
+        f"SELECT key, value FROM db_meta WHERE key IN ({', '.join('?' * len(_META_KEYS))})", _META_KEYS
+    ).fetchall()
+    return {k: int(v) for k, v in rows}
+
+
+def _table_marks(conn: sqlite3.Connection, table: str):
+    max_id, count = conn.execute(f"SELECT COALESCE(MAX(id), 0), COUNT(*) FROM {table}").fetchone()
+    return int(max_id), int(count)
+
+
+def _frontier(conn: sqlite3.Connection, meta: dict) -> Optional[str]:
+    """
+    Earliest date whose metrics must be recomputed: the first date among rows
+    added since the last run. None means rebuild everything.
+    """
+    dates = []
+    for table, prefix in (("transactions", "metrics_tx"), ("cash_flows", "metrics_cf")):
+        old_max = meta.get(f"{prefix}_max_id")
+        old_count = meta.get(f"{prefix}_count")
+        if old_max is None or old_count is None:
+            return None
+        new_count, first_date = conn.execute(
+            f"SELECT COUNT(*), MIN(date) FROM {table} WHERE id > ?", (old_max,)
+        ).fetchone()
+        # anything other than pure appends (deletes, rebuilt tables) changes history
+        if old_count + int(new_count) != _table_marks(conn, table)[1]:
+            return None
+        if first_date:
+            dates.append(first_date)
+    if not dates:
+        # version moved without new rows (e.g. dividends/splits edited): be safe
+        return None
+    return min(dates)
+
+
+def materialize_portfolio_metrics(db_path: str = "data/portfolio.db", full: bool = False) -> int:
+    """
+    Bring portfolio_metrics up to date with the data tables and return the
+    number of rows written. Only dates from the earliest newly imported row
+    on are recomputed; `full` rebuilds the whole table.
+    """
+    conn = get_connection(db_path)
+    version = get_data_version(db_path)
+    meta = _read_meta(conn)
+    if not full and meta.get("metrics_version") == version:
+        return 0
+
+    frontier = None if full else _frontier(conn, meta)
+    tx = get_transactions(db_path=db_path)
+    cash_flows = get_daily_cash_flows(db_path=db_path)
+    asset_df = build_portfolio_value_timeseries(tx, cash_flows_df=cash_flows, start_date=frontier)
+
+    # return of the first recomputed day is measured against the last kept row
+    prev_value = None
+    if frontier is not None:
+        row = conn.execute(
+            "SELECT net_value FROM portfolio_metrics WHERE date < ? ORDER BY date DESC LIMIT 1", (frontier,)
+        ).fetchone()
+        prev_value = float(row[0]) if row and row[0] is not None else None
+
+    rows = []
+    if asset_df is not None and not asset_df.empty:
+        flow_by_date = cash_flows.groupby(Columns.DATE)["amount"].sum() if not cash_flows.empty else pd.Series(dtype=float)
+        for date, market_value, net_value, net_deposit in asset_df[
+            [Columns.DATE, Columns.MARKET_VALUE, Columns.NET_VALUE, Columns.NET_DEPOSIT]
+        ].itertuples(index=False):
+            # same period return compute_twr chains: flows on the day are not performance
+            daily_return = None
+            if prev_value is not None and prev_value > 0:
+                daily_return = (net_value - float(flow_by_date.get(date, 0.0))) / prev_value - 1.0
+            rows.append((
+                pd.Timestamp(date).strftime("%Y-%m-%d"),
+                float(net_value),
+                float(market_value),
+                float(net_deposit),
+                float(net_value - market_value),
+                daily_return,
+            ))
+            prev_value = float(net_value)
+
+    tx_marks = _table_marks(conn, "transactions")
+    cf_marks = _table_marks(conn, "cash_flows")
+    meta_values = dict(zip(_META_KEYS, (version, *tx_marks, *cf_marks)))
+    with conn:
+        if frontier is None:
+            conn.execute("DELETE FROM portfolio_metrics")
+        else:
+            conn.execute("DELETE FROM portfolio_metrics WHERE date >= ?", (frontier,))
+        conn.executemany(
+            f"INSERT OR REPLACE INTO portfolio_metrics (date, {', '.join(PORTFOLIO_METRIC_COLUMNS)}) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+        conn.executemany(
+            "INSERT OR REPLACE INTO db_meta (key, value) VALUES (?, ?)",
+            list(meta_values.items()),
+        )
+    return len(rows)
+
+
+def get_current_portfolio_metrics(end_date=None, db_path: str = "data/portfolio.db") -> Optional[pd.DataFrame]:
+    """Materialized rows up to `end_date`, or None when the data changed since the last run."""
+    meta = _read_meta(get_connection(db_path))
+    if meta.get("metrics_version") != get_data_version(db_path):
+        return None
+    df = get_portfolio_metrics(end_date=end_date, db_path=db_path)
+    return None if df.empty else df
@@ -0,0 +1,303 @@
+# data_handler/migrations.py
+from __future__ import annotations
+
+import sqlite3
+from typing import Callable, Dict, List, Tuple
+
+from data_handler.connection import bump_rewrite_version
+
+
+def _columns(conn: sqlite3.Connection, table: str) -> List[str]:
+    return [r[1] for r in conn.execute(f"PRAGMA table_info({table})").fetchall()]
+
+
+def _add_columns(conn: sqlite3.Connection, table: str, columns: List[Tuple[str, str]]) -> None:
+    # databases created by hand may already have some of them
+    existing = set(_columns(conn, table))
+    for name, sql_type in columns:
+        if name not in existing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {sql_type}")
+
+
+def _m001_cash_flow_columns(conn: sqlite3.Connection) -> None:
+    # written by insert_cash_flows since the SBI cash-flow parser landed
+    _add_columns(conn, "cash_flows", [
+        ("category", "TEXT"),
+        ("description", "TEXT"),
+        ("debit", "REAL"),
+        ("credit", "REAL"),
+        ("transfer_debit", "REAL"),
+        ("transfer_credit", "REAL"),
+        ("source", "TEXT"),
+    ])
+
+
+def _m002_indexes(conn: sqlite3.Connection) -> None:
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_transactions_code_date ON transactions(stock_code, date, id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_transactions_date ON transactions(date)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_cash_flows_date_type ON cash_flows(date, type)")
+
+
+# tables whose writes invalidate derived data (ledgers, snapshots, figures)
+VERSIONED_TABLES = ("transactions", "cash_flows", "dividends", "stock_splits")
+
+
+def _m003_data_version(conn: sqlite3.Connection) -> None:
+    conn.execute("CREATE TABLE IF NOT EXISTS db_meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+    # seeded with epoch milliseconds so a recreated database never reuses an old version
+    conn.execute("""
+        INSERT OR IGNORE INTO db_meta (key, value)
+        VALUES ('data_version', CAST((julianday('now') - 2440587.5) * 86400000 AS INTEGER))
+    """)
+    for table in VERSIONED_TABLES:
+        _create_version_triggers(conn, table)
+
+
+def _create_version_triggers(conn: sqlite3.Connection, table: str) -> None:
+    for event in ("INSERT", "UPDATE", "DELETE"):
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_{event.lower()}_version
+            AFTER {event} ON {table}
+            BEGIN
+                UPDATE db_meta SET value = value + 1 WHERE key = 'data_version';
+            END;
+        """)
+
+
+def _m004_integer_yen(conn: sqlite3.Connection) -> None:
+    # SQLite cannot change a column type in place: rebuild, copy rounded values, swap
+    conn.execute("""
+        CREATE TABLE transactions_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date TEXT,
+            stock_code TEXT,
+            stock_name TEXT,
+            trade_type TEXT,
+            quantity INTEGER,
+            price_per_share REAL,
+            total_amount INTEGER,
+            settlement_date TEXT,
+            fee INTEGER,
+            UNIQUE(date, stock_code, trade_type, quantity, price_per_share, total_amount)
+        );
+    """)
+    conn.execute("""
+        INSERT OR IGNORE INTO transactions_new (
+            id, date, stock_code, stock_name, trade_type, quantity,
+            price_per_share, total_amount, settlement_date, fee
+        )
+        SELECT id, date, stock_code, stock_name, trade_type,
+               CAST(ROUND(quantity) AS INTEGER), price_per_share,
+               CAST(ROUND(total_amount) AS INTEGER), settlement_date,
+               CAST(ROUND(COALESCE(fee, 0)) AS INTEGER)
+        FROM transactions ORDER BY id
+    """)
+    # rows that only differed below one yen collide once rounded; refuse to drop them
+    dropped = [r[0] for r in conn.execute(
+        "SELECT id FROM transactions WHERE id NOT IN (SELECT id FROM transactions_new) ORDER BY id"
+    ).fetchall()]
+    if dropped:
+        raise RuntimeError(
+            f"integer yen migration would merge {len(dropped)} transaction(s) that differ only "
+            f"below one yen (ids {', '.join(map(str, dropped[:20]))}); fix or delete them and restart"
+        )
+    conn.execute("DROP TABLE transactions")
+    conn.execute("ALTER TABLE transactions_new RENAME TO transactions")
+    _m002_indexes(conn)
+    _create_version_triggers(conn, "transactions")
+    # the swap itself is a data change for derived caches
+    conn.execute("UPDATE db_meta SET value = value + 1 WHERE key = 'data_version'")
+
+
+def _rebuild_table(conn: sqlite3.Connection, table: str, create_sql: str, defaults: Dict[str, str]) -> None:
+    """Recreate `table` from `create_sql` (written for "<table>_new"), copying shared columns."""
+    old_cols = set(_columns(conn, table))
+    conn.execute(create_sql)
+    new_cols = _columns(conn, f"{table}_new")
+    select = [c if c in old_cols else f"{defaults.get(c, 'NULL')} AS {c}" for c in new_cols]
+    conn.execute(f"""
+        INSERT OR IGNORE INTO {table}_new ({', '.join(new_cols)})
+        SELECT {', '.join(select)} FROM {table} ORDER BY id
+    """)
+    conn.execute(f"DROP TABLE {table}")
+    conn.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+    _create_version_triggers(conn, table)
+
+
+def _m005_accounts(conn: sqlite3.Connection) -> None:
+    # account_id: brokerage account (family member); account: SBI tax bucket (特定/NISA)
+    defaults = {"account_id": "'default'", "account": "''"}
+    _rebuild_table(conn, "transactions", """
+        CREATE TABLE transactions_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            account_id TEXT NOT NULL DEFAULT 'default',
+            account TEXT NOT NULL DEFAULT '',
+            date TEXT,
+            stock_code TEXT,
+            stock_name TEXT,
+            trade_type TEXT,
+            quantity INTEGER,
+            price_per_share REAL,
+            total_amount INTEGER,
+            settlement_date TEXT,
+            fee INTEGER,
+            UNIQUE(account_id, account, date, stock_code, trade_type, quantity, price_per_share, total_amount)
+        );
+    """, defaults)
+    _rebuild_table(conn, "cash_flows", """
+        CREATE TABLE cash_flows_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            account_id TEXT NOT NULL DEFAULT 'default',
+            date TEXT,
+            type TEXT,
+            amount REAL,
+            currency TEXT,
+            notes TEXT,
+            category TEXT,
+            description TEXT,
+            debit REAL,
+            credit REAL,
+            transfer_debit REAL,
+            transfer_credit REAL,
+            source TEXT,
+            UNIQUE(account_id, date, type, amount)
+        );
+    """, defaults)
+    _rebuild_table(conn, "dividends", """
+        CREATE TABLE dividends_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            account_id TEXT NOT NULL DEFAULT 'default',
+            date TEXT,
+            ticker TEXT,
+            amount REAL,
+            currency TEXT,
+            notes TEXT,
+            UNIQUE(account_id, date, ticker, amount)
+        );
+    """, defaults)
+    _m002_indexes(conn)
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_transactions_account_code_date "
+        "ON transactions(account_id, stock_code, date, id)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_cash_flows_account_date_type ON cash_flows(account_id, date, type)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_dividends_account_date ON dividends(account_id, date)")
+    conn.execute("UPDATE db_meta SET value = value + 1 WHERE key = 'data_version'")
+
+
+def _m006_portfolio_metrics(conn: sqlite3.Connection) -> None:
+    # filled by data_handler.materialize; derived data, so deliberately not versioned
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS portfolio_metrics (
+            date TEXT PRIMARY KEY,
+            net_value REAL,
+            market_value REAL,
+            net_deposit REAL,
+            cash REAL,
+            daily_return REAL
+        );
+    """)
+    _add_columns(conn, "portfolio_metrics", [
+        ("net_value", "REAL"),
+        ("market_value", "REAL"),
+        ("net_deposit", "REAL"),
+        ("cash", "REAL"),
+        ("daily_return", "REAL"),
+    ])
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_portfolio_metrics_date ON portfolio_metrics(date)")
+
+
+def _m007_daily_positions(conn: sqlite3.Connection) -> None:
+    # filled by data_handler.positions; split-adjusted, so the split history each
+    # stock was materialized with is kept next to it
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS daily_positions (
+            account_id TEXT NOT NULL DEFAULT 'default',
+            account TEXT NOT NULL DEFAULT '',
+            stock_code TEXT NOT NULL,
+            date TEXT NOT NULL,
+            stock_name TEXT,
+            qty INTEGER,
+            cost_total REAL,
+            realized_cum REAL,
+            PRIMARY KEY (account_id, account, stock_code, date)
+        );
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS daily_position_splits (
+            stock_code TEXT PRIMARY KEY,
+            signature TEXT NOT NULL
+        );
+    """)
+
+
+def _m008_drop_version_triggers(conn: sqlite3.Connection) -> None:
+    # per-row triggers cost one db_meta UPDATE per inserted row; writers now bump
+    # data_version once per transaction (db_manager._data_write)
+    for table in VERSIONED_TABLES:
+        for event in ("insert", "update", "delete"):
+            conn.execute(f"DROP TRIGGER IF EXISTS trg_{table}_{event}_version")
+
+
+def _m009_drop_unbucketed_duplicates(conn: sqlite3.Connection) -> None:
+    # trades imported before migration 5 have account ''; re-importing the same
+    # export afterwards stored them again under their tax bucket. Keep the
+    # bucketed copy (insert_transactions now matches these instead)
+    others = ("account_id", "date", "stock_code", "trade_type", "quantity", "price_per_share", "total_amount")
+    removed = conn.execute(f"""
+        DELETE FROM transactions
+        WHERE account = '' AND EXISTS (
+            SELECT 1 FROM transactions t
+            WHERE t.account != '' AND {' AND '.join(f't.{c} = transactions.{c}' for c in others)}
+        )
+    """).rowcount
+    if removed:
+        print(f"Removed {removed} duplicate transaction(s) re-imported after the account migration")
+        conn.execute("UPDATE db_meta SET value = value + 1 WHERE key = 'data_version'")
+        bump_rewrite_version(conn)
+
+
+# (version, description, apply); append only, never renumber
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Connection], None]]] = [
+    (1, "add cash_flows parser columns", _m001_cash_flow_columns),
+    (2, "add transactions/cash_flows indexes", _m002_indexes),
+    (3, "add db_meta.data_version bumped by triggers", _m003_data_version),
+    (4, "store transaction quantity/total_amount/fee as integer yen", _m004_integer_yen),
+    (5, "partition transactions/cash_flows/dividends by account_id", _m005_accounts),
+    (6, "add materialized portfolio_metrics table", _m006_portfolio_metrics),
+    (7, "add materialized daily_positions table", _m007_daily_positions),
+    (8, "bump data_version per write transaction instead of per-row triggers", _m008_drop_version_triggers),
+    (9, "drop account-less duplicates of re-imported transactions", _m009_drop_unbucketed_duplicates),
+]
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TEXT DEFAULT (datetime('now'))
+        );
+    """)
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return int(row[0] or 0)
+
+
+def apply_migrations(conn: sqlite3.Connection) -> int:
+    """Apply pending migrations in order, each in its own transaction. Returns the schema version."""
+    current = get_schema_version(conn)
+    conn.commit()
+    for version, description, apply in MIGRATIONS:
+        if version <= current:
+            continue
+        with conn:
+            # explicit BEGIN so DDL is rolled back together with the version row
+            conn.execute("BEGIN")
+            apply(conn)
+            conn.execute(
+                "INSERT INTO schema_version (version, description) VALUES (?, ?)",
+                (version, description),
+            )
+        print(f"Applied schema migration {version}: {description}")
+        current = version
+    return current
@@ -0,0 +1,215 @@
+# data_handler/positions.py
+from __future__ import annotations
+
+import sqlite3
+import time
+from typing import Dict, Optional
+import pandas as pd
+
+from core.constants import Columns
+from core.ledger import build_daily_positions
+from core.splits import SPLIT_CACHE_TTL_SEC, get_stock_splits
+from data_handler.connection import get_connection, rewrite_version
+from data_handler.db_manager import accounts_filter, get_transactions, sql_date
+
+# db_meta keys: transactions id high-water mark and row count the table was built from
+_META_KEYS = ("positions_tx_max_id", "positions_tx_count", "positions_tx_rewrites")
+# epoch seconds of the last split check that covered every traded stock
+_SPLIT_CHECK_KEY = "positions_split_check"
+_KEY_COLS = (Columns.ACCOUNT_ID, Columns.ACCOUNT, Columns.STOCK_CODE)
+
+
+def _split_signature(code: str) -> str:
+    """Raises when the provider failed and nothing is cached: the signature is unknown."""
+    s = get_stock_splits(code, raise_on_error=True)
+    if s is None or s.empty:
+        return ""
+    return ";".join(f"{pd.Timestamp(d):%Y-%m-%d}:{float(r)}" for d, r in sorted(s.items()))
+
+
+def _tx_marks(conn: sqlite3.Connection):
+    max_id, count = conn.execute("SELECT COALESCE(MAX(id), 0), COUNT(*) FROM transactions").fetchone()
+    return int(max_id), int(count), rewrite_version(conn)
+
+
+def _read_meta(conn: sqlite3.Connection) -> dict:
+    rows = conn.execute(
+        f"SELECT key, value FROM db_meta WHERE key IN ({', '.join('?' * len(_META_KEYS))})", _META_KEYS
+    ).fetchall()
+    return {k: int(v) for k, v in rows}
+
+
+def _joined_keys(columns) -> pd.Series:
+    """One string per row for a (account_id, account, stock_code) partition key."""
+    out = None
+    for col in columns:
+        col = col.astype(str)
+        out = col if out is None else out + "\x1f" + col
+    return out
+
+
+def _opening_state(conn: sqlite3.Connection, key: tuple, before: str) -> Optional[tuple]:
+    row = conn.execute(
+        """
+        SELECT qty, cost_total, realized_cum FROM daily_positions
+        WHERE account_id = ? AND account = ? AND stock_code = ? AND date < ?
+        ORDER BY date DESC LIMIT 1
+        """,
+        (*key, before),
+    ).fetchone()
+    return tuple(row) if row else None
+
+
+def refresh_daily_positions(db_path: str = "data/portfolio.db", full: bool = False) -> int:
+    """
+    Bring daily_positions up to date after an import; returns rows written.
+    Partitions with newly inserted trades are recomputed from their earliest
+    new date on top of the stored position before it; stocks whose split
+    history changed, and any delete, rebuild from scratch.
+
+    Splits are fetched for stocks with new trades, and for every stock once
+    per split-cache TTL. If a stock that has to be rebuilt cannot get its
+    splits (provider outage), the refresh is postponed so no unadjusted
+    positions are stored; get_positions_asof reports stale until it succeeds.
+    """
+    conn = get_connection(db_path)
+    meta = _read_meta(conn)
+    max_id, count, rewrites = _tx_marks(conn)
+    now = int(time.time())
+    row = conn.execute("SELECT value FROM db_meta WHERE key = ?", (_SPLIT_CHECK_KEY,)).fetchone()
+    last_check = int(row[0]) if row else 0
+
+    # partition -> first date to recompute (None: whole partition)
+    frontier: Dict[tuple, Optional[str]] = {}
+    rebuild_all = full or len(meta) < len(_META_KEYS)
+    if not rebuild_all:
+        new = pd.read_sql_query(
+            "SELECT account_id, account, stock_code, MIN(date) AS date, COUNT(*) AS n "
+            "FROM transactions WHERE id > ? GROUP BY account_id, account, stock_code",
+            conn,
+            params=(meta["positions_tx_max_id"],),
+        )
+        # anything other than appends (deletes, updates, rebuilt tables) changes history
+        rebuild_all = (
+            meta["positions_tx_count"] + int(new["n"].sum()) != count
+            or meta["positions_tx_rewrites"] != rewrites
+        )
+        for r in new.itertuples(index=False):
+            frontier[(r.account_id, r.account, r.stock_code)] = r.date
+
+    codes = [r[0] for r in conn.execute("SELECT DISTINCT stock_code FROM transactions").fetchall()]
+    stored = dict(conn.execute("SELECT stock_code, signature FROM daily_position_splits").fetchall())
+    check_all = rebuild_all or now - last_check >= SPLIT_CACHE_TTL_SEC
+    to_check = codes if check_all else sorted({k[2] for k in frontier})
+    signatures = {}
+    unknown = []
+    for code in to_check:
+        try:
+            signatures[code] = _split_signature(code)
+        except Exception as e:
+            unknown.append(code)
+            print(f"Warning: Failed to retrieve stock splits for {code}.T: {e}")
+    blocked = sorted((set(codes) if rebuild_all else {k[2] for k in frontier}).intersection(unknown))
+    if blocked:
+        print(f"Warning: Position refresh postponed; split history unavailable for {', '.join(blocked)}")
+        return 0
+    # a stock whose check failed keeps its stored signature and positions
+    resplit = {code for code, sig in signatures.items() if stored.get(code) != sig}
+
+    if rebuild_all:
+        tx = get_transactions(db_path=db_path)
+        frontier = {}
+    else:
+        affected = sorted({k[2] for k in frontier} | resplit)
+        tx = get_transactions(codes=affected, db_path=db_path)
+        for key in list(frontier):
+            if key[2] in resplit:
+                frontier[key] = None
+        # every partition of a re-split stock is recomputed from its first trade
+        if resplit and not tx.empty:
+            for key in tx.loc[tx[Columns.STOCK_CODE].astype(str).isin(resplit), list(_KEY_COLS)].drop_duplicates().itertuples(index=False):
+                frontier[tuple(key)] = None
+
+    opening = {}
+    parts = []
+    if not tx.empty:
+        keys = _joined_keys(tx[c] for c in _KEY_COLS)
+        dates = tx[Columns.DATE].dt.strftime("%Y-%m-%d")
+        mask = pd.Series(rebuild_all, index=tx.index)
+        for key, start in frontier.items():
+            in_part = keys == "\x1f".join(key)
+            if start is None:
+                mask |= in_part
+            else:
+                mask |= in_part & (dates >= start)
+                state = _opening_state(conn, key, start)
+                if state is not None:
+                    opening[key] = state
+        parts.append(tx[mask])
+    positions = build_daily_positions(pd.concat(parts) if parts else None, opening=opening)
+
+    rows = [
+        (r[0], r[1], r[2], pd.Timestamp(r[4]).strftime("%Y-%m-%d"), r[3], int(r[5]), float(r[6]), float(r[7]))
+        for r in positions.itertuples(index=False)
+    ]
+    with conn:
+        if rebuild_all:
+            conn.execute("DELETE FROM daily_positions")
+        else:
+            conn.executemany(
+                "DELETE FROM daily_positions WHERE account_id = ? AND account = ? AND stock_code = ? AND date >= ?",
+                [(*key, start or "") for key, start in frontier.items()],
+            )
+        conn.executemany(
+            "INSERT OR REPLACE INTO daily_positions "
+            "(account_id, account, stock_code, date, stock_name, qty, cost_total, realized_cum) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+        if rebuild_all:
+            conn.execute("DELETE FROM daily_position_splits")
+        conn.executemany(
+            "INSERT OR REPLACE INTO daily_position_splits (stock_code, signature) VALUES (?, ?)", signatures.items()
+        )
+        meta_values = list(zip(_META_KEYS, (max_id, count, rewrites)))
+        if check_all and not unknown:
+            meta_values.append((_SPLIT_CHECK_KEY, now))
+        conn.executemany("INSERT OR REPLACE INTO db_meta (key, value) VALUES (?, ?)", meta_values)
+    return len(rows)
+
+
+def get_positions_asof(end_date=None, accounts=None, db_path: str = "data/portfolio.db") -> Optional[pd.DataFrame]:
+    """
+    Last materialized position per (account, stock) on or before `end_date`
+    (latest when None), in one indexed query. None when transactions changed
+    since refresh_daily_positions last ran.
+    """
+    conn = get_connection(db_path)
+    meta = _read_meta(conn)
+    if len(meta) < len(_META_KEYS) or tuple(meta[k] for k in _META_KEYS) != _tx_marks(conn):
+        return None
+
+    query = """
+        SELECT p.account_id, p.account, p.stock_code, p.stock_name, p.date, p.qty, p.cost_total, p.realized_cum
+        FROM daily_positions p
+        JOIN (
+            SELECT account_id, account, stock_code, MAX(date) AS date
+            FROM daily_positions
+            WHERE 1=1
+    """
+    params = []
+    if end_date is not None and sql_date(end_date):
+        query += " AND date <= ?"
+        params.append(sql_date(end_date))
+    if accounts is not None:
+        if not list(accounts):
+            return pd.DataFrame(columns=[*_KEY_COLS, Columns.STOCK_NAME, Columns.DATE, Columns.QTY,
+                                         Columns.COST_TOTAL, Columns.REALIZED_CUM])
+        query = accounts_filter(accounts, query, params)
+    query += """
+            GROUP BY account_id, account, stock_code
+        ) last USING (account_id, account, stock_code, date)
+        ORDER BY p.stock_code
+    """
+    # derived table outside data_version, so always read from the file (see get_read_connection)
+    return pd.read_sql_query(query, conn, params=params)
@@ -0,0 +1,157 @@
+# data_handler/snapshot.py
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import time
+from typing import Dict, Optional
+import pandas as pd
+
+from core import config
+from core.constants import Columns
+from core.ledger import build_position_ledgers
+from core.portfolio import build_stock_perf_timeseries
+from core.splits import get_stock_splits, seed_split_cache, stocks_split_adjustments
+from data_handler.db_manager import (
+    get_all_transactions,
+    get_cash_flows,
+    get_daily_cash_flows,
+    get_data_version,
+    insert_cash_flows,
+    insert_transactions,
+)
+
+MANIFEST = "manifest.json"
+# frames written by export_snapshot (name -> parquet file)
+SNAPSHOT_FRAMES = (
+    "transactions",
+    "cash_flows",
+    "daily_cash_flows",
+    "transactions_adjusted",
+    "splits",
+    "ledgers",
+    "perf_realized",
+    "perf_total",
+)
+
+
+def _build_frames(db_path: str) -> Dict[str, pd.DataFrame]:
+    tx = get_all_transactions(db_path)
+    frames = {
+        "transactions": tx,
+        "cash_flows": get_cash_flows(db_path),
+        "daily_cash_flows": get_daily_cash_flows(db_path=db_path),
+    }
+    if tx.empty:
+        frames["transactions_adjusted"] = tx
+        frames["splits"] = pd.DataFrame({"ticker": [], "date": [], "ratio": []})
+        frames["ledgers"] = build_position_ledgers(tx)
+        frames["perf_realized"] = pd.DataFrame(columns=[Columns.DATE])
+        frames["perf_total"] = pd.DataFrame(columns=[Columns.DATE])
+        return frames
+
+    # the dashboard's first render reads holdings and realized windows off these
+    adjusted = stocks_split_adjustments(tx)
+    frames["transactions_adjusted"] = adjusted
+    frames["ledgers"] = build_position_ledgers(adjusted, split_adjusted=True)
+
+    # split history as used for the adjustment, so a cold start needs no provider call
+    split_rows = []
+    for code in tx[Columns.STOCK_CODE].astype(str).unique():
+        for d, r in get_stock_splits(code).items():
+            split_rows.append({"ticker": f"{code}.T", "date": pd.Timestamp(d), "ratio": float(r)})
+    frames["splits"] = pd.DataFrame(split_rows, columns=["ticker", "date", "ratio"])
+    frames["perf_realized"] = build_stock_perf_timeseries(adjusted, kind="realized", split_adjusted=True)
+    frames["perf_total"] = build_stock_perf_timeseries(adjusted, kind="total", split_adjusted=True)
+    return frames
+
+
+def export_snapshot(db_path: str = "data/portfolio.db", root: Optional[str] = None) -> str:
+    """Write the DB-derived frames as Parquet under <root>/<data_version>/ and return that directory."""
+    root = root or config.SNAPSHOT_DIR
+    version = get_data_version(db_path)
+    out_dir = os.path.join(root, str(version))
+    tmp_dir = out_dir + ".tmp"
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    os.makedirs(tmp_dir)
+
+    frames = _build_frames(db_path)
+    for name in SNAPSHOT_FRAMES:
+        frames[name].to_parquet(os.path.join(tmp_dir, f"{name}.parquet"), index=False)
+    with open(os.path.join(tmp_dir, MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "data_version": version,
+                "created_at": time.time(),
+                "frames": {name: len(frames[name]) for name in SNAPSHOT_FRAMES},
+            },
+            f,
+            indent=2,
+        )
+
+    # readers only ever see complete snapshots
+    if os.path.exists(out_dir):
+        shutil.rmtree(out_dir)
+    os.rename(tmp_dir, out_dir)
+    return out_dir
+
+
+def read_snapshot(path: str, memory_map: bool = True) -> Dict[str, object]:
+    """Frames of one snapshot directory plus its manifest (key "manifest")."""
+    with open(os.path.join(path, MANIFEST), encoding="utf-8") as f:
+        out: Dict[str, object] = {"manifest": json.load(f)}
+    for name in SNAPSHOT_FRAMES:
+        out[name] = pd.read_parquet(os.path.join(path, f"{name}.parquet"), memory_map=memory_map)
+    return out
+
+
+def latest_snapshot_dir(root: Optional[str] = None) -> Optional[str]:
+    root = root or config.SNAPSHOT_DIR
+    if not os.path.isdir(root):
+        return None
+    best = None
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if name.isdigit() and os.path.exists(os.path.join(path, MANIFEST)):
+            if best is None or int(name) > int(os.path.basename(best)):
+                best = path
+    return best
+
+
+def load_current_snapshot(db_path: str = "data/portfolio.db", root: Optional[str] = None) -> Optional[Dict[str, object]]:
+    """
+    Memory-map the latest snapshot if it was taken at the DB's current data
+    version; returns None when there is none or the DB has changed since.
+    """
+    path = latest_snapshot_dir(root)
+    if path is None:
+        return None
+    try:
+        snap = read_snapshot(path)
+    except Exception as e:
+        print(f"Warning: Ignoring unreadable snapshot {path}: {e}")
+        return None
+    if int(snap["manifest"]["data_version"]) != get_data_version(db_path):
+        return None
+    return snap
+
+
+def prime_split_cache(snapshot: Dict[str, object]) -> None:
+    """Serve split ratios from the snapshot until the regular split TTL expires."""
+    splits = snapshot["splits"]
+    created = float(snapshot["manifest"].get("created_at", time.time()))
+    for code in snapshot["transactions"][Columns.STOCK_CODE].astype(str).unique():
+        rows = splits[splits["ticker"] == f"{code}.T"]
+        idx = pd.DatetimeIndex(pd.to_datetime(rows["date"]))
+        idx = idx.tz_localize("UTC") if idx.tz is None else idx.tz_convert("UTC")
+        seed_split_cache(code, pd.Series(rows["ratio"].to_numpy(dtype=float), index=idx), created)
+
+
+def import_snapshot(path: str, db_path: str = "data/portfolio.db"):
+    """Load a snapshot's transactions and cash flows into the DB (duplicates skipped)."""
+    snap = read_snapshot(path, memory_map=False)
+    tx_result = insert_transactions(snap["transactions"], db_path=db_path)
+    cf_result = insert_cash_flows(snap["cash_flows"], db_path=db_path)
+    return tx_result, cf_result
@@ -30,6 +30,12 @@ def get_layout() -> html.Div:
                     ),
                     html.Div(
                         [
+                            html.Div(
+                                "",
+                                id="dashboard-price-status",
+                                style={"opacity": "0.7", "fontSize": "12px"},
+                            ),
+                            dcc.Interval(id="dashboard-price-status-interval", interval=60 * 1000),
                             html.Button(
                                 UI.REFRESH,
                                 id="dashboard-refresh-btn",
@@ -106,6 +112,20 @@ def get_layout() -> html.Div:
                         ],
                         style={"minWidth": "320px"},
                     ),
+                    html.Div(
+                        [
+                            html.Div(UI.ACCOUNTS, style={
+                                     "marginBottom": "6px"}),
+                            dcc.Dropdown(
+                                id="dashboard-account",
+                                options=[],
+                                value=[],
+                                multi=True,
+                                placeholder=UI.ACCOUNTS_ALL,
+                            ),
+                        ],
+                        style={"minWidth": "220px"},
+                    ),
                     html.Div(
                         [
                             html.Div(UI.TOP_N, style={"marginBottom": "6px"}),
@@ -336,12 +356,14 @@ def get_layout() -> html.Div:
                                             dcc.Dropdown(
                                                 id="dashboard-benchmark",
                                                 options=[
-                                                    {"label": UI.BENCHMARK_NONE, "value": ""},
                                                     {"label": UI.BENCHMARK_SP500, "value": "SPY"},
                                                     {"label": UI.BENCHMARK_NIKKEI500, "value": "^N500"},
+                                                    {"label": UI.BENCHMARK_NIKKEI225, "value": "^N225"},
+                                                    {"label": UI.BENCHMARK_TOPIX, "value": "1306.T"},
                                                 ],
-                                                value="SPY",
-                                                clearable=False,
+                                                value=["SPY"],
+                                                multi=True,
+                                                placeholder=UI.BENCHMARK_NONE,
                                                 style={"width": "220px"},
                                             ),
                                         ],
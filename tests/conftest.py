@@ -0,0 +1,104 @@
+import pandas as pd
+import pytest
+
+from core.constants import Columns
+from core.providers import set_provider
+from core.splits import clear_split_cache
+from data_handler import db_manager
+from data_handler.connection import close_connections
+
+
+class StubProvider:
+    """Offline provider: no prices, per-ticker splits from `splits`; `splits_error` simulates an outage."""
+
+    name = "stub"
+
+    def __init__(self):
+        self.splits = {}
+        self.splits_error = None
+
+    def get_close_history(self, tickers, start=None, end=None, period=None):
+        return pd.DataFrame(columns=tickers, dtype=float)
+
+    def get_splits(self, ticker):
+        if self.splits_error is not None:
+            raise self.splits_error
+        return self.splits.get(ticker, pd.Series(dtype=float))
+
+
+@pytest.fixture
+def stub_provider():
+    provider = StubProvider()
+    set_provider(provider)
+    clear_split_cache()
+    yield provider
+    set_provider(None)
+    clear_split_cache()
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "portfolio.db")
+    db_manager.init_db(path)
+    yield path
+    close_connections(path)
+
+
+def _trade(date, code, trade_type, qty, price):
+    return {
+        Columns.DATE: pd.Timestamp(date), Columns.STOCK_CODE: code, Columns.STOCK_NAME: code,
+        Columns.TRADE_TYPE: trade_type, Columns.QUANTITY: qty, Columns.PRICE_PER_SHARE: price,
+        Columns.TOTAL_AMOUNT: qty * price, Columns.SETTLEMENT_DATE: pd.Timestamp(date), Columns.FEE: 0,
+    }
+
+
+@pytest.fixture
+def make_trade():
+    """Factory for one typed transaction row dict."""
+    return _trade
+
+
+# --- SBI transaction CSV exports ---
+
+SBI_HEADER = "約定日,銘柄,銘柄コード,市場,取引,期限,預り,課税,約定数量,約定単価,手数料/諸経費等,税額,受渡日,受渡金額/決済損益"
+
+
+def _sbi_row(date, code, side, qty, price, account="特定"):
+    trade = "株式現物買" if side == "buy" else "株式現物売"
+    return f"{date},銘柄{code},{code},東証,{trade},当日,{account},申告,{qty},{price},0,0,{date},{qty * price}"
+
+
+def _write_sbi_csv(path, rows):
+    preamble = [f"meta{i}" for i in range(8)]
+    path.write_text("\n".join(preamble + [SBI_HEADER] + rows) + "\n", encoding="shift_jis")
+    return str(path)
+
+
+# newest first, as SBI exports them; 2024/03/01 fills straddle chunk boundaries
+SBI_ROWS = [
+    _sbi_row("2024/03/04", 1111, "sell", 100, 15),
+    _sbi_row("2024/03/01", 2222, "buy", 100, 500),
+    _sbi_row("2024/03/01", 2222, "buy", 100, 500),
+    _sbi_row("2024/03/01", 2222, "buy", 100, 500),
+    _sbi_row("2024/03/01", 2222, "buy", 100, 500, account="NISA"),
+    _sbi_row("2024/02/01", 1111, "buy", 100, 12),
+    _sbi_row("2024/01/04", 1111, "buy", 100, 10),
+    _sbi_row("2024/01/04", 1111, "buy", 100, 10),
+]
+
+
+@pytest.fixture
+def sbi_rows():
+    return list(SBI_ROWS)
+
+
+@pytest.fixture
+def sbi_row():
+    """Formats one export line: sbi_row(date, code, side, qty, price, account="特定")."""
+    return _sbi_row
+
+
+@pytest.fixture
+def write_sbi_csv():
+    """Writes rows as a Shift-JIS SBI export (preamble + header) and returns the path."""
+    return _write_sbi_csv
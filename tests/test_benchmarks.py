@@ -0,0 +1,97 @@
+import pandas as pd
+import pytest
+
+from core import benchmarks
+from core.providers import set_provider
+
+
+class RangeProvider:
+    name = "range"
+
+    def __init__(self):
+        self.calls = []
+        idx = pd.bdate_range("2024-01-01", "2024-03-29")
+        self.series = pd.Series(range(len(idx)), index=idx, dtype=float)
+
+    def get_close_history(self, tickers, start=None, end=None, period=None):
+        self.calls.append((start, end))
+        s = self.series
+        if start:
+            s = s[s.index >= pd.Timestamp(start)]
+        if end:
+            s = s[s.index < pd.Timestamp(end)]
+        return pd.DataFrame({tickers[0]: s})
+
+    def get_splits(self, ticker):
+        return pd.Series(dtype=float)
+
+
+@pytest.fixture
+def provider(tmp_path, monkeypatch):
+    p = RangeProvider()
+    set_provider(p)
+    monkeypatch.setattr(benchmarks, "BENCH_CACHE_DIR", str(tmp_path))
+    benchmarks._BENCH_CACHE.clear()
+    yield p
+    set_provider(None)
+    benchmarks._BENCH_CACHE.clear()
+
+
+def test_benchmark_subrange_served_from_cache(provider):
+    full = benchmarks.get_benchmark_series("SPY", "2024-01-01", "2024-03-01")
+    sub = benchmarks.get_benchmark_series("SPY", "2024-02-01", "2024-02-15")
+    assert len(provider.calls) == 1
+    assert sub.index.min() == pd.Timestamp("2024-02-01")
+    assert sub.index.max() == pd.Timestamp("2024-02-15")
+    assert sub.equals(full.loc["2024-02-01":"2024-02-15"])
+
+
+def test_benchmark_fetches_only_uncovered_edges(provider):
+    benchmarks.get_benchmark_series("SPY", "2024-02-01", "2024-02-15")
+    out = benchmarks.get_benchmark_series("SPY", "2024-01-15", "2024-03-01")
+    assert provider.calls[1:] == [("2024-01-15", "2024-02-01"), ("2024-02-16", "2024-03-02")]
+    assert out.index.min() == pd.Timestamp("2024-01-15")
+    assert out.index.max() == pd.Timestamp("2024-03-01")
+
+
+def test_benchmark_cache_persists_to_disk(provider):
+    benchmarks.get_benchmark_series("^N500", "2024-01-01", "2024-03-01")
+    benchmarks._BENCH_CACHE.clear()
+    out = benchmarks.get_benchmark_series("^N500", "2024-01-10", "2024-01-20")
+    assert len(provider.calls) == 1
+    assert not out.empty
+
+
+def _loop_matched_returns(s, flows):
+    price_series = s.reindex(s.index.union(flows.index)).sort_index().ffill().bfill()
+    shares = net_dep = 0.0
+    out = []
+    for dt, price in price_series.items():
+        flow = float(flows.get(dt, 0.0))
+        shares += flow / price
+        net_dep += flow
+        out.append((shares * price - net_dep) / net_dep * 100.0 if net_dep else 0.0)
+    return out
+
+
+def test_cash_flow_matched_returns_matches_reference_loop():
+    idx = pd.to_datetime(["2024-01-02", "2024-01-03", "2024-01-05", "2024-01-08"])
+    prices = pd.DataFrame({"SPY": [100.0, 102.0, 98.0, 105.0], "^N225": [10.0, 11.0, 12.0, 9.0]}, index=idx)
+    flows = pd.Series([1000.0, 500.0, -200.0], index=pd.to_datetime(["2024-01-01", "2024-01-04", "2024-01-08"]))
+
+    out = benchmarks.cash_flow_matched_returns(prices, flows)
+    for t in prices.columns:
+        assert out[t].round(10).tolist() == pd.Series(_loop_matched_returns(prices[t], flows)).round(10).tolist()
+
+
+def test_build_benchmark_returns_several_tickers(provider):
+    cf = pd.DataFrame(
+        {
+            "date": ["2024-01-02", "2024-02-01", "2024-02-05"],
+            "type": ["Deposit", "Deposit", "Dividend"],
+            "amount": [1000, 500, 30],
+        }
+    )
+    out = benchmarks.build_benchmark_returns(["SPY", "QQQ"], "2024-01-02", "2024-02-29", cash_flows_df=cf)
+    assert set(out["label"]) == {"SPY (cash-flow matched)", "QQQ (cash-flow matched)"}
+    assert list(out.columns) == ["date", "benchmark_return_pct", "label"]
@@ -0,0 +1,45 @@
+import pandas as pd
+import pytest
+
+import cli
+from core import config
+from data_handler import db_manager
+from data_handler.csv_parser import clean_sbi_transaction_csv
+from data_handler.materialize import get_current_portfolio_metrics
+from data_handler.positions import get_positions_asof
+
+
+@pytest.mark.parametrize("workers,stream_bytes", [(1, None), (2, None), (1, 0)])
+def test_import_csvs_dedupes_across_files_and_reports(
+    tmp_path, db_path, stub_provider, sbi_rows, write_sbi_csv, monkeypatch, workers, stream_bytes
+):
+    if stream_bytes is not None:
+        # every file counts as large: streamed through the importer
+        monkeypatch.setattr(config, "TRANSACTION_CSV_STREAM_BYTES", stream_bytes)
+    uploads = tmp_path / "uploads"
+    uploads.mkdir()
+    # two overlapping exports plus one broken file
+    write_sbi_csv(uploads / "a.csv", sbi_rows[:5])
+    write_sbi_csv(uploads / "b.csv", sbi_rows[4:])
+    (uploads / "c.csv").write_text("not an export\n", encoding="shift_jis")
+
+    reports = {r.file: r for r in cli.import_csvs(folder=str(uploads), workers=workers, db_path=db_path)}
+    assert (reports["a.csv"].parsed, reports["a.csv"].inserted) == (3, 3)
+    # the NISA fill of 2024/03/01 is in both files
+    assert (reports["b.csv"].parsed, reports["b.csv"].inserted, reports["b.csv"].skipped) == (3, 2, 1)
+    assert reports["c.csv"].error and reports["c.csv"].parsed == 0
+    assert len(db_manager.get_transactions(db_path=db_path)) == 5
+    # the import leaves the materialized tables current for the dashboard
+    assert get_positions_asof(db_path=db_path) is not None
+    assert get_current_portfolio_metrics(db_path=db_path) is not None
+
+    again = cli.import_csvs(folder=str(uploads), workers=workers, db_path=db_path)
+    assert sum(r.inserted for r in again) == 0
+
+
+
+def test_dedup_keys_ignore_number_formats(tmp_path, sbi_row, write_sbi_csv):
+    a = clean_sbi_transaction_csv(write_sbi_csv(tmp_path / "a.csv", [sbi_row("2024/02/01", 1111, "buy", 100, 12)]))
+    # the same fill written as 100.0 shares / 1200.0 yen parses to float columns
+    b = clean_sbi_transaction_csv(write_sbi_csv(tmp_path / "b.csv", [sbi_row("2024/02/01", 1111, "buy", 100.0, 12)]))
+    assert cli._dedup_keys(b).isin(cli._dedup_keys(a)).all()
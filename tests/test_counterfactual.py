@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from core.counterfactual import build_flow_schedules, simulate_dca, simulate_never_sold
+from core.constants import Columns, TradeType
+
+pytestmark = pytest.mark.usefixtures("stub_provider")
+
+
+PRICES = pd.DataFrame(
+    {"SPY": [100.0, 200.0, 200.0, 400.0], "1111": [10.0, 10.0, 20.0, 20.0]},
+    index=pd.to_datetime(["2024-01-02", "2024-02-02", "2024-03-04", "2024-04-02"]),
+)
+
+
+def test_flow_schedules_keep_net_deposit():
+    flows = pd.Series([1200.0], index=pd.to_datetime(["2024-01-02"]))
+    sched = build_flow_schedules(flows, pd.DatetimeIndex(PRICES.index), {"lump": 1, "dca3": 3, "dca12": 12})
+    assert sched["lump"].tolist() == [1200.0, 0.0, 0.0, 0.0]
+    assert sched["dca3"].tolist() == [400.0, 400.0, 400.0, 0.0]
+    assert np.allclose(sched.sum().to_numpy(), 1200.0)
+
+
+def test_simulate_dca_batches_scenarios_and_tickers():
+    cf = pd.DataFrame({"date": ["2024-01-02"], "type": ["Deposit"], "amount": [1200]})
+    out = simulate_dca(cf, PRICES, schedules={"lump": 1, "dca3": 3})
+    last = out[out[Columns.DATE] == pd.Timestamp("2024-04-02")].set_index(["scenario", "ticker"])
+
+    assert last.loc[("lump", "SPY"), "value"] == pytest.approx(4800.0)
+    # 400 @100 + 400 @200 + 400 @200 -> 8 units @400
+    assert last.loc[("dca3", "SPY"), "value"] == pytest.approx(3200.0)
+    # 40 + 40 + 20 units @20
+    assert last.loc[("dca3", "1111"), "return_pct"] == pytest.approx((2000.0 - 1200.0) / 1200.0 * 100.0)
+    assert len(out) == 4 * 2 * 2
+
+
+def test_simulate_never_sold():
+    tx = pd.DataFrame(
+        {
+            "id": [1, 2],
+            Columns.DATE: ["2024-01-02", "2024-02-02"],
+            Columns.STOCK_CODE: ["1111", "1111"],
+            Columns.TRADE_TYPE: [TradeType.BUY, TradeType.SELL],
+            Columns.QUANTITY: [100, 40],
+            Columns.PRICE_PER_SHARE: [10.0, 10.0],
+            Columns.TOTAL_AMOUNT: [1000, 400],
+            Columns.FEE: [0, 0],
+        }
+    )
+    out = simulate_never_sold(tx, PRICES)
+    last = out.iloc[-1]
+    assert last["sold_qty_cum"] == 40
+    assert last["value_if_held"] == pytest.approx(800.0)
+    assert last["missed_gain"] == pytest.approx(400.0)
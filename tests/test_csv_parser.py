@@ -0,0 +1,65 @@
+import io
+
+import pandas as pd
+import pytest
+
+from core.constants import Columns
+from data_handler.csv_parser import clean_sbi_transaction_csv, iter_sbi_transaction_csv
+from data_handler.importer import import_sbi_transaction_csv
+from data_handler.positions import get_positions_asof
+
+
+def _sorted(df):
+    keys = [Columns.ACCOUNT, Columns.DATE, Columns.STOCK_CODE, Columns.TRADE_TYPE]
+    return df.sort_values(keys).reset_index(drop=True)[keys + [Columns.QUANTITY, Columns.TOTAL_AMOUNT]]
+
+
+def test_streaming_matches_whole_file_parse(tmp_path, sbi_rows, write_sbi_csv):
+    path = write_sbi_csv(tmp_path / "tx.csv", sbi_rows)
+    whole = clean_sbi_transaction_csv(path)
+    chunks = list(iter_sbi_transaction_csv(path, chunksize=2))
+    assert len(chunks) > 1
+    # no chunk keeps more than the rows of one date pending
+    assert max(len(c) for c in chunks) <= 2
+    pd.testing.assert_frame_equal(_sorted(pd.concat(chunks)), _sorted(whole))
+    merged = _sorted(whole).set_index([Columns.ACCOUNT, Columns.STOCK_CODE, Columns.DATE])
+    assert merged.loc[("特定", "2222", pd.Timestamp("2024-03-01")), Columns.QUANTITY] == 300
+
+
+def test_unsorted_file_is_still_merged(tmp_path, sbi_rows, write_sbi_csv):
+    # the 2024/01/04 fills sit on either side of a later trade
+    rows = [sbi_rows[6], sbi_rows[0], sbi_rows[5], sbi_rows[7]]
+    path = write_sbi_csv(tmp_path / "tx.csv", rows)
+    chunks = list(iter_sbi_transaction_csv(path, chunksize=1))
+    # streamed date by date, not parsed in one piece
+    assert len(chunks) == 3
+    pd.testing.assert_frame_equal(_sorted(pd.concat(chunks)), _sorted(clean_sbi_transaction_csv(path)))
+    assert _sorted(pd.concat(chunks))[Columns.QUANTITY].tolist() == [200, 100, 100]
+
+
+def test_non_seekable_input_streams(tmp_path, sbi_rows, write_sbi_csv):
+    path = write_sbi_csv(tmp_path / "tx.csv", sbi_rows)
+
+    class Pipe(io.RawIOBase):
+        def __init__(self, data):
+            self._inner = io.BytesIO(data)
+
+        def readable(self):
+            return True
+
+        def readinto(self, buf):
+            return self._inner.readinto(buf)
+
+    with open(path, "rb") as f:
+        pipe = io.BufferedReader(Pipe(f.read()))
+    assert not pipe.seekable()
+    streamed = pd.concat(iter_sbi_transaction_csv(pipe, chunksize=2))
+    pd.testing.assert_frame_equal(_sorted(streamed), _sorted(clean_sbi_transaction_csv(path)))
+
+
+def test_streaming_import_feeds_bulk_inserts(tmp_path, db_path, stub_provider, sbi_rows, write_sbi_csv):
+    path = write_sbi_csv(tmp_path / "tx.csv", sbi_rows)
+    result = import_sbi_transaction_csv(path, db_path=db_path, chunksize=3)
+    assert (result.inserted, result.skipped) == (5, 0)
+    assert get_positions_asof(db_path=db_path) is not None  # refreshed after the import
+    assert import_sbi_transaction_csv(path, db_path=db_path, chunksize=3).skipped == 5
@@ -0,0 +1,90 @@
+import pandas as pd
+import pytest
+
+from callbacks import dashboard_callbacks
+from core.constants import Columns, TradeType
+from data_handler import db_manager
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache():
+    dashboard_callbacks._DERIVED.clear()
+    yield
+    dashboard_callbacks._DERIVED.clear()
+
+
+def test_end_date_slices_one_cached_frame(db_path, make_trade, monkeypatch):
+    db_manager.insert_transactions(pd.DataFrame([
+        make_trade("2024-01-04", "1111", TradeType.BUY, 100, 10.0),
+        make_trade("2024-02-01", "1111", TradeType.BUY, 100, 12.0),
+        make_trade("2024-03-04", "1111", TradeType.SELL, 100, 15.0),
+    ]), db_path=db_path)
+    monkeypatch.setattr(dashboard_callbacks, "get_transactions",
+                        lambda accounts=None: db_manager.get_transactions(accounts=accounts, db_path=db_path))
+    version = db_manager.get_data_version(db_path)
+
+    for end in ["2024-01-31", "2024-02-01", "2024-03-31", None]:
+        got = dashboard_callbacks._transactions_upto(version, end, None)
+        want = db_manager.get_transactions(end=end, db_path=db_path)
+        assert got[Columns.DATE].tolist() == want[Columns.DATE].tolist()
+    # one full frame per account selection, however many end dates were viewed
+    assert len(dashboard_callbacks._DERIVED) == 1
+
+
+def _render(**overrides):
+    args = dict(
+        n_clicks=None, start_date=None, end_date=None, positions_mode="holding", topn=10, alloc_topn=4,
+        target_net=0, net_icon=None, goal_icon=None, asset_view="value", benchmark_ticker=None,
+        perf_tab="realized", pnl_kind="unrealized", accounts=None,
+    )
+    args.update(overrides)
+    return dashboard_callbacks.update_dashboard(**args)
+
+
+def test_snapshot_primed_first_render_skips_replay(db_path, stub_provider, make_trade, tmp_path, monkeypatch):
+    from functools import partial
+
+    from core import ledger, portfolio
+    from data_handler import materialize, positions
+    from data_handler.snapshot import export_snapshot, load_current_snapshot, prime_split_cache
+
+    stub_provider.splits["1111.T"] = pd.Series([2.0], index=pd.DatetimeIndex(["2024-01-20"]).tz_localize("UTC"))
+    db_manager.insert_transactions(pd.DataFrame([
+        make_trade("2024-01-04", "1111", TradeType.BUY, 100, 10.0),
+        make_trade("2024-02-01", "1111", TradeType.SELL, 50, 6.0),
+    ]), db_path=db_path)
+    db_manager.insert_cash_flows(
+        pd.DataFrame({"date": ["2024-01-02"], "type": ["Deposit"], "amount": [5000]}), db_path=db_path
+    )
+    for name, fn in [
+        ("get_data_version", db_manager.get_data_version),
+        ("get_cash_flow_totals", db_manager.get_cash_flow_totals),
+        ("get_daily_cash_flows", db_manager.get_daily_cash_flows),
+        ("get_transactions", db_manager.get_transactions),
+        ("get_current_portfolio_metrics", materialize.get_current_portfolio_metrics),
+        ("get_positions_asof", positions.get_positions_asof),
+    ]:
+        monkeypatch.setattr(dashboard_callbacks, name, partial(fn, db_path=db_path))
+    monkeypatch.setattr(dashboard_callbacks, "get_price_map", lambda codes: {"1111": 8.0})
+
+    expected = _render()
+    dashboard_callbacks._DERIVED.clear()
+
+    root = str(tmp_path / "snapshots")
+    export_snapshot(db_path, root=root)
+    snapshot = load_current_snapshot(db_path, root=root)
+    prime_split_cache(snapshot)
+    dashboard_callbacks.seed_from_snapshot(snapshot)
+
+    def replayed(*args, **kwargs):
+        raise AssertionError("first render re-derived data the snapshot carries")
+
+    monkeypatch.setattr(ledger, "_position_states", replayed)
+    for module in (ledger, portfolio, dashboard_callbacks):
+        monkeypatch.setattr(module, "stocks_split_adjustments", replayed)
+
+    rendered = _render()
+    # holdings table and KPIs match the render computed from the database
+    assert rendered[12] == expected[12]
+    assert rendered[:8] == expected[:8]
+    assert rendered[12][0][Columns.QTY] == 150  # 100 bought before the 1:2 split, 50 sold after
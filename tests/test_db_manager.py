@@ -0,0 +1,437 @@
+import sqlite3
+import threading
+
+import pandas as pd
+import pytest
+
+from core.cache import VersionedCache
+from core.constants import Columns, TradeType
+from data_handler import db_manager
+from data_handler.connection import close_connections, get_connection
+from data_handler.migrations import MIGRATIONS, get_schema_version
+
+
+def _tx_frame(rows):
+    df = pd.DataFrame(rows)
+    df[Columns.DATE] = pd.to_datetime(df[Columns.DATE])
+    df[Columns.SETTLEMENT_DATE] = pd.to_datetime(df[Columns.SETTLEMENT_DATE])
+    return df
+
+
+TX = [
+    {
+        Columns.DATE: "2024-01-04", Columns.STOCK_CODE: "1111", Columns.STOCK_NAME: "A",
+        Columns.TRADE_TYPE: TradeType.BUY, Columns.QUANTITY: 100, Columns.PRICE_PER_SHARE: 10.0,
+        Columns.TOTAL_AMOUNT: 1000.0, Columns.SETTLEMENT_DATE: "2024-01-08", Columns.FEE: 0.0,
+    },
+    {
+        Columns.DATE: "2024-02-01", Columns.STOCK_CODE: "2222", Columns.STOCK_NAME: "B",
+        Columns.TRADE_TYPE: TradeType.BUY, Columns.QUANTITY: 10, Columns.PRICE_PER_SHARE: 500.0,
+        Columns.TOTAL_AMOUNT: 5000.0, Columns.SETTLEMENT_DATE: "2024-02-05", Columns.FEE: 0.0,
+    },
+]
+
+
+def test_connection_pool_is_shared_across_threads_with_wal(db_path):
+    conn = get_connection(db_path)
+    assert get_connection(db_path) is conn
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+
+    other = []
+    t = threading.Thread(target=lambda: other.append(get_connection(db_path)))
+    t.start()
+    t.join()
+    assert other[0] is not conn
+
+    # a finished thread's connection is handed to the next thread, not reopened
+    again = []
+    t = threading.Thread(target=lambda: again.append(get_connection(db_path)))
+    t.start()
+    t.join()
+    assert again[0] is other[0]
+
+
+def test_close_connections_reconnects_lazily(db_path):
+    conn = get_connection(db_path)
+    close_connections(db_path)
+    fresh = get_connection(db_path)
+    assert fresh is not conn
+    assert fresh.execute("SELECT COUNT(*) FROM transactions").fetchone()[0] == 0
+
+
+def test_functions_share_pooled_connection(db_path):
+    db_manager.insert_transactions(_tx_frame(TX), db_path=db_path)
+    assert len(db_manager.get_all_transactions(db_path)) == 2
+    assert db_manager.get_stock_codes(db_path) == ["1111", "2222"]
+
+
+def test_bulk_insert_reports_inserted_and_skipped(db_path):
+    first = db_manager.insert_transactions(_tx_frame(TX), db_path=db_path)
+    assert (first.inserted, first.skipped) == (2, 0)
+
+    again = _tx_frame(TX + [dict(TX[0], **{Columns.DATE: "2024-03-01", Columns.SETTLEMENT_DATE: "2024-03-05"})])
+    second = db_manager.insert_transactions(again, db_path=db_path)
+    assert (second.inserted, second.skipped) == (1, 2)
+    assert len(db_manager.get_all_transactions(db_path)) == 3
+
+
+def test_bulk_insert_maps_missing_numbers_to_null(db_path):
+    splits_df = pd.DataFrame({"date": ["2024-01-01", "2024-01-01"], "ticker": ["1111", "1111"], "ratio": ["--", "--"]})
+    result = db_manager.insert_stock_splits(splits_df, db_path=db_path)
+    # NULL never equals NULL, so UNIQUE does not collapse these
+    assert result.inserted == 2
+    row = get_connection(db_path).execute("SELECT ratio, notes FROM stock_splits").fetchone()
+    assert row == (None, "")
+
+
+def test_migrations_upgrade_legacy_cash_flows(tmp_path):
+    path = str(tmp_path / "legacy.db")
+    conn = get_connection(path)
+    conn.execute("CREATE TABLE cash_flows (id INTEGER PRIMARY KEY, date TEXT, type TEXT, amount REAL, currency TEXT, notes TEXT)")
+    conn.commit()
+
+    db_manager.init_db(path)
+    cols = [r[1] for r in conn.execute("PRAGMA table_info(cash_flows)")]
+    assert {"category", "source", "transfer_credit"} <= set(cols)
+    assert get_schema_version(conn) == MIGRATIONS[-1][0]
+    plan = conn.execute(
+        "EXPLAIN QUERY PLAN SELECT * FROM transactions WHERE stock_code = ? ORDER BY date, id", ("1111",)
+    ).fetchall()
+    assert "idx_transactions_code_date" in str(plan)
+
+    cf = pd.DataFrame({"date": ["2024-01-05"], "type": ["Deposit"], "amount": [1000], "source": ["bank"]})
+    assert db_manager.insert_cash_flows(cf, db_path=path).inserted == 1
+    db_manager.init_db(path)  # idempotent
+    close_connections(path)
+
+
+def test_get_transactions_filters_in_sql(db_path):
+    db_manager.insert_transactions(_tx_frame(TX), db_path=db_path)
+
+    only_a = db_manager.get_transactions(codes=["1111"], db_path=db_path)
+    assert only_a[Columns.STOCK_CODE].tolist() == ["1111"]
+
+    window = db_manager.get_transactions(start="2024-01-10", end=pd.Timestamp("2024-02-01"), db_path=db_path)
+    assert window[Columns.STOCK_CODE].tolist() == ["2222"]
+
+    names = db_manager.get_transactions(columns=[Columns.STOCK_CODE, Columns.STOCK_NAME], db_path=db_path)
+    assert list(names.columns) == [Columns.STOCK_CODE, Columns.STOCK_NAME]
+    assert db_manager.get_transactions(codes=[], db_path=db_path).empty
+    with pytest.raises(ValueError):
+        db_manager.get_transactions(columns=["id; DROP TABLE transactions"], db_path=db_path)
+
+
+def test_cash_flow_totals_and_daily_aggregation(db_path):
+    cf = pd.DataFrame(
+        {
+            "date": ["2024-01-05", "2024-01-05", "2024-02-01", "2024-03-01", None],
+            "type": ["Deposit", "Deposit", "Dividend", "Withdrawal", "Deposit"],
+            "amount": [1000, 500, 30, -200, 999],
+            "source": ["a", "b", "", "", ""],
+        }
+    )
+    db_manager.insert_cash_flows(cf, db_path=db_path)
+
+    assert db_manager.get_cash_flow_totals(db_path=db_path) == {"Deposit": 1500.0, "Dividend": 30.0, "Withdrawal": -200.0}
+    assert db_manager.get_cash_flow_totals(as_of="2024-02-01", db_path=db_path) == {"Deposit": 1500.0, "Dividend": 30.0}
+
+    daily = db_manager.get_daily_cash_flows(types=["Deposit", "Withdrawal"], db_path=db_path)
+    assert daily["amount"].tolist() == [1500.0, -200.0]
+    assert str(daily[Columns.DATE].dtype).startswith("datetime64")
+    # undated rows are excluded from both, so totals match the daily series
+    all_daily = db_manager.get_daily_cash_flows(db_path=db_path)
+    assert all_daily.groupby("type")["amount"].sum().to_dict() == db_manager.get_cash_flow_totals(db_path=db_path)
+
+
+def test_data_version_bumps_on_writes_only(db_path):
+    v0 = db_manager.get_data_version(db_path)
+    db_manager.insert_transactions(_tx_frame(TX), db_path=db_path)
+    v1 = db_manager.get_data_version(db_path)
+    assert v1 == v0 + 1  # one bump per write transaction, not per row
+
+    db_manager.insert_transactions(_tx_frame(TX), db_path=db_path)  # all duplicates
+    assert db_manager.get_data_version(db_path) == v1
+
+    db_manager.clear_db(db_path)
+    assert db_manager.get_data_version(db_path) > v1
+    assert db_manager.get_all_transactions(db_path).empty
+
+
+def test_versioned_cache_drops_entries_on_new_version():
+    cache = VersionedCache(maxsize=2)
+    calls = []
+    compute = lambda: calls.append(1) or len(calls)
+    assert cache.get_or_compute(1, "a", compute) == 1
+    assert cache.get_or_compute(1, "a", compute) == 1
+    assert cache.get_or_compute(2, "a", compute) == 2
+    assert len(calls) == 2
+
+
+def test_loaders_return_typed_frames(db_path):
+    db_manager.insert_transactions(_tx_frame(TX), db_path=db_path)
+    df = db_manager.get_transactions(db_path=db_path)
+
+    assert str(df[Columns.DATE].dtype) == "datetime64[ns]"
+    assert isinstance(df[Columns.STOCK_CODE].dtype, pd.CategoricalDtype)
+    assert isinstance(df[Columns.TRADE_TYPE].dtype, pd.CategoricalDtype)
+    assert df[Columns.QUANTITY].dtype == "int64"
+    assert df[Columns.TOTAL_AMOUNT].dtype == "int64"
+    assert df[Columns.PRICE_PER_SHARE].dtype == "float64"
+    assert str(db_manager.get_all_transactions(db_path)[Columns.SETTLEMENT_DATE].dtype) == "datetime64[ns]"
+
+
+def test_typed_frame_flows_through_ledger(db_path, stub_provider):
+    from core.ledger import build_holdings_snapshot, compute_realized_window
+
+    db_manager.insert_transactions(_tx_frame(TX), db_path=db_path)
+    tx = db_manager.get_transactions(db_path=db_path)
+    snap = build_holdings_snapshot(tx, {"1111": 12.0, "2222": 450.0})
+    assert sorted(snap[Columns.STOCK_CODE]) == ["1111", "2222"]
+    assert snap[Columns.MARKET_VALUE].sum() == 1200 + 4500
+    assert len(compute_realized_window(tx)) == 2
+
+
+def test_integer_yen_migration_rounds_legacy_reals(tmp_path):
+    path = str(tmp_path / "legacy.db")
+    conn = get_connection(path)
+    conn.execute("""
+        CREATE TABLE transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, date TEXT, stock_code TEXT, stock_name TEXT,
+            trade_type TEXT, quantity REAL, price_per_share REAL, total_amount REAL,
+            settlement_date TEXT, fee REAL,
+            UNIQUE(date, stock_code, trade_type, quantity, price_per_share, total_amount)
+        )
+    """)
+    conn.execute(
+        "INSERT INTO transactions VALUES (7, '2024-01-04', '1111', 'A', ?, 100.0, 10.05, 1004.6, '2024-01-08', NULL)",
+        (TradeType.BUY,),
+    )
+    conn.commit()
+
+    db_manager.init_db(path)
+    row = conn.execute("SELECT id, quantity, total_amount, fee, typeof(total_amount) FROM transactions").fetchone()
+    assert row == (7, 100, 1005, 0, "integer")
+    # per-row version triggers are gone once every migration ran
+    assert conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'").fetchall() == []
+    close_connections(path)
+
+
+def test_integer_yen_migration_refuses_to_merge_rows(tmp_path):
+    path = str(tmp_path / "legacy.db")
+    conn = get_connection(path)
+    conn.execute("""
+        CREATE TABLE transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, date TEXT, stock_code TEXT, stock_name TEXT,
+            trade_type TEXT, quantity REAL, price_per_share REAL, total_amount REAL,
+            settlement_date TEXT, fee REAL,
+            UNIQUE(date, stock_code, trade_type, quantity, price_per_share, total_amount)
+        )
+    """)
+    conn.executemany(
+        "INSERT INTO transactions VALUES (?, '2024-01-04', '1111', 'A', ?, 100.0, 10.05, ?, '2024-01-08', 0)",
+        [(1, TradeType.BUY, 1004.6), (2, TradeType.BUY, 1004.7)],
+    )
+    conn.commit()
+
+    with pytest.raises(RuntimeError, match="ids 2"):
+        db_manager.init_db(path)
+    # rolled back: both rows kept, still on the schema before the migration
+    assert conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0] == 2
+    assert get_schema_version(conn) == 3
+    close_connections(path)
+
+
+def _legacy_db_with(path, tx):
+    """A database as it was before accounts (migration 5), holding `tx`."""
+    conn = get_connection(path)
+    conn.execute("""
+        CREATE TABLE transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, date TEXT, stock_code TEXT, stock_name TEXT,
+            trade_type TEXT, quantity REAL, price_per_share REAL, total_amount REAL,
+            settlement_date TEXT, fee REAL,
+            UNIQUE(date, stock_code, trade_type, quantity, price_per_share, total_amount)
+        )
+    """)
+    conn.executemany(
+        "INSERT INTO transactions (date, stock_code, stock_name, trade_type, quantity, price_per_share, total_amount, settlement_date, fee) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        [
+            (f"{r.date:%Y-%m-%d}", r.stock_code, r.stock_name, r.trade_type, float(r.quantity),
+             float(r.price_per_share), float(r.total_amount), f"{r.settlement_date:%Y-%m-%d}", 0.0)
+            for r in tx.itertuples(index=False)
+        ],
+    )
+    conn.commit()
+    return conn
+
+
+def test_reimporting_pre_account_csv_does_not_duplicate(tmp_path, stub_provider, sbi_rows, write_sbi_csv):
+    from data_handler.csv_parser import clean_sbi_transaction_csv
+    from data_handler.positions import get_positions_asof, refresh_daily_positions
+
+    tx = clean_sbi_transaction_csv(write_sbi_csv(tmp_path / "export.csv", sbi_rows))
+    path = str(tmp_path / "legacy.db")
+    conn = _legacy_db_with(path, tx[tx[Columns.ACCOUNT] == "特定"])
+    db_manager.init_db(path)
+    assert conn.execute("SELECT DISTINCT account FROM transactions").fetchall() == [("",)]
+    refresh_daily_positions(path)
+
+    # the same export again: known trades take their bucket, only the NISA fill is new
+    statements = []
+    conn.set_trace_callback(statements.append)
+    result = db_manager.insert_transactions(tx, db_path=path)
+    conn.set_trace_callback(None)
+    assert (result.inserted, result.skipped) == (1, len(tx) - 1)
+    # matched as one set-based pass, not a statement per row
+    assert sum("UPDATE OR IGNORE transactions" in q for q in statements) == 1
+    assert len(db_manager.get_transactions(db_path=path)) == len(tx)
+    assert conn.execute("SELECT COUNT(*) FROM transactions WHERE account = ''").fetchone()[0] == 0
+    # claiming a bucket rewrites stored rows: positions go stale and rebuild under the buckets
+    assert get_positions_asof(db_path=path) is None
+    refresh_daily_positions(path)
+    assert set(get_positions_asof(db_path=path)[Columns.ACCOUNT]) == {"特定", "NISA"}
+    close_connections(path)
+
+
+def test_unbucketed_rows_match_any_bucket(db_path):
+    bucketed = _tx_frame(TX)
+    bucketed[Columns.ACCOUNT] = ["NISA", "特定"]
+    assert db_manager.insert_transactions(bucketed, db_path=db_path).inserted == 2
+    version = db_manager.get_data_version(db_path)
+
+    # the same trades from a source without buckets are already stored
+    result = db_manager.insert_transactions(_tx_frame(TX), db_path=db_path)
+    assert (result.inserted, result.skipped) == (0, 2)
+    assert db_manager.get_data_version(db_path) == version  # scratch-table writes are not data changes
+
+
+def test_migration_drops_unbucketed_duplicates(tmp_path, monkeypatch, sbi_rows, write_sbi_csv):
+    from data_handler import migrations
+
+    from data_handler.csv_parser import clean_sbi_transaction_csv
+
+    tx = clean_sbi_transaction_csv(write_sbi_csv(tmp_path / "export.csv", sbi_rows[:1]))
+    path = str(tmp_path / "legacy.db")
+    conn = _legacy_db_with(path, tx)
+    monkeypatch.setattr(migrations, "MIGRATIONS", MIGRATIONS[:8])
+    db_manager.init_db(path)
+    # re-imported before the fix: stored a second time under its bucket
+    conn.execute("INSERT INTO transactions (account_id, account, date, stock_code, trade_type, quantity, price_per_share, total_amount) "
+                 "SELECT account_id, '特定', date, stock_code, trade_type, quantity, price_per_share, total_amount FROM transactions")
+    conn.commit()
+    version = db_manager.get_data_version(path)
+
+    monkeypatch.setattr(migrations, "MIGRATIONS", MIGRATIONS)
+    db_manager.init_db(path)
+    assert conn.execute("SELECT account FROM transactions").fetchall() == [("特定",)]
+    assert db_manager.get_data_version(path) > version
+    close_connections(path)
+
+
+def test_accounts_partition_rows_and_ledgers(db_path, stub_provider):
+    from core.ledger import build_holdings_snapshot, compute_realized_window
+
+    # the same fill in two accounts is two trades, not a duplicate
+    assert db_manager.insert_transactions(_tx_frame(TX), db_path=db_path, account_id="a").inserted == 2
+    assert db_manager.insert_transactions(_tx_frame(TX), db_path=db_path, account_id="b").inserted == 2
+    assert db_manager.insert_transactions(_tx_frame(TX), db_path=db_path, account_id="b").skipped == 2
+    more = [
+        {**TX[0], Columns.DATE: "2024-01-10", Columns.PRICE_PER_SHARE: 20.0, Columns.TOTAL_AMOUNT: 2000.0},
+        {**TX[0], Columns.DATE: "2024-03-01", Columns.TRADE_TYPE: TradeType.SELL,
+         Columns.PRICE_PER_SHARE: 30.0, Columns.TOTAL_AMOUNT: 3000.0},
+    ]
+    db_manager.insert_transactions(_tx_frame(more), db_path=db_path, account_id="b")
+    assert db_manager.get_accounts(db_path=db_path) == ["a", "b"]
+    assert len(db_manager.get_transactions(accounts=["a"], db_path=db_path)) == 2
+
+    tx = db_manager.get_transactions(codes=["1111"], db_path=db_path)
+    # account b sells at its own average cost of 15, not the merged 13.33
+    per_account = build_holdings_snapshot(tx, {"1111": 12.0}, by_account=True)
+    assert per_account.set_index(Columns.ACCOUNT_ID)[Columns.REALIZED].to_dict() == {"a": 0, "b": 1500}
+    merged = build_holdings_snapshot(tx, {"1111": 12.0})
+    assert merged[[Columns.QTY, Columns.COST_TOTAL, Columns.REALIZED]].iloc[0].tolist() == [200, 2500, 1500]
+    assert compute_realized_window(tx)[Columns.REALIZED_WINDOW].tolist() == [1500]
+
+
+def test_read_mirror_serves_reads_and_follows_writes(db_path, monkeypatch):
+    from core import config
+    from data_handler.connection import (
+        bump_data_version, bump_rewrite_version, expire_read_mirror, get_read_connection,
+    )
+
+    monkeypatch.setattr(config, "SQLITE_READ_MIRROR", True)
+    db_manager.insert_transactions(_tx_frame(TX[:1]), db_path=db_path)
+    mirror = get_read_connection(db_path)
+    assert mirror is not get_connection(db_path)
+    assert mirror.execute("PRAGMA database_list").fetchone()[2].startswith("/portfolio-mirror-")  # memdb
+    assert get_read_connection(db_path) is mirror
+    assert len(db_manager.get_transactions(db_path=db_path)) == 1
+
+    # appended rows are copied into the same mirror
+    db_manager.insert_transactions(_tx_frame(TX), db_path=db_path)
+    assert len(db_manager.get_transactions(db_path=db_path)) == 2
+    assert get_read_connection(db_path) is mirror
+    with pytest.raises(sqlite3.OperationalError):
+        mirror.execute("DELETE FROM transactions")
+
+    # in-place updates flagged through rewrite_version are not appends either: a fresh full copy
+    conn = get_connection(db_path)
+    with conn:
+        conn.execute("UPDATE transactions SET account = 'NISA'")
+        bump_rewrite_version(conn)
+        bump_data_version(conn)
+    expire_read_mirror(db_path)
+    assert set(db_manager.get_transactions(db_path=db_path)[Columns.ACCOUNT]) == {"NISA"}
+    assert get_read_connection(db_path) is not mirror
+
+    db_manager.clear_db(db_path)
+    assert db_manager.get_transactions(db_path=db_path).empty
+    assert get_read_connection(db_path) is not mirror
+
+
+def test_read_mirror_gives_each_thread_its_own_reader(db_path, monkeypatch):
+    import threading
+
+    from core import config
+    from data_handler.connection import get_read_connection
+
+    monkeypatch.setattr(config, "SQLITE_READ_MIRROR", True)
+    db_manager.insert_transactions(_tx_frame(TX), db_path=db_path)
+    mine = get_read_connection(db_path)
+    seen = {}
+
+    def read():
+        conn = get_read_connection(db_path)
+        seen["conn"] = conn
+        seen["rows"] = conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+        seen["file"] = conn.execute("PRAGMA database_list").fetchone()[2]
+
+    worker = threading.Thread(target=read)
+    worker.start()
+    worker.join()
+    # a separate connection onto the same in-memory copy
+    assert seen["conn"] is not mine
+    assert seen["file"] == mine.execute("PRAGMA database_list").fetchone()[2]
+    assert seen["rows"] == 2
+
+
+def test_read_mirror_rechecks_version_after_interval(db_path, monkeypatch):
+    from core import config
+    from data_handler.connection import get_read_connection
+
+    monkeypatch.setattr(config, "SQLITE_READ_MIRROR", True)
+    monkeypatch.setattr(config, "SQLITE_READ_MIRROR_CHECK_SEC", 3600.0)
+    db_manager.insert_transactions(_tx_frame(TX[:1]), db_path=db_path)
+    mirror = get_read_connection(db_path)
+
+    # a write from another process is only noticed once the check interval passes
+    other = sqlite3.connect(db_path)
+    with other:
+        other.execute("DELETE FROM transactions")
+        other.execute("UPDATE db_meta SET value = value + 1 WHERE key = 'data_version'")
+    other.close()
+    assert get_read_connection(db_path) is mirror
+    monkeypatch.setattr(config, "SQLITE_READ_MIRROR_CHECK_SEC", 0.0)
+    assert get_read_connection(db_path) is not mirror
+    assert db_manager.get_transactions(db_path=db_path).empty
@@ -1,6 +1,14 @@
 import pandas as pd
 
-from core.ledger import build_trade_ledger, compute_realized_window
+from core.ledger import (
+    build_holdings_snapshot,
+    build_position_ledgers,
+    build_trade_ledger,
+    compute_realized_window,
+    holdings_from_ledgers,
+    ledger_partitions,
+    realized_window_from_ledgers,
+)
 from core.constants import Columns, TradeType
 
 
@@ -74,3 +82,53 @@ def test_compute_realized_window():
 
     assert row[Columns.REALIZED_WINDOW] == 80
     assert round(row[Columns.COST_BASIS_WINDOW], 2) == 400.0
+
+
+def test_ledger_partitions_leave_the_frame_alone():
+    df = _make_tx_df(
+        [
+            {Columns.ACCOUNT: None, Columns.STOCK_CODE: "1111"},
+            {Columns.ACCOUNT: "NISA", Columns.STOCK_CODE: "1111"},
+        ]
+    )
+    groups = dict(ledger_partitions(df).size())
+    assert groups == {("", "1111"): 1, ("NISA", "1111"): 1}
+    assert df[Columns.ACCOUNT].isna().sum() == 1  # caller's (possibly cached) frame untouched
+
+
+def test_ledger_slices_match_replays(stub_provider, make_trade):
+    df = pd.DataFrame([
+        make_trade("2024-01-04", "1111", TradeType.BUY, 100, 10.0),
+        make_trade("2024-01-10", "1111", TradeType.SELL, 40, 12.0),
+        make_trade("2024-02-01", "1111", TradeType.BUY, 30, 11.0),
+        make_trade("2024-02-10", "1111", TradeType.SELL, 50, 13.0),
+        make_trade("2024-02-12", "2222", TradeType.BUY, 10, 500.0),
+    ])
+    df[Columns.ACCOUNT] = ["特定", "特定", "NISA", "特定", "NISA"]
+    ledgers = build_position_ledgers(df)
+    prices = {"1111": 14.0, "2222": 480.0}
+
+    for start, end in [(None, None), ("2024-01-05", "2024-01-31"), (None, "2024-02-05"), ("2024-02-01", None)]:
+        sliced = df if end is None else df[df[Columns.DATE] <= pd.Timestamp(end)]
+        assert holdings_from_ledgers(ledgers, prices, end_date=end, positions_mode="all").equals(
+            build_holdings_snapshot(sliced, prices, positions_mode="all")
+        )
+        assert realized_window_from_ledgers(ledgers, start, end).equals(
+            compute_realized_window(sliced, start_date=start, end_date=end)
+        )
+
+
+def test_fractional_split_adjusted_shares_are_not_rounded():
+    # 3 shares through a 1:2 reverse split, then half a share sold
+    df = _make_tx_df(
+        [
+            {Columns.DATE: "2024-01-01", Columns.STOCK_CODE: "1111", Columns.TRADE_TYPE: TradeType.BUY,
+             Columns.QUANTITY: 1.5, Columns.PRICE_PER_SHARE: 200.0, Columns.TOTAL_AMOUNT: 300, Columns.FEE: 0},
+            {Columns.DATE: "2024-02-01", Columns.STOCK_CODE: "1111", Columns.TRADE_TYPE: TradeType.SELL,
+             Columns.QUANTITY: 0.5, Columns.PRICE_PER_SHARE: 260.0, Columns.TOTAL_AMOUNT: 130, Columns.FEE: 0},
+        ]
+    )
+    last = build_trade_ledger(df).iloc[-1]
+    assert last[Columns.POS_QTY_AFTER] == 1.0
+    assert round(last[Columns.REALIZED_CUM], 2) == 30.0
+    assert compute_realized_window(df)[Columns.REALIZED_WINDOW].tolist() == [30]
@@ -0,0 +1,64 @@
+import pandas as pd
+import pytest
+
+from core.constants import Columns, TradeType
+from core.portfolio import build_portfolio_value_timeseries, compute_twr
+from data_handler import db_manager
+from data_handler.materialize import get_current_portfolio_metrics, materialize_portfolio_metrics
+
+
+@pytest.fixture
+def db_path(db_path, stub_provider, make_trade):
+    db_manager.insert_cash_flows(
+        pd.DataFrame({"date": ["2024-01-02", "2024-03-01"], "type": ["Deposit", "Deposit"], "amount": [10000, 5000]}),
+        db_path=db_path,
+    )
+    db_manager.insert_transactions(pd.DataFrame([
+        make_trade("2024-01-04", "1111", TradeType.BUY, 100, 10.0),
+        make_trade("2024-02-01", "2222", TradeType.BUY, 10, 500.0),
+    ]), db_path=db_path)
+    return db_path
+
+
+def _expected(path):
+    tx = db_manager.get_transactions(db_path=path)
+    return build_portfolio_value_timeseries(tx, cash_flows_df=db_manager.get_daily_cash_flows(db_path=path))
+
+
+def test_materialize_matches_timeseries_and_appends_incrementally(db_path, make_trade):
+    assert materialize_portfolio_metrics(db_path) == 4
+    assert materialize_portfolio_metrics(db_path) == 0  # nothing changed
+
+    db_manager.insert_transactions(pd.DataFrame([
+        make_trade("2024-03-05", "1111", TradeType.SELL, 50, 14.0),
+        make_trade("2024-04-01", "2222", TradeType.BUY, 5, 520.0),
+    ]), db_path=db_path)
+    assert get_current_portfolio_metrics(db_path=db_path) is None  # stale until the job runs
+    assert materialize_portfolio_metrics(db_path) == 2  # only the new dates
+
+    metrics = get_current_portfolio_metrics(db_path=db_path)
+    expected = _expected(db_path)
+    assert metrics[Columns.DATE].tolist() == expected[Columns.DATE].tolist()
+    for col in (Columns.NET_VALUE, Columns.MARKET_VALUE, Columns.NET_DEPOSIT):
+        assert metrics[col].tolist() == pytest.approx(expected[col].tolist())
+    assert (metrics["cash"] == metrics[Columns.NET_VALUE] - metrics[Columns.MARKET_VALUE]).all()
+
+    # chained daily returns reproduce the TWR computed from scratch
+    tx = db_manager.get_transactions(db_path=db_path)
+    cf = db_manager.get_daily_cash_flows(db_path=db_path)
+    twr = compute_twr(tx, price_map={}, net_deposit=15000, cash_flows_df=cf)
+    assert ((1 + metrics["daily_return"].dropna()).prod() - 1) * 100 == pytest.approx(twr)
+    assert compute_twr(tx, price_map={}, net_deposit=15000, cash_flows_df=cf, asset_df=metrics) == pytest.approx(twr)
+
+
+def test_backdated_import_and_deletes_recompute_history(db_path, make_trade):
+    materialize_portfolio_metrics(db_path)
+    db_manager.insert_transactions(pd.DataFrame([make_trade("2024-01-03", "3333", TradeType.BUY, 1, 100.0)]), db_path=db_path)
+    assert materialize_portfolio_metrics(db_path) == 4  # frontier moved back to 2024-01-03
+    assert get_current_portfolio_metrics(db_path=db_path)[Columns.NET_VALUE].tolist() == pytest.approx(
+        _expected(db_path)[Columns.NET_VALUE].tolist()
+    )
+
+    db_manager.clear_cash_flows(db_path)
+    assert materialize_portfolio_metrics(db_path) == 3  # deletes force a rebuild
+    assert get_current_portfolio_metrics(db_path=db_path)[Columns.NET_DEPOSIT].tolist() == [0.0, 0.0, 0.0]
@@ -0,0 +1,79 @@
+import time
+
+import pandas as pd
+import pytest
+
+from core import splits
+from core.constants import Columns, PositionMode, TradeType
+from core.ledger import build_holdings_snapshot, holdings_from_positions
+from data_handler import db_manager
+from data_handler import positions as positions_module
+from data_handler.positions import get_positions_asof, refresh_daily_positions
+
+PRICES = {"1111": 12.0, "2222": 450.0}
+
+
+@pytest.fixture
+def db_path(db_path, stub_provider, make_trade):
+    db_manager.insert_transactions(pd.DataFrame([
+        make_trade("2024-01-04", "1111", TradeType.BUY, 100, 10.0),
+        make_trade("2024-02-01", "2222", TradeType.BUY, 10, 500.0),
+        make_trade("2024-03-01", "1111", TradeType.SELL, 40, 15.0),
+    ]), db_path=db_path, account_id="a")
+    db_manager.insert_transactions(pd.DataFrame([make_trade("2024-01-10", "1111", TradeType.BUY, 100, 20.0)]), db_path=db_path, account_id="b")
+    return db_path
+
+
+def _assert_matches_replay(path, end_date, accounts=None):
+    tx = db_manager.get_transactions(end=end_date, accounts=accounts, db_path=path)
+    expected = build_holdings_snapshot(tx, PRICES, positions_mode=PositionMode.ALL)
+    got = holdings_from_positions(get_positions_asof(end_date, accounts=accounts, db_path=path), PRICES, PositionMode.ALL)
+    cols = [Columns.STOCK_CODE, Columns.QTY, Columns.COST_TOTAL, Columns.REALIZED, Columns.MARKET_VALUE]
+    pd.testing.assert_frame_equal(
+        got[cols].sort_values(Columns.STOCK_CODE).reset_index(drop=True),
+        expected[cols].sort_values(Columns.STOCK_CODE).reset_index(drop=True),
+        check_dtype=False,
+    )
+
+
+def test_positions_answer_asof_holdings(db_path):
+    assert get_positions_asof(db_path=db_path) is None  # never refreshed
+    assert refresh_daily_positions(db_path) == 4
+    for end_date in ("2024-01-05", "2024-02-15", "2024-03-01", None):
+        _assert_matches_replay(db_path, end_date)
+    _assert_matches_replay(db_path, None, accounts=["b"])
+    assert get_positions_asof("2023-12-31", db_path=db_path).empty
+
+
+def test_refresh_is_incremental_and_follows_splits(db_path, stub_provider, make_trade, monkeypatch):
+    refresh_daily_positions(db_path)
+    db_manager.insert_transactions(pd.DataFrame([make_trade("2024-04-01", "1111", TradeType.SELL, 50, 16.0)]), db_path=db_path, account_id="b")
+    assert get_positions_asof(db_path=db_path) is None  # stale until refreshed
+    assert refresh_daily_positions(db_path) == 1  # only the new day of (b, 1111)
+    _assert_matches_replay(db_path, None)
+
+    stub_provider.splits["1111.T"] = pd.Series([2.0], index=pd.DatetimeIndex(["2024-02-15"]).tz_localize("UTC"))
+    splits.clear_split_cache()
+    assert refresh_daily_positions(db_path) == 0  # no new trades: splits wait for the periodic check
+    now = time.time()
+    monkeypatch.setattr(positions_module.time, "time", lambda: now + splits.SPLIT_CACHE_TTL_SEC)
+    assert refresh_daily_positions(db_path) == 4  # every partition of 1111 is rebuilt
+    positions = get_positions_asof("2024-02-01", accounts=["a"], db_path=db_path).set_index(Columns.STOCK_CODE)
+    assert positions.loc["1111", Columns.QTY] == 200
+    _assert_matches_replay(db_path, None)
+
+
+def test_split_outage_postpones_refresh(db_path, stub_provider, make_trade):
+    stub_provider.splits["1111.T"] = pd.Series([2.0], index=pd.DatetimeIndex(["2024-02-15"]).tz_localize("UTC"))
+    refresh_daily_positions(db_path)
+    splits.clear_split_cache()
+    stub_provider.splits_error = RuntimeError("provider down")
+    db_manager.insert_transactions(pd.DataFrame([make_trade("2024-04-01", "1111", TradeType.SELL, 50, 16.0)]), db_path=db_path, account_id="a")
+
+    # 1111 has to be recomputed but its splits are unknown: store nothing unadjusted
+    assert refresh_daily_positions(db_path) == 0
+    assert get_positions_asof(db_path=db_path) is None
+
+    stub_provider.splits_error = None
+    assert refresh_daily_positions(db_path) == 1
+    _assert_matches_replay(db_path, None)
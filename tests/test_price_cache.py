@@ -0,0 +1,140 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from core import prices
+from core.cache import TTLCache
+from core.providers import set_provider
+
+
+class CountingProvider:
+    name = "counting"
+
+    def __init__(self, price=100.0):
+        self.price = price
+        self.calls = []
+
+    def get_close_history(self, tickers, start=None, end=None, period=None):
+        self.calls.append(list(tickers))
+        if period == "max":
+            idx = pd.to_datetime(["2024-01-04", "2024-01-05", "2024-01-09"])
+            return pd.DataFrame({tk: [self.price, self.price + 1, self.price + 2] for tk in tickers}, index=idx)
+        idx = pd.DatetimeIndex([pd.Timestamp("2024-01-05")])
+        return pd.DataFrame({tk: [self.price] for tk in tickers}, index=idx)
+
+    def get_splits(self, ticker):
+        return pd.Series(dtype=float)
+
+
+@pytest.fixture
+def provider():
+    p = CountingProvider()
+    set_provider(p)
+    prices._PRICE_CACHE.clear()
+    prices._HIST_SERIES.clear()
+    yield p
+    set_provider(None)
+    prices._PRICE_CACHE.clear()
+    prices._HIST_SERIES.clear()
+
+
+def test_ttl_cache_lru_eviction_and_per_key_ttl():
+    cache = TTLCache(ttl_sec=10, maxsize=2)
+    cache.set("a", 1, now=0.0)
+    cache.set("b", 2)
+    cache.get_entry("a")
+    cache.set("c", 3)
+    assert "b" not in cache
+    assert cache.get("a") is None  # expired, but still retrievable as an entry
+    assert cache.get_entry("a").value == 1
+    assert cache.get("c") == 3
+
+
+def test_get_price_map_fetches_only_missing_codes(provider):
+    assert prices.get_price_map(["1111"]) == {"1111": 100.0}
+    assert prices.get_price_map(["1111", "2222"]) == {"1111": 100.0, "2222": 100.0}
+    assert provider.calls == [["1111.T"], ["2222.T"]]
+
+
+def test_get_price_map_serves_stale_and_revalidates(provider, monkeypatch):
+    prices._PRICE_CACHE.set("1111", 90.0, now=0.0)
+    provider.price = 101.0
+
+    started = []
+    orig = prices._refresh_in_background
+    monkeypatch.setattr(prices, "_refresh_in_background", lambda codes: started.append(orig(codes)))
+    assert prices.get_price_map(["1111"]) == {"1111": 90.0}
+    monkeypatch.undo()
+
+    started[0].join(timeout=5)
+    assert prices.get_price_map(["1111"]) == {"1111": 101.0}
+    assert provider.calls == [["1111.T"]]
+
+
+def test_concurrent_fetches_share_one_download(provider):
+    import threading
+    import time
+
+    gate = threading.Event()
+    orig = provider.get_close_history
+
+    def slow(tickers, **kwargs):
+        gate.wait(timeout=5)
+        return orig(tickers, **kwargs)
+
+    provider.get_close_history = slow
+    results = []
+    threads = [
+        threading.Thread(target=lambda c=codes: results.append(prices.get_price_map(c)))
+        for codes in (["1111", "2222"], ["2222"], ["1111", "2222", "3333"])
+    ]
+    for t in threads:
+        t.start()
+        time.sleep(0.05)
+    gate.set()
+    for t in threads:
+        t.join(timeout=5)
+
+    fetched = sorted(tk for call in provider.calls for tk in call)
+    assert fetched == ["1111.T", "2222.T", "3333.T"]
+    assert {"1111": 100.0, "2222": 100.0, "3333": 100.0} in results
+
+
+def test_price_map_asof_reuses_loaded_history(provider):
+    assert prices.get_price_map_asof(["1111"], "2024-01-05") == {"1111": 101.0}
+    # holiday / weekend falls back to the previous trading day
+    assert prices.get_price_map_asof(["1111"], "2024-01-08") == {"1111": 101.0}
+    assert prices.get_price_map_asof(["1111"], "2024-01-03") == {}
+    assert prices.get_price_map_asof(["1111"], "2024-01-09") == {"1111": 102.0}
+    assert provider.calls == [["1111.T"]]
+
+
+def test_price_matrix_aligns_and_memory_maps(provider, tmp_path):
+    npy = str(tmp_path / "prices.npy")
+    m = prices.get_price_matrix(["1111", "2222"], start="2024-01-05", end="2024-01-10", npy_path=npy)
+    assert m.codes == ["1111", "2222"]
+    assert m.dates.strftime("%Y-%m-%d").tolist() == ["2024-01-05", "2024-01-09"]
+    assert m.values.tolist() == [[101.0, 101.0], [102.0, 102.0]]
+
+    calls = len(provider.calls)
+    again = prices.get_price_matrix(["2222"], start="2024-01-04", end="2024-01-10", npy_path=npy)
+    assert len(provider.calls) == calls
+    assert again.values[:, 0].tolist() == [100.0, 101.0, 102.0]
+
+    same_cols = prices.get_price_matrix(["1111", "2222"], end="2024-01-10", npy_path=npy)
+    assert isinstance(same_cols.values, np.memmap)
+
+
+def test_price_matrix_keeps_other_universes(provider, tmp_path):
+    npy = str(tmp_path / "prices.npy")
+    prices.get_price_matrix(["1111"], end="2024-01-10", npy_path=npy)
+    added = prices.get_price_matrix(["2222"], start="2024-01-05", end="2024-01-10", npy_path=npy)
+    assert added.codes == ["2222"]
+    assert added.values[:, 0].tolist() == [101.0, 102.0]
+    assert prices.load_price_matrix(npy).codes == ["1111", "2222"]
+
+    # the first universe was not evicted by the second
+    calls = len(provider.calls)
+    again = prices.get_price_matrix(["1111"], end="2024-01-10", npy_path=npy)
+    assert len(provider.calls) == calls
+    assert again.values[:, 0].tolist() == [100.0, 101.0, 102.0]
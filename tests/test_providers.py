@@ -0,0 +1,70 @@
+import pandas as pd
+import pytest
+
+from core import prices, splits
+from core.providers import LocalFixtureProvider, make_provider, set_provider
+from core.splits import record_stock_split_adjustments
+from core.constants import Columns, TradeType
+
+
+@pytest.fixture
+def fixture_dir(tmp_path):
+    pd.DataFrame(
+        {
+            "date": ["2024-01-04", "2024-01-05", "2024-01-09"],
+            "close": [100.0, 110.0, 120.0],
+        }
+    ).to_csv(tmp_path / "1111.T.csv", index=False)
+    (tmp_path / "splits").mkdir()
+    pd.DataFrame({"date": ["2024-01-06"], "ratio": [2.0]}).to_csv(
+        tmp_path / "splits" / "1111.T.csv", index=False
+    )
+    return tmp_path
+
+
+@pytest.fixture
+def local_provider(fixture_dir):
+    provider = LocalFixtureProvider(str(fixture_dir))
+    set_provider(provider)
+    splits.clear_split_cache()
+    yield provider
+    set_provider(None)
+    splits.clear_split_cache()
+
+
+def test_local_provider_close_history(local_provider):
+    df = local_provider.get_close_history(["1111.T", "9999.T"], start="2024-01-05", end="2024-01-09")
+    assert df.index.tolist() == [pd.Timestamp("2024-01-05")]
+    assert df["1111.T"].tolist() == [110.0]
+    assert df["9999.T"].isna().all()
+
+    last_two = local_provider.get_close_history(["1111.T"], period="2d")
+    assert last_two["1111.T"].tolist() == [110.0, 120.0]
+
+
+def test_get_price_map_uses_active_provider(local_provider):
+    prices._PRICE_CACHE.clear()
+    prices._HIST_SERIES.clear()
+    assert prices.get_price_map(["1111"]) == {"1111": 120.0}
+    assert prices.get_price_map_asof(["1111"], "2024-01-05") == {"1111": 110.0}
+
+
+def test_split_adjustment_from_fixture(local_provider):
+    df = pd.DataFrame(
+        {
+            "id": [1],
+            Columns.DATE: ["2024-01-04"],
+            Columns.STOCK_CODE: ["1111"],
+            Columns.TRADE_TYPE: [TradeType.BUY],
+            Columns.QUANTITY: [100.0],
+            Columns.PRICE_PER_SHARE: [100.0],
+        }
+    )
+    out = record_stock_split_adjustments(df, "1111")
+    assert out[Columns.QUANTITY].tolist() == [200.0]
+    assert out[Columns.PRICE_PER_SHARE].tolist() == [50.0]
+
+
+def test_make_provider_unknown():
+    with pytest.raises(ValueError):
+        make_provider("nope")
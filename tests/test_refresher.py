@@ -0,0 +1,41 @@
+import pandas as pd
+
+from core import prices
+from core.refresher import PriceRefresher, is_tse_trading_time, seconds_until_next_session
+from core.providers import set_provider
+
+
+class FixedProvider:
+    name = "fixed"
+
+    def get_close_history(self, tickers, start=None, end=None, period=None):
+        idx = pd.DatetimeIndex([pd.Timestamp("2024-01-05")])
+        return pd.DataFrame({tk: [200.0] for tk in tickers}, index=idx)
+
+    def get_splits(self, ticker):
+        return pd.Series(dtype=float)
+
+
+def test_tse_trading_hours():
+    assert is_tse_trading_time(pd.Timestamp("2024-01-05 10:00"))  # Friday morning
+    assert not is_tse_trading_time(pd.Timestamp("2024-01-05 12:00"))  # lunch break
+    assert not is_tse_trading_time(pd.Timestamp("2024-01-06 10:00"))  # Saturday
+    # Friday after close -> Monday 09:00
+    assert seconds_until_next_session(pd.Timestamp("2024-01-05 16:00")) == (2 * 24 + 17) * 3600
+
+
+def test_refresh_once_warms_cache_and_reports_status():
+    set_provider(FixedProvider())
+    prices._PRICE_CACHE.clear()
+    try:
+        refresher = PriceRefresher(lambda: ["1111"], interval_sec=60)
+        assert refresher.refresh_once()
+        assert prices._PRICE_CACHE.get("1111") == 200.0
+        assert refresher.status()["last_success"] is not None
+
+        failing = PriceRefresher(lambda: (_ for _ in ()).throw(RuntimeError("db down")))
+        assert not failing.refresh_once()
+        assert failing.status()["last_error"] == "db down"
+    finally:
+        set_provider(None)
+        prices._PRICE_CACHE.clear()
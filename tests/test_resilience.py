@@ -0,0 +1,81 @@
+import time
+
+import pandas as pd
+import pytest
+
+from core.prices import fill_missing_prices
+from core.resilience import (
+    CallTimeoutError,
+    CircuitBreaker,
+    CircuitOpenError,
+    call_resilient,
+)
+from core.constants import Columns, TradeType
+
+
+def test_retries_transient_failure():
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) < 2:
+            raise ConnectionError("reset")
+        return "ok"
+
+    assert call_resilient(flaky, retries=2, backoff_sec=0.0, timeout_sec=None) == "ok"
+    assert len(calls) == 2
+
+
+def test_timeout_and_breaker_fail_fast():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout_sec=60)
+
+    # retries inside one call count as a single failure
+    with pytest.raises(CallTimeoutError):
+        call_resilient(time.sleep, 1.0, breaker=breaker, timeout_sec=0.05, retries=1, backoff_sec=0.0)
+    assert (breaker.state, breaker.failures) == (CircuitBreaker.CLOSED, 1)
+    with pytest.raises(CallTimeoutError):
+        call_resilient(time.sleep, 1.0, breaker=breaker, timeout_sec=0.05, retries=1, backoff_sec=0.0)
+    assert breaker.state == CircuitBreaker.OPEN
+
+    started = time.time()
+    with pytest.raises(CircuitOpenError):
+        call_resilient(lambda: "never", breaker=breaker, timeout_sec=None)
+    assert time.time() - started < 0.05
+
+
+def test_breaker_half_open_recovers():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout_sec=0.0)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_fill_missing_prices_uses_last_trade_price(stub_provider):
+    tx = pd.DataFrame(
+        {
+            "id": [1, 2, 3],
+            Columns.DATE: ["2024-01-01", "2024-02-01", "2024-03-01"],
+            Columns.STOCK_CODE: ["1111", "1111", "2222"],
+            Columns.TRADE_TYPE: [TradeType.BUY, TradeType.BUY, TradeType.BUY],
+            Columns.PRICE_PER_SHARE: [100.0, 110.0, 50.0],
+        }
+    )
+    out = fill_missing_prices({"2222": 55.0}, tx)
+    assert out == {"1111": 110.0, "2222": 55.0}
+    assert fill_missing_prices({}, tx, as_of_date="2024-01-15") == {"1111": 100.0}
+
+
+def test_fill_missing_prices_adjusts_for_later_splits(stub_provider):
+    stub_provider.splits["1111.T"] = pd.Series([2.0], index=pd.DatetimeIndex(["2024-01-20"]).tz_localize("UTC"))
+    tx = pd.DataFrame(
+        {
+            Columns.DATE: ["2024-01-01", "2024-02-01"],
+            Columns.STOCK_CODE: ["1111", "1111"],
+            Columns.TRADE_TYPE: [TradeType.BUY, TradeType.BUY],
+            Columns.PRICE_PER_SHARE: [100.0, 60.0],
+        }
+    )
+    # held quantities are doubled for the pre-split trade, so its price is halved
+    assert fill_missing_prices({}, tx, as_of_date="2024-01-15") == {"1111": 50.0}
+    assert fill_missing_prices({}, tx) == {"1111": 60.0}
@@ -0,0 +1,65 @@
+import pandas as pd
+import pytest
+
+from core import splits
+from core.constants import Columns, TradeType
+from data_handler import db_manager
+from data_handler.connection import close_connections
+from data_handler.snapshot import (
+    export_snapshot,
+    import_snapshot,
+    load_current_snapshot,
+    prime_split_cache,
+)
+
+
+@pytest.fixture
+def db_path(db_path, stub_provider):
+    stub_provider.splits["1111.T"] = pd.Series([2.0], index=pd.DatetimeIndex(["2024-01-20"]).tz_localize("UTC"))
+    tx = pd.DataFrame(
+        {
+            Columns.DATE: pd.to_datetime(["2024-01-04", "2024-02-01"]),
+            Columns.STOCK_CODE: ["1111", "1111"],
+            Columns.STOCK_NAME: ["A", "A"],
+            Columns.TRADE_TYPE: [TradeType.BUY, TradeType.SELL],
+            Columns.QUANTITY: [100, 50],
+            Columns.PRICE_PER_SHARE: [10.0, 6.0],
+            Columns.TOTAL_AMOUNT: [1000, 300],
+            Columns.SETTLEMENT_DATE: pd.to_datetime(["2024-01-08", "2024-02-05"]),
+            Columns.FEE: [0, 0],
+        }
+    )
+    db_manager.insert_transactions(tx, db_path=db_path)
+    db_manager.insert_cash_flows(pd.DataFrame({"date": ["2024-01-02"], "type": ["Deposit"], "amount": [5000]}), db_path=db_path)
+    return db_path
+
+
+def test_snapshot_roundtrip_and_staleness(db_path, stub_provider, tmp_path):
+    root = str(tmp_path / "snapshots")
+    export_snapshot(db_path, root=root)
+
+    snap = load_current_snapshot(db_path, root=root)
+    assert snap is not None
+    assert snap["splits"]["ratio"].tolist() == [2.0]
+    assert snap["transactions_adjusted"][Columns.QUANTITY].tolist() == [200.0, 50.0]
+    assert snap["ledgers"][Columns.QTY].tolist() == [200.0, 150.0]
+
+    # primed splits are served without asking the (now failing) provider
+    splits.clear_split_cache()
+    stub_provider.splits_error = RuntimeError("provider down")
+    prime_split_cache(snap)
+    assert splits.get_stock_splits("1111").tolist() == [2.0]
+
+    db_manager.insert_cash_flows(pd.DataFrame({"date": ["2024-03-01"], "type": ["Deposit"], "amount": [1]}), db_path=db_path)
+    assert load_current_snapshot(db_path, root=root) is None
+
+
+def test_import_snapshot_into_fresh_db(db_path, tmp_path):
+    path = export_snapshot(db_path, root=str(tmp_path / "snapshots"))
+    fresh = str(tmp_path / "fresh.db")
+    db_manager.init_db(fresh)
+
+    tx_result, cf_result = import_snapshot(path, db_path=fresh)
+    assert (tx_result.inserted, cf_result.inserted) == (2, 1)
+    assert db_manager.get_transactions(db_path=fresh)[Columns.TOTAL_AMOUNT].tolist() == [1000, 300]
+    close_connections(fresh)
@@ -110,16 +110,19 @@ def fig_asset_growth(
             ))
 
         if benchmark_df is not None and not benchmark_df.empty:
-            label = "Benchmark"
-            if "label" in benchmark_df.columns and len(benchmark_df["label"].unique()) > 0:
-                label = str(benchmark_df["label"].iloc[0])
-            fig.add_trace(go.Scatter(
-                x=pd.to_datetime(benchmark_df[Columns.DATE]),
-                y=benchmark_df["benchmark_return_pct"],
-                mode="lines",
-                name=label,
-                hovertemplate="%{x|%Y-%m-%d}<br>Return: %{y:.2f}%<extra></extra>",
-            ))
+            groups = (
+                benchmark_df.groupby("label", sort=False)
+                if "label" in benchmark_df.columns
+                else [("Benchmark", benchmark_df)]
+            )
+            for label, g in groups:
+                fig.add_trace(go.Scatter(
+                    x=pd.to_datetime(g[Columns.DATE]),
+                    y=g["benchmark_return_pct"],
+                    mode="lines",
+                    name=str(label),
+                    hovertemplate="%{x|%Y-%m-%d}<br>Return: %{y:.2f}%<extra></extra>",
+                ))
         if twr_pct is not None:
             fig.add_hline(
                 y=float(twr_pct),